@@ -0,0 +1,94 @@
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional, Sequence
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables.schema import StreamEvent
+from redis.asyncio import ConnectionPool
+
+from rezai.metrics import metrics
+from rezai.services.redis.cache import RedisCache
+from rezai.settings import settings
+
+answer_cache_saved = metrics.histogram(
+    "agent_answer_cache_saved_seconds",
+    "Agent run time saved by answers served from the answer cache.",
+)
+
+
+class AnswerCache:
+    """
+    Cache of final answers to the first message of a thread.
+
+    Entries are keyed on the normalized user message, which includes the
+    location the user gave. Threads that already have history are never
+    answered from the cache, since the answer may depend on it.
+
+    :param redis_pool: redis connection pool.
+    """
+
+    def __init__(self, redis_pool: ConnectionPool) -> None:
+        self.cache = RedisCache(
+            redis_pool,
+            "agent_answers",
+            ttl=settings.agent_answer_cache_ttl,
+        )
+
+    def key_parts(self, message: str) -> Sequence[str]:
+        """
+        Cache key of the first message of a thread.
+
+        Callers check that the thread has no history first.
+
+        :param message: user message of the run.
+        :return: key parts.
+        """
+        return (message,)
+
+    async def get(self, key_parts: Sequence[str]) -> Optional[Dict[str, Any]]:
+        """
+        Cached answer of a first message.
+
+        :param key_parts: cache key parts.
+        :return: entry with the answer and the run time it took.
+        """
+        entry = await self.cache.get(key_parts)
+        if entry is not None:
+            answer_cache_saved.observe(entry["duration"])
+        return entry
+
+    async def set(  # noqa: WPS125
+        self,
+        key_parts: Sequence[str],
+        answer: str,
+        duration: float,
+    ) -> None:
+        """
+        Store the answer of a completed run.
+
+        :param key_parts: cache key parts.
+        :param answer: final assistant message.
+        :param duration: run time in seconds.
+        """
+        await self.cache.set(key_parts, {"answer": answer, "duration": duration})
+
+
+async def replay_events(answer: str, source: str) -> AsyncIterator[StreamEvent]:
+    """
+    Replay an answer produced without the agent as the model events of a run.
+
+    :param answer: answer text.
+    :param source: what produced the answer, used as the run name.
+    :yield: model stream and end events.
+    """
+    run_id = str(uuid.uuid4())
+    base = {"name": source, "run_id": run_id, "tags": [], "metadata": {}}
+    yield {
+        **base,
+        "event": "on_chat_model_stream",
+        "data": {"chunk": AIMessageChunk(content=answer)},
+    }  # type: ignore
+    yield {
+        **base,
+        "event": "on_chat_model_end",
+        "data": {"output": AIMessage(content=answer)},
+    }  # type: ignore
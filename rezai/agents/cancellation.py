@@ -0,0 +1,105 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from typing import Any, AsyncIterator, Set
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.graph import CompiledGraph
+from loguru import logger
+
+CANCELLED_TOOL_RESULT = "[Cancelled: the user left before this call finished.]"
+CANCELLED_ANSWER = "[The answer was interrupted because the user left.]"
+
+# Repairs of cancelled turns still running, kept so they are not collected.
+_settling: Set["asyncio.Task[None]"] = set()
+
+
+@asynccontextmanager
+async def aclosing(stream: Any) -> AsyncIterator[Any]:
+    """
+    Close an async generator when the block exits, like contextlib.aclosing.
+
+    Breaking out of ``async for`` leaves the generator suspended, along with
+    the agent run it drives, until it is garbage collected.
+
+    :param stream: async iterator, closed if it has ``aclose``.
+    :yield: the stream.
+    """
+    try:
+        yield stream
+    finally:
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+
+
+async def settle_cancelled_turn(graph: CompiledGraph, config: RunnableConfig) -> None:
+    """
+    Leave the thread of a cancelled turn ready for the next message.
+
+    A turn cancelled during tool calls leaves tool calls without results in
+    the last checkpoint, which the model API rejects on the next turn, and one
+    cancelled during a model call leaves the user message unanswered. Both are
+    completed with placeholder messages.
+
+    :param graph: agent graph.
+    :param config: run config of the turn.
+    """
+    state = await graph.aget_state(config)
+    messages = state.values.get("messages") or []
+    if not messages:
+        return
+    last_request = next(
+        (
+            message
+            for message in reversed(messages)
+            if isinstance(message, (AIMessage, HumanMessage))
+        ),
+        None,
+    )
+    if isinstance(last_request, AIMessage) and last_request.tool_calls:
+        answered = {
+            message.tool_call_id
+            for message in messages
+            if isinstance(message, ToolMessage)
+        }
+        results = [
+            ToolMessage(
+                content=CANCELLED_TOOL_RESULT,
+                tool_call_id=tool_call["id"],
+                name=tool_call["name"],
+            )
+            for tool_call in last_request.tool_calls
+            if tool_call["id"] not in answered
+        ]
+        if results:
+            await graph.aupdate_state(config, {"messages": results}, as_node="tools")
+    elif not isinstance(last_request, HumanMessage):
+        return
+    await graph.aupdate_state(
+        config,
+        {"messages": [AIMessage(content=CANCELLED_ANSWER)]},
+        as_node="agent",
+    )
+
+
+async def settle_in_background(graph: CompiledGraph, config: RunnableConfig) -> None:
+    """
+    Settle a cancelled turn in a task of its own.
+
+    The task finishes even if the caller is cancelled again while waiting.
+
+    :param graph: agent graph.
+    :param config: run config of the turn.
+    """
+    task = asyncio.ensure_future(_settle(graph, config))
+    _settling.add(task)
+    task.add_done_callback(_settling.discard)
+    with suppress(asyncio.CancelledError):
+        await asyncio.shield(task)
+
+
+async def _settle(graph: CompiledGraph, config: RunnableConfig) -> None:
+    try:
+        await settle_cancelled_turn(graph, config)
+    except Exception:
+        logger.exception("Failed to settle the cancelled turn of {}", config)
@@ -0,0 +1,280 @@
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from redis.asyncio import ConnectionPool, Redis
+
+from rezai.services.redis.cache import cache_requests
+from rezai.settings import settings
+
+# Threads ordered by last use, used for LRU eviction.
+THREADS_KEY = "checkpoint_threads"
+# Separates checkpoint id and task id in the writes hash fields.
+WRITES_SEPARATOR = "\x1f"
+
+
+def _thread_config(thread_id: str, thread_ts: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": thread_id, "thread_ts": thread_ts}}
+
+
+class RedisCheckpointSaver(BaseCheckpointSaver):
+    """
+    Conversation checkpoints shared by all workers through redis.
+
+    Each thread keeps its latest ``checkpoint_max_per_thread`` checkpoints
+    in a redis hash, compressed with zlib. Threads expire after
+    ``checkpoint_ttl`` seconds without use, and once there are more than
+    ``checkpoint_max_threads`` threads the least recently used are evicted.
+    Recently used checkpoints are also kept in a small in-process cache,
+    so a conversation turn only reads the checkpoint ids and pending
+    writes from redis.
+
+    :param redis_pool: redis connection pool.
+    """
+
+    def __init__(self, redis_pool: ConnectionPool) -> None:
+        super().__init__()
+        self.redis_pool = redis_pool
+        self._local: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """
+        Get a checkpoint of a thread.
+
+        :param config: config with thread_id and optionally thread_ts.
+        :return: checkpoint tuple or None if the thread has none.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hkeys(self._checkpoints_key(thread_id))
+                pipe.hgetall(self._writes_key(thread_id))
+                pipe.zadd(THREADS_KEY, {thread_id: time.time()}, xx=True)
+                raw_ids, raw_writes, _ = await pipe.execute()
+            checkpoint_ids = sorted(raw_id.decode() for raw_id in raw_ids)
+            thread_ts = config["configurable"].get("thread_ts")
+            if thread_ts is None and checkpoint_ids:
+                thread_ts = checkpoint_ids[-1]
+            if thread_ts is None or thread_ts not in checkpoint_ids:
+                return None
+            blob = self._local_get(thread_id, thread_ts)
+            if blob is None:
+                blob = await redis.hget(self._checkpoints_key(thread_id), thread_ts)
+                if blob is None:
+                    return None
+                self._local_put(thread_id, thread_ts, blob)
+        saved = self._load(blob)
+        position = checkpoint_ids.index(thread_ts)
+        return CheckpointTuple(
+            config=_thread_config(thread_id, thread_ts),
+            checkpoint=saved["checkpoint"],
+            metadata=saved["metadata"],
+            parent_config=(
+                _thread_config(thread_id, checkpoint_ids[position - 1])
+                if position > 0
+                else None
+            ),
+            pending_writes=self._pending_writes(raw_writes, thread_ts),
+        )
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,  # noqa: WPS125
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """
+        List checkpoints, newest first.
+
+        :param config: config with thread_id, or None for all threads.
+        :param filter: metadata values the checkpoints must match.
+        :param before: only list checkpoints older than this one.
+        :param limit: maximum number of checkpoints.
+        :yield: checkpoint tuples.
+        """
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            if config is not None:
+                thread_ids = [config["configurable"]["thread_id"]]
+            else:
+                thread_ids = [
+                    raw_id.decode() for raw_id in await redis.zrange(THREADS_KEY, 0, -1)
+                ]
+            for thread_id in thread_ids:
+                checkpoints = await redis.hgetall(self._checkpoints_key(thread_id))
+                for raw_ts in sorted(checkpoints, reverse=True):
+                    thread_ts = raw_ts.decode()
+                    if before and thread_ts >= before["configurable"]["thread_ts"]:
+                        continue
+                    saved = self._load(checkpoints[raw_ts])
+                    if filter and any(
+                        saved["metadata"].get(query_key) != query_value
+                        for query_key, query_value in filter.items()
+                    ):
+                        continue
+                    if limit is not None:
+                        if limit <= 0:
+                            return
+                        limit -= 1
+                    yield CheckpointTuple(
+                        config=_thread_config(thread_id, thread_ts),
+                        checkpoint=saved["checkpoint"],
+                        metadata=saved["metadata"],
+                    )
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+    ) -> RunnableConfig:
+        """
+        Save a checkpoint and trim the thread.
+
+        :param config: config with thread_id.
+        :param checkpoint: checkpoint to save.
+        :param metadata: checkpoint metadata.
+        :return: config pointing to the saved checkpoint.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        thread_ts = checkpoint["id"]
+        blob = self._dump({"checkpoint": checkpoint, "metadata": metadata})
+        now = time.time()
+        checkpoints_key = self._checkpoints_key(thread_id)
+        writes_key = self._writes_key(thread_id)
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hset(checkpoints_key, thread_ts, blob)
+                pipe.hkeys(checkpoints_key)
+                pipe.hkeys(writes_key)
+                pipe.zadd(THREADS_KEY, {thread_id: now})
+                # Threads unused for the whole ttl have expired already.
+                pipe.zremrangebyscore(THREADS_KEY, 0, now - settings.checkpoint_ttl)
+                pipe.zcard(THREADS_KEY)
+                results = await pipe.execute()
+            _, raw_ids, raw_write_fields, _, _, threads_count = results
+            expired_ids = sorted(raw_id.decode() for raw_id in raw_ids)[
+                : -settings.checkpoint_max_per_thread
+            ]
+            async with redis.pipeline(transaction=False) as pipe:
+                if expired_ids:
+                    pipe.hdel(checkpoints_key, *expired_ids)
+                    expired_writes = self._write_fields(raw_write_fields, expired_ids)
+                    if expired_writes:
+                        pipe.hdel(writes_key, *expired_writes)
+                pipe.expire(checkpoints_key, settings.checkpoint_ttl)
+                pipe.expire(writes_key, settings.checkpoint_ttl)
+                await pipe.execute()
+            if threads_count > settings.checkpoint_max_threads:
+                await self._evict(
+                    redis,
+                    threads_count - settings.checkpoint_max_threads,
+                )
+        for expired_id in expired_ids:
+            self._local.pop((thread_id, expired_id), None)
+        self._local_put(thread_id, thread_ts, blob)
+        return _thread_config(thread_id, thread_ts)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: List[Tuple[str, Any]],
+        task_id: str,
+    ) -> None:
+        """
+        Save pending writes of a task.
+
+        :param config: config pointing to the checkpoint.
+        :param writes: channel and value pairs.
+        :param task_id: id of the task that made the writes.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        thread_ts = config["configurable"]["thread_ts"]
+        writes_key = self._writes_key(thread_id)
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hset(
+                    writes_key,
+                    f"{thread_ts}{WRITES_SEPARATOR}{task_id}",
+                    self._dump(writes),
+                )
+                pipe.expire(writes_key, settings.checkpoint_ttl)
+                await pipe.execute()
+
+    async def _evict(self, redis: Redis, count: int) -> None:
+        evicted = await redis.zpopmin(THREADS_KEY, count)
+        thread_ids = [raw_id.decode() for raw_id, _ in evicted]
+        if not thread_ids:
+            return
+        await redis.delete(
+            *[self._checkpoints_key(thread_id) for thread_id in thread_ids],
+            *[self._writes_key(thread_id) for thread_id in thread_ids],
+        )
+        for thread_id, thread_ts in list(self._local):
+            if thread_id in thread_ids:
+                self._local.pop((thread_id, thread_ts), None)
+
+    def _pending_writes(
+        self,
+        raw_writes: Dict[bytes, bytes],
+        thread_ts: str,
+    ) -> List[Tuple[str, str, Any]]:
+        pending_writes = []
+        prefix = f"{thread_ts}{WRITES_SEPARATOR}"
+        for raw_field, blob in raw_writes.items():
+            field = raw_field.decode()
+            if not field.startswith(prefix):
+                continue
+            task_id = field[len(prefix) :]
+            for channel, channel_value in self._load(blob):
+                pending_writes.append((task_id, channel, channel_value))
+        return pending_writes
+
+    def _write_fields(
+        self,
+        raw_fields: Sequence[bytes],
+        checkpoint_ids: Sequence[str],
+    ) -> List[str]:
+        prefixes = tuple(
+            f"{checkpoint_id}{WRITES_SEPARATOR}" for checkpoint_id in checkpoint_ids
+        )
+        fields = (raw_field.decode() for raw_field in raw_fields)
+        return [field for field in fields if field.startswith(prefixes)]
+
+    def _local_get(self, thread_id: str, thread_ts: str) -> Optional[bytes]:
+        blob = self._local.get((thread_id, thread_ts))
+        if blob is None:
+            cache_requests.inc(cache="checkpoint_local", result="miss")
+            return None
+        cache_requests.inc(cache="checkpoint_local", result="hit")
+        self._local.move_to_end((thread_id, thread_ts))
+        return blob
+
+    def _local_put(self, thread_id: str, thread_ts: str, blob: bytes) -> None:
+        self._local[(thread_id, thread_ts)] = blob
+        self._local.move_to_end((thread_id, thread_ts))
+        while len(self._local) > settings.checkpoint_local_cache_size:
+            self._local.popitem(last=False)
+
+    def _dump(self, obj: Any) -> bytes:
+        return zlib.compress(self.serde.dumps(obj), settings.checkpoint_compression)
+
+    def _load(self, blob: bytes) -> Any:
+        return self.serde.loads(zlib.decompress(blob))
+
+    @staticmethod
+    def _checkpoints_key(thread_id: str) -> str:
+        return f"checkpoint:{thread_id}"
+
+    @staticmethod
+    def _writes_key(thread_id: str) -> str:
+        return f"checkpoint_writes:{thread_id}"
@@ -0,0 +1,66 @@
+import asyncio
+import functools
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+from loguru import logger
+
+from rezai.metrics import metrics
+from rezai.settings import settings
+
+tool_duration = metrics.histogram(
+    "agent_tool_duration_seconds",
+    "Agent tool call duration, per tool and outcome.",
+)
+
+ToolFunc = TypeVar("ToolFunc", bound=Callable[..., Awaitable[Any]])
+
+
+def tool_timeout(tool_name: str) -> float:
+    """
+    Deadline of a tool call.
+
+    :param tool_name: name of the tool.
+    :return: timeout in seconds.
+    """
+    return settings.agent_tool_timeouts.get(
+        tool_name,
+        settings.agent_tool_default_timeout,
+    )
+
+
+def with_deadline(func: ToolFunc) -> ToolFunc:
+    """
+    Run an async tool under its own deadline and record its duration.
+
+    Apply below ``@tool``. When the deadline passes the call is cancelled
+    and the model is told the tool timed out, so other tool calls of the
+    same step and the rest of the turn carry on.
+
+    :param func: async tool function.
+    :return: wrapped tool function.
+    """
+    tool_name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:  # noqa: WPS430
+        timeout = tool_timeout(tool_name)
+        started = time.monotonic()
+        outcome = "ok"
+        try:
+            return await asyncio.wait_for(func(*args, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            logger.warning("Tool {} timed out after {}s", tool_name, timeout)
+            return f"{tool_name} timed out after {timeout:g} seconds, try again later."
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            tool_duration.observe(
+                time.monotonic() - started,
+                tool=tool_name,
+                outcome=outcome,
+            )
+
+    return wrapper  # type: ignore
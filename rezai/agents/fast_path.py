@@ -0,0 +1,213 @@
+import re
+from typing import List, NamedTuple, Optional
+
+from rezai.db.dao.restaurant_dao import RestaurantDAO
+from rezai.db.models.restaurant_model import Restaurant
+from rezai.metrics import metrics
+from rezai.settings import settings
+
+fast_path_routes = metrics.counter(
+    "agent_fast_path_routes_total",
+    "Chat turns split by route: answered by the database fast path or the agent.",
+)
+
+CUISINES = frozenset(
+    (
+        "american",
+        "barbecue",
+        "bbq",
+        "brazilian",
+        "burgers",
+        "chinese",
+        "ethiopian",
+        "french",
+        "greek",
+        "indian",
+        "italian",
+        "japanese",
+        "korean",
+        "lebanese",
+        "mediterranean",
+        "mexican",
+        "pizza",
+        "ramen",
+        "seafood",
+        "spanish",
+        "steakhouse",
+        "sushi",
+        "tacos",
+        "thai",
+        "turkish",
+        "vegan",
+        "vegetarian",
+        "vietnamese",
+    ),
+)
+# Words that carry no meaning beyond the recognized slots.
+# A message with any other word goes to the agent.
+FILLER_WORDS = frozenset(
+    (
+        "a",
+        "all",
+        "any",
+        "are",
+        "at",
+        "best",
+        "better",
+        "can",
+        "collection",
+        "database",
+        "do",
+        "find",
+        "from",
+        "give",
+        "good",
+        "have",
+        "higher",
+        "i",
+        "in",
+        "is",
+        "least",
+        "list",
+        "me",
+        "more",
+        "my",
+        "of",
+        "on",
+        "or",
+        "our",
+        "over",
+        "places",
+        "please",
+        "rated",
+        "rating",
+        "restaurant",
+        "restaurants",
+        "saved",
+        "see",
+        "show",
+        "some",
+        "spots",
+        "star",
+        "stars",
+        "that",
+        "the",
+        "there",
+        "top",
+        "we",
+        "what",
+        "which",
+        "with",
+        "you",
+    ),
+)
+# The fast path only answers questions about our own restaurant list,
+# named as such: "the restaurants" alone may mean any restaurants.
+DATABASE_SCOPE = re.compile(
+    r"\b(?:our|my)\s+(?:saved\s+)?(?:list|database|collection|restaurants)\b"
+    r"|\bthe\s+(?:saved\s+)?(?:list|database|collection)\b"
+    r"|\bsaved\s+(?:restaurants|places)\b",
+)
+MIN_RATING = re.compile(
+    r"(?<![\d.])([0-5](?:\.\d)?)\s*(?:\+|stars?\b|or\s+(?:more|higher|better)\b)",
+)
+TOP = re.compile(r"\btop\s+(\d{1,2})\b")
+WORD = re.compile(r"[a-z]+|\d+(?:\.\d+)?\+?")
+
+
+class DatabaseQuery(NamedTuple):
+    """Restaurant lookup extracted from a chat message."""
+
+    cuisine: Optional[str] = None
+    min_rating: Optional[float] = None
+    limit: Optional[int] = None
+
+
+def parse_database_query(message: str) -> Optional[DatabaseQuery]:
+    """
+    Extract a restaurant database lookup from a chat message.
+
+    Rule based: the message has to be about our restaurant list, and every
+    word has to be either a recognized slot or filler. Anything else is
+    left to the agent.
+
+    :param message: user message.
+    :return: lookup, or None when unsure.
+    """
+    text = " ".join(message.lower().split())
+    if not DATABASE_SCOPE.search(text):
+        return None
+    min_rating = None
+    rating_match = MIN_RATING.search(text)
+    if rating_match:
+        min_rating = float(rating_match.group(1))
+        text = text[: rating_match.start()] + text[rating_match.end() :]
+    limit = None
+    top_match = TOP.search(text)
+    if top_match:
+        limit = int(top_match.group(1))
+        text = text[: top_match.start()] + text[top_match.end() :]
+    cuisine = None
+    for word in WORD.findall(text):
+        if word in FILLER_WORDS:
+            continue
+        if word in CUISINES and cuisine is None:
+            cuisine = word
+            continue
+        return None
+    return DatabaseQuery(cuisine=cuisine, min_rating=min_rating, limit=limit)
+
+
+def format_restaurants(query: DatabaseQuery, restaurants: List[Restaurant]) -> str:
+    """
+    Reply listing the restaurants found for a lookup.
+
+    :param query: lookup that was run.
+    :param restaurants: matching restaurants, best rated first.
+    :return: reply text.
+    """
+    description = "restaurants"
+    if query.cuisine:
+        description = f"{query.cuisine.capitalize()} restaurants"
+    if query.min_rating is not None:
+        description = f"{description} rated {query.min_rating:g}+"
+    if not restaurants:
+        return f"I couldn't find any {description} in our list."
+    lines = [f"Here are {len(restaurants)} {description} from our list:"]
+    for position, restaurant in enumerate(restaurants, start=1):
+        details = [
+            f"rating {restaurant.rating}" if restaurant.rating is not None else "",
+            f"{restaurant.reviews} reviews" if restaurant.reviews else "",
+        ]
+        line = f"{position}. {restaurant.title}"
+        if restaurant.address:
+            line = f"{line}, {restaurant.address}"
+        extra = ", ".join(detail for detail in details if detail)
+        if extra:
+            line = f"{line} ({extra})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+async def answer_from_database(
+    message: str,
+    restaurant_dao: RestaurantDAO,
+) -> Optional[str]:
+    """
+    Answer a restaurant list lookup without the agent.
+
+    :param message: user message.
+    :param restaurant_dao: restaurant DAO of the request.
+    :return: reply, or None if the message needs the agent.
+    """
+    query = parse_database_query(message)
+    if query is None:
+        fast_path_routes.inc(route="agent")
+        return None
+    fast_path_routes.inc(route="fast_path")
+    restaurants = await restaurant_dao.filter(
+        cuisine=query.cuisine,
+        min_rating=query.min_rating,
+        limit=query.limit or settings.agent_fast_path_max_results,
+    )
+    return format_restaurants(query, restaurants)
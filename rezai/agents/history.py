@@ -0,0 +1,140 @@
+from typing import Callable, List, Sequence
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+from rezai.agents.llm import estimate_tokens
+from rezai.settings import settings
+
+STALE_TOOL_RESULT = (
+    "[Result from an earlier turn omitted. Call the tool again if needed.]"
+)
+
+
+def split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """
+    Split a thread into turns, each starting with a user message.
+
+    Tool calls and their results always stay in the same turn.
+
+    :param messages: thread history.
+    :return: list of turns.
+    """
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        text = message.content
+    else:
+        text = " ".join(
+            block.get("text", "")
+            for block in message.content
+            if isinstance(block, dict)
+        )
+    text = " ".join(text.split())
+    limit = settings.agent_summary_line_chars
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "…"
+
+
+def summarize_turn(turn: Sequence[BaseMessage]) -> List[str]:
+    """
+    Extractive summary of one turn.
+
+    Keeps the user request, the tools that were used and the final answer.
+
+    :param turn: messages of the turn.
+    :return: summary lines.
+    """
+    lines = []
+    tool_names = []
+    answer = ""
+    for message in turn:
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {_text(message)}")
+        elif isinstance(message, AIMessage):
+            tool_names.extend(tool_call["name"] for tool_call in message.tool_calls)
+            if not message.tool_calls and message.content:
+                answer = _text(message)
+    if tool_names:
+        lines.append(f"Tools used: {', '.join(dict.fromkeys(tool_names))}")
+    if answer:
+        lines.append(f"Assistant: {answer}")
+    return lines
+
+
+def _stub_tool_results(turn: Sequence[BaseMessage]) -> List[BaseMessage]:
+    return [
+        message.copy(update={"content": STALE_TOOL_RESULT})
+        if isinstance(message, ToolMessage)
+        else message
+        for message in turn
+    ]
+
+
+def bound_history(
+    system_prompt: str,
+    messages: Sequence[BaseMessage],
+) -> List[BaseMessage]:
+    """
+    Build the prompt for the next model call from the thread history.
+
+    The last ``agent_history_turns`` turns are kept verbatim, except tool
+    results of past turns, which are stubbed. Older turns, and verbatim
+    turns that do not fit into ``agent_context_max_tokens``, are folded
+    into a summary appended to the system prompt. The current turn is
+    always kept whole.
+
+    :param system_prompt: agent system prompt.
+    :param messages: thread history.
+    :return: messages to send to the model.
+    """
+    turns = split_turns(messages)
+    recent = turns[-max(settings.agent_history_turns, 1) :]
+    older = turns[: len(turns) - len(recent)]
+    recent = [_stub_tool_results(turn) for turn in recent[:-1]] + recent[-1:]
+    while len(recent) > 1:
+        kept = [message for turn in recent for message in turn]
+        if estimate_tokens(kept) <= settings.agent_context_max_tokens:
+            break
+        older.append(recent.pop(0))
+    summary = [line for turn in older for line in summarize_turn(turn)]
+    if summary:
+        system_prompt = (
+            f"{system_prompt}\n\nSummary of the earlier conversation:\n"
+            + "\n".join(summary)
+        )
+    return [
+        SystemMessage(content=system_prompt),
+        *[message for turn in recent for message in turn],
+    ]
+
+
+def create_history_modifier(
+    system_prompt: str,
+) -> Callable[[Sequence[BaseMessage]], List[BaseMessage]]:
+    """
+    Messages modifier that bounds the context sent to the model.
+
+    :param system_prompt: agent system prompt.
+    :return: function preparing the model input from the thread history.
+    """
+
+    def modify_messages(  # noqa: WPS430
+        messages: Sequence[BaseMessage],
+    ) -> List[BaseMessage]:
+        return bound_history(system_prompt, messages)
+
+    return modify_messages
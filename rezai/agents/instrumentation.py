@@ -0,0 +1,213 @@
+import json
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from loguru import logger
+
+from rezai.metrics import metrics
+from rezai.settings import settings
+
+turn_duration = metrics.histogram(
+    "agent_turn_duration_seconds",
+    "Chat turn duration, per route (agent, fast_path, answer_cache).",
+)
+turn_iterations = metrics.histogram(
+    "agent_turn_iterations",
+    "Model calls (ReAct iterations) per chat turn.",
+)
+llm_latency = metrics.histogram(
+    "agent_llm_latency_seconds",
+    "Duration of each model call of the agent.",
+)
+llm_first_token = metrics.histogram(
+    "agent_llm_time_to_first_token_seconds",
+    "Time until the first streamed token of each model call.",
+)
+llm_tokens = metrics.counter(
+    "agent_llm_tokens_total",
+    "Model tokens used by the agent, per kind (input, output, cache_read, cache_write).",
+)
+tool_payload = metrics.histogram(
+    "agent_tool_payload_bytes",
+    "Size of tool results passed to the model, per tool.",
+)
+cancelled_turns = metrics.counter(
+    "agent_cancelled_turns_total",
+    "Chat turns stopped because the client went away.",
+)
+cancelled_calls = metrics.counter(
+    "agent_cancelled_calls_total",
+    "Model and tool calls stopped before finishing by cancelled turns, "
+    "per kind (llm, tool) and tool.",
+)
+
+
+def _payload_size(output: Any) -> int:
+    content = getattr(output, "content", output)
+    if not isinstance(content, str):
+        content = json.dumps(content, default=str)
+    return len(content.encode("utf-8"))
+
+
+class TurnRecorder(AsyncCallbackHandler):
+    """
+    Collects timings and token usage of one chat turn.
+
+    Pass it in the callbacks of the run, then call ``finish``
+    to export the turn to metrics and the log.
+
+    :param thread_id: thread of the turn.
+    """
+
+    def __init__(self, thread_id: str) -> None:
+        self.thread_id = thread_id
+        self.started = time.monotonic()
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.tool_calls: List[Dict[str, Any]] = []
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+
+    async def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[BaseMessage]],
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._runs[run_id] = {"started": time.monotonic(), "first_token": None}
+
+    async def on_llm_new_token(
+        self,
+        token: str,
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        run = self._runs.get(run_id)
+        if run is not None and run["first_token"] is None:
+            run["first_token"] = time.monotonic() - run["started"]
+
+    async def on_llm_end(
+        self,
+        response: LLMResult,
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        message = getattr(response.generations[0][0], "message", None)
+        usage = getattr(message, "usage_metadata", None) or {}
+        response_metadata = getattr(message, "response_metadata", None) or {}
+        cache_usage = response_metadata.get("cache_usage") or {}
+        self.llm_calls.append(
+            {
+                "latency": time.monotonic() - run["started"],
+                "first_token": run["first_token"],
+                "input": usage.get("input_tokens", 0),
+                "output": usage.get("output_tokens", 0),
+                "cache_read": cache_usage.get("cache_read_input_tokens", 0),
+                "cache_write": cache_usage.get("cache_creation_input_tokens", 0),
+            },
+        )
+
+    async def on_llm_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._runs.pop(run_id, None)
+
+    async def on_tool_start(
+        self,
+        serialized: Dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._runs[run_id] = {
+            "started": time.monotonic(),
+            "tool": serialized.get("name") or kwargs.get("name"),
+        }
+
+    async def on_tool_end(
+        self,
+        output: Any,
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._end_tool(run_id, _payload_size(output), error=False)
+
+    async def on_tool_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._end_tool(run_id, 0, error=True)
+
+    def cancel(self) -> None:
+        """Record that the turn was cancelled, with the calls it cut short."""
+        cancelled_turns.inc()
+        for run in self._runs.values():
+            if "tool" in run:
+                cancelled_calls.inc(kind="tool", tool=run["tool"])
+            else:
+                cancelled_calls.inc(kind="llm")
+        self._runs.clear()
+
+    def finish(self, route: str, error: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Export the turn to metrics and the turn log.
+
+        :param route: how the turn was answered.
+        :param error: error that ended the turn, if any.
+        :return: turn summary.
+        """
+        duration = time.monotonic() - self.started
+        turn_duration.observe(duration, route=route)
+        if route == "agent":
+            turn_iterations.observe(len(self.llm_calls))
+        for llm_call in self.llm_calls:
+            llm_latency.observe(llm_call["latency"])
+            if llm_call["first_token"] is not None:
+                llm_first_token.observe(llm_call["first_token"])
+            for kind in ("input", "output", "cache_read", "cache_write"):
+                llm_tokens.inc(llm_call[kind], kind=kind)
+        for tool_call in self.tool_calls:
+            tool_payload.observe(tool_call["bytes"], tool=tool_call["tool"])
+        summary = {
+            "thread_id": self.thread_id,
+            "route": route,
+            "duration": round(duration, 3),
+            "iterations": len(self.llm_calls),
+            "llm_calls": self.llm_calls,
+            "tool_calls": self.tool_calls,
+            "error": error,
+        }
+        if settings.agent_turn_log:
+            logger.info("Agent turn {}", json.dumps(summary, default=str))
+        return summary
+
+    def _end_tool(self, run_id: UUID, size: int, error: bool) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        self.tool_calls.append(
+            {
+                "tool": run["tool"],
+                "latency": time.monotonic() - run["started"],
+                "bytes": size,
+                "error": error,
+            },
+        )
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from loguru import logger
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from rezai.metrics import metrics
+from rezai.settings import settings
+
+thread_leases = metrics.counter(
+    "agent_thread_leases_total",
+    "Attempts to start a turn, per result: acquired, or busy when "
+    "another turn of the thread was running.",
+)
+
+# Deletes or extends the lease only if it is still held by the caller.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Leases held by this worker: thread id to turn id and expiry time.
+_local_leases: Dict[str, Tuple[str, float]] = {}
+
+
+class ThreadLease:
+    """
+    Lets one turn at a time run on a thread.
+
+    Leases are held in this worker, and in redis when a pool is given and
+    ``agent_thread_lease_redis_enabled`` is set, so turns are serialized
+    across workers too. A lease expires ``agent_thread_lease_ttl`` seconds
+    after its last renewal, so a crashed worker does not block the thread.
+
+    :param redis_pool: redis connection pool.
+    """
+
+    def __init__(self, redis_pool: Optional[ConnectionPool] = None) -> None:
+        self.redis_pool = (
+            redis_pool if settings.agent_thread_lease_redis_enabled else None
+        )
+
+    async def acquire(self, thread_id: str, turn_id: str) -> Optional[str]:
+        """
+        Try to take the lease of a thread for a turn.
+
+        :param thread_id: thread of the turn.
+        :param turn_id: id of the turn taking the lease.
+        :return: None when taken, otherwise the turn holding the thread,
+            an empty string if it is not known.
+        """
+        now = time.monotonic()
+        local = _local_leases.get(thread_id)
+        holder = local[0] if local is not None and local[1] > now else None
+        if holder is None and self.redis_pool is not None:
+            holder = await self._acquire_redis(thread_id, turn_id)
+        if holder is not None:
+            thread_leases.inc(result="busy")
+            return holder
+        thread_leases.inc(result="acquired")
+        _local_leases[thread_id] = (turn_id, now + settings.agent_thread_lease_ttl)
+        return None
+
+    async def release(self, thread_id: str, turn_id: str) -> None:
+        """
+        Give the lease of a thread back.
+
+        :param thread_id: thread of the turn.
+        :param turn_id: turn holding the lease.
+        """
+        local = _local_leases.get(thread_id)
+        if local is not None and local[0] == turn_id:
+            _local_leases.pop(thread_id)
+        await self._eval(RELEASE_SCRIPT, thread_id, turn_id)
+
+    @asynccontextmanager
+    async def held(self, thread_id: str, turn_id: str) -> AsyncIterator[None]:
+        """
+        Keep an acquired lease while the block runs, then release it.
+
+        :param thread_id: thread of the turn.
+        :param turn_id: turn holding the lease.
+        :yield: nothing.
+        """
+        renewal = asyncio.ensure_future(self._renew(thread_id, turn_id))
+        try:
+            yield
+        finally:
+            renewal.cancel()
+            with suppress(asyncio.CancelledError):
+                await renewal
+            await self.release(thread_id, turn_id)
+
+    async def _acquire_redis(self, thread_id: str, turn_id: str) -> Optional[str]:
+        key = _key(thread_id)
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                acquired = await redis.set(
+                    key,
+                    turn_id,
+                    nx=True,
+                    px=int(settings.agent_thread_lease_ttl * 1000),
+                )
+                if acquired:
+                    return None
+                holder = await redis.get(key)
+        except RedisError as exc:
+            logger.warning("Thread leases in redis are unavailable: {}", exc)
+            return None
+        if holder is None:
+            return ""
+        return holder.decode("utf-8") if isinstance(holder, bytes) else holder
+
+    async def _renew(self, thread_id: str, turn_id: str) -> None:
+        ttl = settings.agent_thread_lease_ttl
+        while True:
+            await asyncio.sleep(ttl / 3)
+            if _local_leases.get(thread_id, ("",))[0] == turn_id:
+                _local_leases[thread_id] = (turn_id, time.monotonic() + ttl)
+            await self._eval(RENEW_SCRIPT, thread_id, turn_id, int(ttl * 1000))
+
+    async def _eval(self, script: str, thread_id: str, *args: object) -> None:
+        if self.redis_pool is None:
+            return
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                await redis.eval(script, 1, _key(thread_id), *args)
+        except RedisError as exc:
+            logger.warning("Thread leases in redis are unavailable: {}", exc)
+
+
+def _key(thread_id: str) -> str:
+    return f"thread_lease:{thread_id}"
@@ -0,0 +1,14 @@
+from fastapi import FastAPI
+
+from rezai.agents.restaurant_search_agent import create_restaurant_agent
+
+
+def init_restaurant_agent(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Compiles the restaurant agent graph once per process.
+
+    Requires the redis pool, so it runs after init_redis.
+
+    :param app: current fastapi application.
+    """
+    app.state.restaurant_agent = create_restaurant_agent(app.state.redis_pool)
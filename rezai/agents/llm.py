@@ -0,0 +1,313 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import anthropic
+from langchain_anthropic import ChatAnthropic
+from langchain_anthropic.chat_models import (
+    _make_message_chunk_from_anthropic_event,
+    _tools_in_params,
+)
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from rezai.metrics import metrics
+from rezai.services.ratelimit import TokenBucket
+
+prompt_cache_tokens = metrics.counter(
+    "anthropic_prompt_cache_tokens_total",
+    "Input tokens written to or read from the Anthropic prompt cache.",
+)
+llm_retries = metrics.counter(
+    "anthropic_retries_total",
+    "Messages API calls retried after a rate limit, overload or connection error.",
+)
+
+# Rough size of a token, used to reserve budget before the call.
+CHARS_PER_TOKEN = 4
+# Beta header enabling prompt caching on the messages API.
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+CACHE_CONTROL = {"type": "ephemeral"}
+CACHE_USAGE_KEYS = ("cache_creation_input_tokens", "cache_read_input_tokens")
+# Errors after which the call is tried again, 5xx includes 529 overloaded.
+RETRYABLE_ERRORS = (
+    anthropic.RateLimitError,
+    anthropic.InternalServerError,
+    anthropic.APIConnectionError,
+)
+
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    """
+    Estimate the number of input tokens of a prompt.
+
+    :param messages: prompt messages.
+    :return: estimated token count.
+    """
+    return sum(len(str(message.content)) for message in messages) // CHARS_PER_TOKEN
+
+
+def content_text(content: Any) -> str:
+    """
+    Text of message content.
+
+    With tools bound, Claude returns a list of content blocks,
+    only the text blocks are shown to the user.
+
+    :param content: message or chunk content.
+    :return: concatenated text.
+    """
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "")
+        for block in content
+        if isinstance(block, dict) and block.get("type") in {"text", "text_delta"}
+    )
+
+
+def retry_delay(exc: Exception, attempt: int, backoff: float) -> float:
+    """
+    Time to wait before retrying a failed call.
+
+    :param exc: error of the call.
+    :param attempt: number of retries so far.
+    :param backoff: delay of the first retry (seconds).
+    :return: the Retry-After of the response if given,
+        otherwise an exponential backoff.
+    """
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after)  # type: ignore
+    except (TypeError, ValueError):
+        return backoff * 2**attempt
+
+
+def _with_cache_control(block: Any) -> Dict[str, Any]:
+    if isinstance(block, str):
+        block = {"type": "text", "text": block}
+    return {**block, "cache_control": CACHE_CONTROL}
+
+
+def mark_cache_breakpoints(payload: Dict[str, Any], system_prefix: str = "") -> None:
+    """
+    Mark the reusable prefix of a messages API payload as cacheable.
+
+    Breakpoints are set after the tool definitions, after the static part
+    of the system prompt and after the last message. The last one lets the
+    next step of the same turn reuse the whole conversation so far.
+
+    :param payload: request payload, changed in place.
+    :param system_prefix: static start of the system prompt.
+    """
+    if payload.get("tools"):
+        tools = list(payload["tools"])
+        tools[-1] = _with_cache_control(tools[-1])
+        payload["tools"] = tools
+    system = payload.get("system")
+    if system:
+        if system_prefix and system.startswith(system_prefix):
+            static, dynamic = system[: len(system_prefix)], system[len(system_prefix) :]
+        else:
+            static, dynamic = system, ""
+        payload["system"] = [_with_cache_control(static)]
+        if dynamic.strip():
+            payload["system"].append({"type": "text", "text": dynamic})
+    messages = payload.get("messages")
+    if messages:
+        last = dict(messages[-1])
+        content = last["content"]
+        if isinstance(content, str):
+            content = [content]
+        last["content"] = [*content[:-1], _with_cache_control(content[-1])]
+        payload["messages"] = [*messages[:-1], last]
+
+
+def cache_usage(usage: Any) -> Dict[str, int]:
+    """
+    Prompt cache token counts reported by the messages API.
+
+    :param usage: usage object of a response.
+    :return: cache write and read token counts.
+    """
+    reported = usage.model_dump() if usage is not None else {}
+    counts = {key: reported.get(key) or 0 for key in CACHE_USAGE_KEYS}
+    prompt_cache_tokens.inc(counts["cache_creation_input_tokens"], kind="write")
+    prompt_cache_tokens.inc(counts["cache_read_input_tokens"], kind="read")
+    return counts
+
+
+class RateLimitedChatAnthropic(ChatAnthropic):
+    """
+    ChatAnthropic that queues calls on the shared provider limits.
+
+    Before every call a request slot and the estimated input tokens are
+    reserved. After the call the reservation is corrected with the
+    reported usage, so the tokens-per-minute budget tracks real spend.
+
+    With ``prompt_caching`` the tool definitions, the ``system_prefix``
+    part of the system prompt and the conversation are marked cacheable.
+    Cache write and read token counts of every call are added to the
+    response metadata under ``cache_usage``.
+
+    Rate limited, overloaded and failed connections are retried up to
+    ``rate_limit_retries`` times here instead of in the SDK client, which
+    should be created with ``max_retries=0``. Every retry waits for the
+    Retry-After of the response, then queues on the shared limits again,
+    so retries of all workers stay within the limits.
+    """
+
+    request_bucket: Optional[TokenBucket] = None
+    token_bucket: Optional[TokenBucket] = None
+    rate_limit_retries: int = 3
+    retry_backoff: float = 1.0
+    prompt_caching: bool = False
+    system_prefix: str = ""
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            # Limits are applied by _astream.
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        attempt = 0
+        while True:  # noqa: WPS457
+            estimate = await self._acquire(messages)
+            try:
+                chat_result = await super()._agenerate(
+                    messages,
+                    stop,
+                    run_manager,
+                    **kwargs,
+                )
+            except RETRYABLE_ERRORS as exc:
+                # The failed call spent no tokens.
+                await self._settle(estimate, 0)
+                await self._before_retry(exc, attempt)
+                attempt += 1
+                continue
+            usage = getattr(chat_result.generations[0].message, "usage_metadata", None)
+            await self._settle(estimate, usage["total_tokens"] if usage else estimate)
+            return chat_result
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        attempt = 0
+        while True:  # noqa: WPS457
+            estimate = await self._acquire(messages)
+            used = 0
+            streamed = False
+            failure: Optional[Exception] = None
+            try:
+                async for chunk in self._astream_events(
+                    messages,
+                    stop,
+                    run_manager,
+                    **kwargs,
+                ):
+                    streamed = True
+                    usage = getattr(chunk.message, "usage_metadata", None)
+                    if usage:
+                        used += usage["total_tokens"]
+                    yield chunk
+            except RETRYABLE_ERRORS as exc:
+                # Chunks already passed on can't be taken back,
+                # only calls that failed before the first one are retried.
+                if streamed:
+                    raise
+                failure = exc
+            finally:
+                await self._settle(estimate, 0 if failure else used or estimate)
+            if failure is None:
+                return
+            await self._before_retry(failure, attempt)
+            attempt += 1
+
+    def _get_request_payload(
+        self,
+        input_: LanguageModelInput,
+        *,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        payload = super()._get_request_payload(input_, stop=stop, **kwargs)
+        if self.prompt_caching:
+            mark_cache_breakpoints(payload, self.system_prefix)
+        return payload
+
+    def _format_output(self, data: Any, **kwargs: Any) -> ChatResult:
+        chat_result = super()._format_output(data, **kwargs)
+        message = chat_result.generations[0].message
+        message.response_metadata["cache_usage"] = cache_usage(data.usage)
+        return chat_result
+
+    async def _astream_events(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        # Same as ChatAnthropic._astream, but keeps the cache usage
+        # reported with the message_start event, which no public hook
+        # exposes. langchain-anthropic is pinned for this, and
+        # test_streaming_follows_pinned_langchain_anthropic fails when
+        # the upstream streaming changes.
+        stream_usage = kwargs.pop("stream_usage", None)
+        if stream_usage is None:
+            stream_usage = self.stream_usage
+        kwargs["stream"] = True
+        payload = self._get_request_payload(messages, stop=stop, **kwargs)
+        stream = await self._async_client.messages.create(**payload)
+        coerce_content_to_string = not _tools_in_params(payload)
+        async for event in stream:
+            message = _make_message_chunk_from_anthropic_event(
+                event,
+                stream_usage=stream_usage,
+                coerce_content_to_string=coerce_content_to_string,
+            )
+            if event.type == "message_start":
+                message = message or AIMessageChunk(
+                    content="" if coerce_content_to_string else [],
+                )
+                message.response_metadata["cache_usage"] = cache_usage(
+                    event.message.usage,
+                )
+            if message is None:
+                continue
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager and isinstance(message.content, str):
+                await run_manager.on_llm_new_token(message.content, chunk=chunk)
+            yield chunk
+
+    async def _acquire(self, messages: List[BaseMessage]) -> int:
+        estimate = estimate_tokens(messages)
+        if self.request_bucket is not None:
+            await self.request_bucket.acquire()
+        if self.token_bucket is not None:
+            await self.token_bucket.acquire(estimate)
+        return estimate
+
+    async def _before_retry(self, exc: Exception, attempt: int) -> None:
+        if attempt >= self.rate_limit_retries:
+            raise exc
+        llm_retries.inc(error=type(exc).__name__)
+        await asyncio.sleep(retry_delay(exc, attempt, self.retry_backoff))
+
+    async def _settle(self, estimate: int, used: int) -> None:
+        if self.token_bucket is not None and used != estimate:
+            await self.token_bucket.debit(used - estimate)
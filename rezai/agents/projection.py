@@ -0,0 +1,191 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from rezai.db.models.restaurant_model import Restaurant
+from rezai.settings import settings
+from rezai.web.api.valueserp.schema import PlaceDetails, PlaceResult
+
+# Every field a projected record can carry. The fields actually sent to
+# the agent are picked per tool in settings.
+PLACE_FIELDS = (*PlaceResult.model_fields, "reviews", "snippet")
+PLACE_DETAILS_FIELDS = (*PlaceDetails.model_fields, "hours", "snippet")
+WEB_RESULT_FIELDS = ("title", "url", "snippet")
+# Columns of saved restaurants passed to the agent, without ids and timestamps.
+RESTAURANT_FIELDS = (
+    "title",
+    "type",
+    "category",
+    "website",
+    "description",
+    "address",
+    "phone",
+    "rating",
+    "reviews",
+    "hours",
+    "opening_hours",
+    "menu",
+    "reservations",
+    "order",
+    "order_food",
+)
+
+
+def _truncate(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    limit = settings.agent_snippet_max_chars
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "…"
+
+
+class CompactRecord:
+    """
+    Memory-light record holding only the fields the agent uses.
+
+    Subclasses list their fields in ``__slots__``.
+    """
+
+    __slots__: Sequence[str] = ()
+
+    def __init__(self, **values: Any) -> None:
+        for field in self.__slots__:
+            setattr(self, field, values.get(field))
+
+    def as_dict(self, fields: Iterable[str]) -> Dict[str, Any]:
+        """
+        Render selected fields, skipping empty ones.
+
+        :param fields: names of the fields to include.
+        :return: compact mapping for the tool output.
+        """
+        rendered = {}
+        for field in fields:
+            field_value = getattr(self, field, None)
+            if field_value not in (None, "", []):
+                rendered[field] = field_value
+        return rendered
+
+
+class PlaceRecord(CompactRecord):
+    """Place returned by a ValueSerp places search."""
+
+    __slots__ = PLACE_FIELDS
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "PlaceRecord":
+        """
+        Build record from a ValueSerp places result.
+
+        :param payload: raw places result.
+        :return: place record.
+        """
+        snippet = payload.get("snippet") or payload.get("description")
+        return cls(**{**payload, "snippet": _truncate(snippet)})
+
+
+class PlaceDetailsRecord(CompactRecord):
+    """Place details returned by ValueSerp."""
+
+    __slots__ = PLACE_DETAILS_FIELDS
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "PlaceDetailsRecord":
+        """
+        Build record from ValueSerp place details.
+
+        :param payload: raw place details.
+        :return: place details record.
+        """
+        return cls(**{**payload, "snippet": _truncate(payload.get("description"))})
+
+
+class WebResultRecord(CompactRecord):
+    """Web search hit returned by You.com."""
+
+    __slots__ = WEB_RESULT_FIELDS
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "WebResultRecord":
+        """
+        Build record from a You.com search hit.
+
+        :param payload: raw search hit.
+        :return: web result record.
+        """
+        snippets = payload.get("snippets") or [payload.get("description")]
+        return cls(
+            title=payload.get("title"),
+            url=payload.get("url"),
+            snippet=_truncate(snippets[0]),
+        )
+
+
+class RestaurantRecord(CompactRecord):
+    """Restaurant saved in our database."""
+
+    __slots__ = RESTAURANT_FIELDS
+
+    @classmethod
+    def from_row(cls, restaurant: Restaurant) -> "RestaurantRecord":
+        """
+        Build record from a restaurant row.
+
+        :param restaurant: ORM row.
+        :return: restaurant record.
+        """
+        return cls(**{field: getattr(restaurant, field) for field in cls.__slots__})
+
+
+def project_places(places: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Project places search results for the agent.
+
+    :param places: raw ValueSerp places results.
+    :return: compact places limited to agent_search_max_results.
+    """
+    return [
+        PlaceRecord.from_payload(place).as_dict(settings.agent_search_fields)
+        for place in places[: settings.agent_search_max_results]
+    ]
+
+
+def project_place_details(place_details: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Project place details for the agent.
+
+    :param place_details: raw ValueSerp place details.
+    :return: compact place details.
+    """
+    if not place_details:
+        return {}
+    record = PlaceDetailsRecord.from_payload(place_details)
+    return record.as_dict(settings.agent_details_fields)
+
+
+def project_web_results(search_results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Project You.com search results for the agent.
+
+    :param search_results: raw You.com search response.
+    :return: compact hits limited to agent_web_max_results.
+    """
+    hits = search_results.get("hits", [])[: settings.agent_web_max_results]
+    return [
+        WebResultRecord.from_payload(hit).as_dict(WEB_RESULT_FIELDS) for hit in hits
+    ]
+
+
+def project_restaurants(restaurants: Iterable[Restaurant]) -> List[Dict[str, Any]]:
+    """
+    Project saved restaurants for the agent.
+
+    ORM rows are not JSON-serializable, the tool output is streamed to
+    clients and stored in the thread as is.
+
+    :param restaurants: restaurant rows.
+    :return: compact restaurants.
+    """
+    return [
+        RestaurantRecord.from_row(restaurant).as_dict(RESTAURANT_FIELDS)
+        for restaurant in restaurants
+    ]
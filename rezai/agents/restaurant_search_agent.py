@@ -1,47 +1,108 @@
-from typing import Annotated, Any, AsyncIterator, Optional
-
-from fastapi import Depends
+import asyncio
+import time
+from typing import (
+    Annotated,
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from fastapi import Depends, Request
 from langchain.tools import tool
-from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.schema import StreamEvent
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph.graph import CompiledGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import create_react_agent
 from pydantic.v1 import BaseModel, SecretStr
-
+from redis.asyncio import ConnectionPool
+
+from rezai.agents.answer_cache import AnswerCache, replay_events
+from rezai.agents.cancellation import aclosing, settle_in_background
+from rezai.agents.checkpoint import RedisCheckpointSaver
+from rezai.agents.deadline import with_deadline
+from rezai.agents.fast_path import answer_from_database
+from rezai.agents.history import create_history_modifier
+from rezai.agents.instrumentation import TurnRecorder
+from rezai.agents.llm import PROMPT_CACHING_BETA, RateLimitedChatAnthropic, content_text
+from rezai.agents.projection import (
+    project_place_details,
+    project_places,
+    project_restaurants,
+    project_web_results,
+)
 from rezai.db.dao.restaurant_dao import RestaurantDAO
 from rezai.db.models.restaurant_model import Restaurant
+from rezai.services.ratelimit import create_bucket
+from rezai.services.redis.dependency import get_redis_pool
+from rezai.services.resilience import ProviderUnavailableError
+from rezai.services.valueserp.dependency import get_valueserp_service
 from rezai.services.valueserp.service import ValueSerpService
+from rezai.services.youcom.dependency import get_youcom_service
 from rezai.services.youcom.service import YouComService
 from rezai.settings import settings
 
-memory = MemorySaver()
-
 
 class State(BaseModel):
     messages: Annotated[list[Any], add_messages]
     tool_results: dict[str, Any] = {}
 
 
+def get_valueserp(config: RunnableConfig) -> ValueSerpService:
+    """
+    ValueSerp service of the current request.
+
+    :param config: config of the current graph run.
+    :return: ValueSerp service.
+    """
+    return config["configurable"]["valueserp_service"]
+
+
+def get_youcom(config: RunnableConfig) -> YouComService:
+    """
+    You.com service of the current request.
+
+    :param config: config of the current graph run.
+    :return: You.com service.
+    """
+    return config["configurable"]["youcom_service"]
+
+
+def get_restaurant_dao(config: RunnableConfig) -> RestaurantDAO:
+    """
+    Restaurant DAO bound to the session of the current request.
+
+    :param config: config of the current graph run.
+    :return: restaurant DAO.
+    """
+    return config["configurable"]["restaurant_dao"]
+
+
 def create_restaurant_agent(
-    valueserp_service: ValueSerpService,
-    youcom_service: YouComService,
-    restaurant_dao: RestaurantDAO,
+    redis_pool: Optional[ConnectionPool] = None,
+    llm: Optional[BaseChatModel] = None,
 ) -> CompiledGraph:
     """
     Creates and returns a compiled graph for a restaurant agent.
 
     This function sets up a restaurant agent with various tools for searching restaurants,
     getting restaurant details, performing web searches, and interacting with a restaurant database.
-    It uses the provided services to implement these tools and creates a ReactAgent using LangChain.
-
-    :param valueserp_service: A service for performing restaurant searches and retrieving place details.
-    :type valueserp_service: ValueSerpService
-    :param youcom_service: A service for performing web searches.
-    :type youcom_service: YouComService
-    :param restaurant_dao: A data access object for interacting with the restaurant database.
-    :type restaurant_dao: RestaurantDAO
+    The graph is built once per process. Request-scoped services are not captured by the tools,
+    they are read from ``config["configurable"]`` of every run, see RestaurantAgentContainer.
+
+    :param redis_pool: A redis pool for the rate limits and conversation checkpoints
+        shared with other workers.
+    :type redis_pool: Optional[ConnectionPool]
+    :param llm: Chat model to use instead of the rate-limited Claude model.
+    :type llm: Optional[BaseChatModel]
     :return: A compiled graph representing the restaurant agent, ready to be executed.
     :rtype: CompiledGraph
 
@@ -54,14 +115,15 @@ def create_restaurant_agent(
 
     These tools are then combined with a language model to create a ReactAgent, which is
     returned as a compiled graph.
-
-    Note:
-    The actual implementation of the tools and the creation of the ReactAgent are defined
-    within this function but are not shown in this docstring.
     """
 
     @tool
-    async def search_restaurants(query: str, location: str) -> Any:
+    @with_deadline
+    async def search_restaurants(
+        query: str,
+        location: str,
+        config: RunnableConfig,
+    ) -> Any:
         """
         Search for restaurants based on a given query and location.
 
@@ -70,10 +132,15 @@ def create_restaurant_agent(
 
         :return: Returns the search results containing restaurant information.
         """
-        return await valueserp_service.search_places(query, location)
+        try:
+            places = await get_valueserp(config).search_places(query, location)
+        except ProviderUnavailableError as exc:
+            return str(exc)
+        return project_places(places)
 
     @tool
-    def get_restaurant_details(data_cid: str) -> Any:
+    @with_deadline
+    async def get_restaurant_details(data_cid: str, config: RunnableConfig) -> Any:
         """
         Get the details of a restaurant based on the data CID.
 
@@ -81,10 +148,15 @@ def create_restaurant_agent(
 
         :return: The details of the restaurant.
         """
-        return valueserp_service.get_place_details(data_cid)
+        try:
+            place_details = await get_valueserp(config).get_place_details(data_cid)
+        except ProviderUnavailableError as exc:
+            return str(exc)
+        return project_place_details(place_details)
 
     @tool
-    def web_search(query: str) -> Any:
+    @with_deadline
+    async def web_search(query: str, config: RunnableConfig) -> Any:
         """
         Search the web for information based on a given query.
 
@@ -92,19 +164,30 @@ def create_restaurant_agent(
 
         :return: The search results containing web search information.
         """
-        return youcom_service.get_ai_snippets_for_query(query)
+        try:
+            youcom_service = get_youcom(config)
+            search_results = await youcom_service.get_ai_snippets_for_query(query)
+        except ProviderUnavailableError as exc:
+            return str(exc)
+        return project_web_results(search_results)
 
     @tool
-    async def lookup_restaurants(**kwargs: Any) -> list[Restaurant]:
+    @with_deadline
+    async def lookup_restaurants(
+        config: RunnableConfig,
+        **kwargs: Any,
+    ) -> list[dict[str, Any]]:
         """
         Lookup restaurants based on the given keyword arguments.
 
         :param kwargs: The keyword arguments to filter restaurants.
         :return: The search results containing restaurant information.
         """
-        return await restaurant_dao.filter(**kwargs)
+        restaurants = await get_restaurant_dao(config).filter(**kwargs)
+        return project_restaurants(restaurants)
 
     @tool
+    @with_deadline
     async def save_restaurant(
         title: str,
         type: str,  # noqa: WPS125
@@ -123,6 +206,8 @@ def create_restaurant_agent(
         reservations: Optional[str] = None,
         order: Optional[str] = None,
         order_food: Optional[str] = None,
+        *,
+        config: RunnableConfig,
     ) -> None:
         """
         Save a restaurant to the database.
@@ -164,21 +249,49 @@ def create_restaurant_agent(
             order=order,
             order_food=order_food,
         )
-        await restaurant_dao.create_restaurant(restaurant)
+        await get_restaurant_dao(config).create_restaurant(restaurant)
 
-    llm = ChatAnthropic(
-        model_name="claude-3-haiku-20240307",
-        api_key=(
-            SecretStr(settings.anthropic_api_key)
-            if settings.anthropic_api_key
-            else None
-        ),
-        timeout=None,
-        max_retries=3,
-        temperature=0.5,
-        base_url=None,
-        stop=None,
-    )
+    system_prompt = """
+        You are an AI restaurant concierge assistant. Your role is to help users find restaurants,
+        provide information about specific restaurants, and manage a database of restaurant information. You will be
+        given a set of tools to accomplish these tasks.
+        If a user hasn't given you a location, always ask instead of seaching with no location reference.
+    """
+
+    if llm is None:
+        llm = RateLimitedChatAnthropic(
+            model_name="claude-3-haiku-20240307",
+            api_key=(
+                SecretStr(settings.anthropic_api_key)
+                if settings.anthropic_api_key
+                else None
+            ),
+            timeout=None,
+            max_retries=0,
+            rate_limit_retries=settings.anthropic_max_retries,
+            retry_backoff=settings.anthropic_retry_backoff,
+            temperature=0.5,
+            base_url=None,
+            stop=None,
+            request_bucket=create_bucket(
+                redis_pool,
+                "anthropic",
+                settings.anthropic_requests_per_second,
+            ),
+            token_bucket=create_bucket(
+                redis_pool,
+                "anthropic_tokens",
+                settings.anthropic_tokens_per_minute / 60,
+                capacity=settings.anthropic_tokens_per_minute,
+            ),
+            prompt_caching=settings.anthropic_prompt_caching,
+            system_prefix=system_prompt,
+            default_headers=(
+                {"anthropic-beta": PROMPT_CACHING_BETA}
+                if settings.anthropic_prompt_caching
+                else None
+            ),
+        )
 
     tools = [
         search_restaurants,
@@ -188,72 +301,281 @@ def create_restaurant_agent(
         save_restaurant,
     ]
 
-    system_prompt = """
-        You are an AI restaurant concierge assistant. Your role is to help users find restaurants,
-        provide information about specific restaurants, and manage a database of restaurant information. You will be
-        given a set of tools to accomplish these tasks.
-        If a user hasn't given you a location, always ask instead of seaching with no location reference.
-    """
-
     react_agent = create_react_agent(
         llm,
         tools=tools,  # type: ignore
-        checkpointer=memory,
-        messages_modifier=system_prompt,
+        checkpointer=(
+            RedisCheckpointSaver(redis_pool)
+            if redis_pool is not None
+            else MemorySaver()
+        ),
+        messages_modifier=create_history_modifier(system_prompt),
     )
 
     return react_agent
 
 
+# Tools whose results depend only on the question. Answers of turns that
+# called any other tool, which save restaurants or read the database,
+# are not cached.
+LOOKUP_TOOLS = frozenset(("search_restaurants", "get_restaurant_details", "web_search"))
+
+
+def _only_lookups(tool_calls: Iterable[Dict[str, Any]]) -> bool:
+    return all(call["name"] in LOOKUP_TOOLS for call in tool_calls)
+
+
+def _tool_calls(state: Any) -> List[Dict[str, Any]]:
+    return [
+        call
+        for message in state.get("messages", [])
+        if isinstance(message, AIMessage)
+        for call in message.tool_calls
+    ]
+
+
+def _final_answer(state: Any) -> Optional[str]:
+    messages = state.get("messages") if isinstance(state, dict) else None
+    if not messages:
+        return None
+    last = messages[-1]
+    if not isinstance(last, AIMessage) or last.tool_calls:
+        return None
+    return content_text(last.content)
+
+
 class RestaurantAgentContainer:
+    """
+    Runs the shared agent graph with the services of one request.
+
+    Restaurant list lookups are answered from the database when
+    ``agent_fast_path_enabled`` is set. When a redis pool is given and
+    ``agent_answer_cache_enabled`` is set, first messages of new threads
+    are answered from the answer cache, which keeps the answers of turns
+    that only called lookup tools. Every turn is recorded by a
+    ``TurnRecorder``.
+
+    :param graph: agent graph compiled at startup.
+    :param valueserp_service: The ValueSerp service.
+    :param youcom_service: The YouCom service.
+    :param restaurant_dao: The restaurant DAO.
+    :param redis_pool: redis pool for the answer cache.
+    """
+
     def __init__(
         self,
+        graph: CompiledGraph,
         valueserp_service: ValueSerpService,
         youcom_service: YouComService,
         restaurant_dao: RestaurantDAO,
+        redis_pool: Optional[ConnectionPool] = None,
     ) -> None:
-        self.graph = self.create_graph(
-            valueserp_service,
-            youcom_service,
-            restaurant_dao,
-        )
-
-    @staticmethod
-    def create_graph(
-        valueserp_service: ValueSerpService,
-        youcom_service: YouComService,
-        restaurant_dao: RestaurantDAO,
-    ) -> CompiledGraph:
-        return create_restaurant_agent(
-            valueserp_service,
-            youcom_service,
-            restaurant_dao,
+        self.graph = graph
+        self.services = {
+            "valueserp_service": valueserp_service,
+            "youcom_service": youcom_service,
+            "restaurant_dao": restaurant_dao,
+        }
+        self.answer_cache = (
+            AnswerCache(redis_pool)
+            if redis_pool is not None and settings.agent_answer_cache_enabled
+            else None
         )
 
-    def run_graph(
+    async def run_graph(
         self,
         input_data: dict[str, Any],
         config: RunnableConfig,
         **kwargs: Any,
     ) -> AsyncIterator[dict[str, Any] | Any]:
-        return self.graph.astream(input_data, config=config, **kwargs)
+        config, recorder = self._instrument(self.with_services(config))
+        route = "agent"
+        error = None
+        try:
+            answer, source, cache_key = await self._shortcut(input_data, config)
+            if answer is not None:
+                route = source  # type: ignore
+                state = await self.graph.aget_state(config)
+                yield state.values
+                return
+            started = time.monotonic()
+            last_state = None
+            stream = self.graph.astream(input_data, config=config, **kwargs)
+            async with aclosing(stream):
+                async for output in stream:
+                    last_state = output
+                    yield output
+        except (asyncio.CancelledError, GeneratorExit):
+            error = "cancelled"
+            recorder.cancel()
+            await settle_in_background(self.graph, config)
+            raise
+        except Exception as exc:
+            error = repr(exc)
+            raise
+        finally:
+            recorder.finish(route, error)
+        if cache_key is not None and kwargs.get("stream_mode") == "values":
+            answer = _final_answer(last_state)
+            if answer and _only_lookups(_tool_calls(last_state)):
+                await self.answer_cache.set(  # type: ignore
+                    cache_key,
+                    answer,
+                    time.monotonic() - started,
+                )
+
+    async def stream_events(
+        self,
+        input_data: dict[str, Any],
+        config: RunnableConfig,
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        Run the graph and stream its events.
+
+        :param input_data: graph input.
+        :param config: run config, usually holding the thread_id.
+        :yield: astream_events (v2) of the run, or replayed model
+            events when the turn was answered without the agent.
+            Closing the stream early cancels the run, and the thread is
+            settled with placeholder messages, see settle_cancelled_turn.
+        """
+        config, recorder = self._instrument(self.with_services(config))
+        route = "agent"
+        error = None
+        try:
+            answer, source, cache_key = await self._shortcut(input_data, config)
+            if answer is not None:
+                route = source  # type: ignore
+                async for replayed_event in replay_events(answer, source):  # type: ignore
+                    yield replayed_event
+                return
+            started = time.monotonic()
+            answer = None
+            tool_calls: List[Dict[str, Any]] = []
+            stream = self.graph.astream_events(input_data, config=config, version="v2")
+            async with aclosing(stream):
+                async for event in stream:
+                    if event["event"] == "on_chat_model_end":
+                        message = event["data"]["output"]
+                        calls = getattr(message, "tool_calls", None)
+                        if calls:
+                            tool_calls.extend(calls)
+                        else:
+                            answer = content_text(message.content)
+                    yield event
+        except (asyncio.CancelledError, GeneratorExit):
+            error = "cancelled"
+            recorder.cancel()
+            await settle_in_background(self.graph, config)
+            raise
+        except Exception as exc:
+            error = repr(exc)
+            raise
+        finally:
+            recorder.finish(route, error)
+        if cache_key is not None and answer and _only_lookups(tool_calls):
+            await self.answer_cache.set(  # type: ignore
+                cache_key,
+                answer,
+                time.monotonic() - started,
+            )
+
+    async def _shortcut(
+        self,
+        input_data: dict[str, Any],
+        config: RunnableConfig,
+    ) -> Tuple[Optional[str], Optional[str], Optional[Sequence[str]]]:
+        """
+        Try to answer the turn without running the agent.
+
+        Only first messages of new threads are shortcut, since the answer
+        may depend on the history. Restaurant list lookups are answered
+        from the database, repeated messages from the answer cache. A
+        shortcut answer is added to the thread as if the agent gave it.
+
+        :param input_data: graph input.
+        :param config: run config with services.
+        :return: answer, its source and the answer cache key for the run.
+        """
+        messages = input_data.get("messages", [])
+        if len(messages) != 1 or not isinstance(messages[0].get("content"), str):
+            return None, None, None
+        message = messages[0]["content"]
+        if not settings.agent_fast_path_enabled and self.answer_cache is None:
+            return None, None, None
+        state = await self.graph.aget_state(config)
+        if state.values.get("messages"):
+            return None, None, None
+        if settings.agent_fast_path_enabled:
+            answer = await answer_from_database(
+                message,
+                self.services["restaurant_dao"],
+            )
+            if answer is not None:
+                await self._record_turn(message, answer, config)
+                return answer, "fast_path", None
+        if self.answer_cache is None:
+            return None, None, None
+        cache_key = self.answer_cache.key_parts(message)
+        entry = await self.answer_cache.get(cache_key)
+        if entry is None:
+            return None, None, cache_key
+        await self._record_turn(message, entry["answer"], config)
+        return entry["answer"], "answer_cache", None
+
+    async def _record_turn(
+        self,
+        message: str,
+        answer: str,
+        config: RunnableConfig,
+    ) -> None:
+        await self.graph.aupdate_state(
+            config,
+            {"messages": [HumanMessage(content=message), AIMessage(content=answer)]},
+            as_node="agent",
+        )
+
+    def _instrument(
+        self,
+        config: RunnableConfig,
+    ) -> Tuple[RunnableConfig, TurnRecorder]:
+        thread_id = config.get("configurable", {}).get("thread_id")
+        recorder = TurnRecorder(str(thread_id))
+        callbacks = [*(config.get("callbacks") or []), recorder]  # type: ignore
+        return {**config, "callbacks": callbacks}, recorder
+
+    def with_services(self, config: RunnableConfig) -> RunnableConfig:
+        """
+        Add the request services to a run config.
+
+        :param config: run config, usually holding the thread_id.
+        :return: config passed to the graph.
+        """
+        configurable = {**config.get("configurable", {}), **self.services}
+        return {**config, "configurable": configurable}
 
 
 def get_restaurant_agent_container(
-    valueserp_service: ValueSerpService = Depends(),
-    youcom_service: YouComService = Depends(),
+    request: Request,
+    valueserp_service: ValueSerpService = Depends(get_valueserp_service),
+    youcom_service: YouComService = Depends(get_youcom_service),
     restaurant_dao: RestaurantDAO = Depends(),
+    redis_pool: ConnectionPool = Depends(get_redis_pool),
 ) -> RestaurantAgentContainer:
     """
     Dependency to get the restaurant agent container.
 
+    :param request: current request.
     :param valueserp_service: The ValueSerp service.
     :param youcom_service: The YouCom service.
     :param restaurant_dao: The restaurant DAO.
+    :param redis_pool: The redis connection pool.
     :return: The restaurant agent container.
     """
     return RestaurantAgentContainer(
+        graph=request.app.state.restaurant_agent,
         valueserp_service=valueserp_service,
         youcom_service=youcom_service,
         restaurant_dao=restaurant_dao,
+        redis_pool=redis_pool,
     )
@@ -0,0 +1 @@
+"""Offline benchmarks of the restaurant agent, run with ``python -m rezai.benchmarks``."""
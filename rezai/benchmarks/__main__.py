@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from redis.asyncio import ConnectionPool
+
+from rezai.benchmarks.agent import compare_to_baseline, run_benchmark
+from rezai.benchmarks.conversations import (
+    DEFAULT_CONVERSATIONS,
+    load_conversations,
+    parse_conversations,
+)
+from rezai.settings import settings
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the offline agent benchmark.
+
+    :param argv: command line arguments.
+    :return: exit code, 1 when a figure regressed against the baseline.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m rezai.benchmarks",
+        description="Replay recorded conversations through the agent offline.",
+    )
+    parser.add_argument("--conversations", type=Path, help="conversations JSON")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--trace-memory", action="store_true")
+    parser.add_argument("--redis-url", help="store checkpoints in this redis")
+    parser.add_argument("--output", type=Path, help="write the summary here")
+    parser.add_argument("--baseline", type=Path, help="summary to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    conversations = (
+        load_conversations(args.conversations)
+        if args.conversations
+        else parse_conversations(DEFAULT_CONVERSATIONS)
+    )
+    redis_pool = ConnectionPool.from_url(args.redis_url) if args.redis_url else None
+    settings.agent_turn_log = False
+    report = asyncio.run(
+        run_benchmark(
+            conversations,
+            concurrency=args.concurrency,
+            repeat=args.repeat,
+            trace_memory=args.trace_memory,
+            redis_pool=redis_pool,
+        ),
+    )
+    summary = report.summary()
+    text = json.dumps(summary, indent=2)
+    print(text)  # noqa: WPS421
+    if args.output:
+        args.output.write_text(text)
+    if args.baseline:
+        regressions = compare_to_baseline(
+            summary,
+            json.loads(args.baseline.read_text()),
+            args.tolerance,
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)  # noqa: WPS421
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
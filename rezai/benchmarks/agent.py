@@ -0,0 +1,200 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from langgraph.graph.graph import CompiledGraph
+from redis.asyncio import ConnectionPool
+
+from rezai.agents.restaurant_search_agent import (
+    RestaurantAgentContainer,
+    create_restaurant_agent,
+)
+from rezai.benchmarks.conversations import Conversation, build_script
+from rezai.benchmarks.fakes import (
+    FakeRestaurantDAO,
+    FakeValueSerpService,
+    FakeYouComService,
+    ReplayChatModel,
+)
+from rezai.db.models import load_all_models
+from rezai.web.api.chat.streaming import chat_events, ndjson
+
+
+class BenchmarkReport(NamedTuple):
+    """Results of one benchmark run."""
+
+    conversations: int
+    turns: int
+    concurrency: int
+    wall_seconds: float
+    cpu_seconds: float
+    turn_latencies: List[float]
+    checkpoint_bytes: List[int]
+    streamed_bytes: int
+    model_calls: int
+    memory_peak_bytes: Optional[int] = None
+    memory_retained_bytes: Optional[int] = None
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Per-turn figures of the run.
+
+        CPU time is measured for the whole process and divided by the
+        number of turns, it is exact per turn only with concurrency 1.
+
+        :return: summary, JSON serializable.
+        """
+        latencies = sorted(self.turn_latencies)
+        return {
+            "conversations": self.conversations,
+            "turns": self.turns,
+            "concurrency": self.concurrency,
+            "model_calls_per_turn": self.model_calls / self.turns,
+            "throughput_turns_per_second": self.turns / self.wall_seconds,
+            "cpu_ms_per_turn": 1000 * self.cpu_seconds / self.turns,
+            "latency_ms_p50": 1000 * statistics.median(latencies),
+            "latency_ms_p95": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+            "checkpoint_bytes_mean": statistics.mean(self.checkpoint_bytes),
+            "checkpoint_bytes_max": max(self.checkpoint_bytes),
+            "streamed_bytes_per_turn": self.streamed_bytes / self.turns,
+            "memory_peak_bytes": self.memory_peak_bytes,
+            "memory_retained_bytes_per_turn": (
+                None
+                if self.memory_retained_bytes is None
+                else self.memory_retained_bytes / self.turns
+            ),
+        }
+
+
+async def _replay(
+    graph: CompiledGraph,
+    conversation: Conversation,
+    thread_id: str,
+    latencies: List[float],
+) -> Dict[str, int]:
+    """
+    Replay one conversation through the chat streaming path.
+
+    :param graph: agent graph.
+    :param conversation: conversation to replay.
+    :param thread_id: thread of the replay.
+    :param latencies: list the turn latencies are added to.
+    :return: streamed and final checkpoint sizes in bytes.
+    """
+    container = RestaurantAgentContainer(
+        graph,
+        valueserp_service=FakeValueSerpService(),  # type: ignore
+        youcom_service=FakeYouComService(),  # type: ignore
+        restaurant_dao=FakeRestaurantDAO(),  # type: ignore
+    )
+    config = {"configurable": {"thread_id": thread_id}}
+    streamed = 0
+    for turn in conversation.turns:
+        started = time.perf_counter()
+        events = container.stream_events(
+            {"messages": [{"role": "user", "content": turn.user}]},
+            config,  # type: ignore
+        )
+        async for line in ndjson(chat_events(events, thread_id)):
+            streamed += len(line)
+        latencies.append(time.perf_counter() - started)
+    checkpointer = graph.checkpointer
+    checkpoint_tuple = await checkpointer.aget_tuple(config)  # type: ignore
+    checkpoint = checkpointer.serde.dumps(checkpoint_tuple.checkpoint)  # type: ignore
+    return {"streamed": streamed, "checkpoint": len(checkpoint)}
+
+
+async def run_benchmark(
+    conversations: List[Conversation],
+    concurrency: int = 1,
+    repeat: int = 1,
+    trace_memory: bool = False,
+    redis_pool: Optional[ConnectionPool] = None,
+) -> BenchmarkReport:
+    """
+    Replay recorded conversations through the agent, without network calls.
+
+    The agent runs with a chat model replaying the recorded responses and
+    in-memory providers, so the figures only cover the agent's own work:
+    graph execution, tool calls, checkpointing and event streaming.
+
+    :param conversations: recorded conversations.
+    :param concurrency: conversations replayed at the same time.
+    :param repeat: times every conversation is replayed, each in a new thread.
+    :param trace_memory: measure memory with tracemalloc, which slows the run.
+    :param redis_pool: redis pool for the checkpoints, in memory if not given.
+    :return: benchmark report.
+    """
+    load_all_models()
+    llm = ReplayChatModel(script=build_script(conversations))
+    graph = create_restaurant_agent(redis_pool=redis_pool, llm=llm)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    run_id = time.time_ns()
+
+    async def replay(index: int, conversation: Conversation) -> Dict[str, int]:
+        async with semaphore:
+            thread_id = f"benchmark-{run_id}-{index}"
+            return await _replay(graph, conversation, thread_id, latencies)
+
+    jobs = [
+        (index, conversation)
+        for index, conversation in enumerate(conversations * repeat)
+    ]
+    if trace_memory:
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    results = await asyncio.gather(*(replay(*job) for job in jobs))
+    wall_seconds = time.perf_counter() - wall_started
+    cpu_seconds = time.process_time() - cpu_started
+    memory_peak = memory_retained = None
+    if trace_memory:
+        memory_after, memory_peak = tracemalloc.get_traced_memory()
+        memory_retained = memory_after - memory_before
+        tracemalloc.stop()
+    return BenchmarkReport(
+        conversations=len(jobs),
+        turns=len(latencies),
+        concurrency=concurrency,
+        wall_seconds=wall_seconds,
+        cpu_seconds=cpu_seconds,
+        turn_latencies=latencies,
+        checkpoint_bytes=[result["checkpoint"] for result in results],
+        streamed_bytes=sum(result["streamed"] for result in results),
+        model_calls=llm.calls,
+        memory_peak_bytes=memory_peak,
+        memory_retained_bytes=memory_retained,
+    )
+
+
+def compare_to_baseline(
+    summary: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float,
+) -> List[str]:
+    """
+    Find figures that regressed against a baseline summary.
+
+    :param summary: summary of the current run.
+    :param baseline: summary of a previous run.
+    :param tolerance: allowed relative increase, 0.2 for 20%.
+    :return: one message per regressed figure.
+    """
+    regressions = []
+    for name in (
+        "cpu_ms_per_turn",
+        "latency_ms_p95",
+        "checkpoint_bytes_max",
+        "streamed_bytes_per_turn",
+        "memory_retained_bytes_per_turn",
+    ):
+        current, previous = summary.get(name), baseline.get(name)
+        if current is None or not previous:
+            continue
+        if current > previous * (1 + tolerance):
+            regressions.append(f"{name}: {current:.1f} > {previous:.1f}")
+    return regressions
@@ -0,0 +1,179 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple
+
+from langchain_core.messages import AIMessage
+
+
+class Turn(NamedTuple):
+    """User message and the model responses recorded for it."""
+
+    user: str
+    responses: List[AIMessage]
+
+
+class Conversation(NamedTuple):
+    """Recorded multi-turn conversation."""
+
+    name: str
+    turns: List[Turn]
+
+
+# Recorded conversations in the format read by ``load_conversations``.
+# Every response is either a list of tool calls or the final answer.
+DEFAULT_CONVERSATIONS: List[Dict[str, Any]] = [
+    {
+        "name": "search_and_details",
+        "turns": [
+            {
+                "user": "Find me a sushi place in Austin",
+                "responses": [
+                    {
+                        "tool_calls": [
+                            {
+                                "name": "search_restaurants",
+                                "args": {"query": "sushi", "location": "Austin, TX"},
+                            },
+                        ],
+                    },
+                    {
+                        "content": (
+                            "Here are a few sushi places in Austin. Sushi place 1 "
+                            "is the best rated, with a 4.1 rating."
+                        ),
+                    },
+                ],
+            },
+            {
+                "user": "Tell me more about the first two",
+                "responses": [
+                    {
+                        "tool_calls": [
+                            {
+                                "name": "get_restaurant_details",
+                                "args": {"data_cid": "12345671"},
+                            },
+                            {
+                                "name": "get_restaurant_details",
+                                "args": {"data_cid": "12345672"},
+                            },
+                        ],
+                    },
+                    {
+                        "content": (
+                            "Both are open 11AM-10PM and take reservations. "
+                            "The first one has a seasonal menu and a long wine list."
+                        ),
+                    },
+                ],
+            },
+            {
+                "user": "Save the first one to our list",
+                "responses": [
+                    {
+                        "tool_calls": [
+                            {
+                                "name": "save_restaurant",
+                                "args": {
+                                    "title": "Sushi place 1",
+                                    "type": "Restaurant",
+                                    "category": "sushi",
+                                    "rating": 4.1,
+                                },
+                            },
+                        ],
+                    },
+                    {"content": "Saved Sushi place 1 to the list."},
+                ],
+            },
+        ],
+    },
+    {
+        "name": "web_search",
+        "turns": [
+            {
+                "user": "Is there a good brunch spot near Zilker Park?",
+                "responses": [
+                    {
+                        "tool_calls": [
+                            {
+                                "name": "web_search",
+                                "args": {"query": "best brunch near Zilker Park"},
+                            },
+                            {
+                                "name": "search_restaurants",
+                                "args": {"query": "brunch", "location": "Austin, TX"},
+                            },
+                        ],
+                    },
+                    {"content": "Brunch place 1 is a short walk from the park."},
+                ],
+            },
+            {
+                "user": "Thanks!",
+                "responses": [{"content": "You're welcome, enjoy your brunch!"}],
+            },
+        ],
+    },
+]
+
+
+def parse_conversations(raw: List[Dict[str, Any]]) -> List[Conversation]:
+    """
+    Build conversations from their JSON form.
+
+    :param raw: conversations, see DEFAULT_CONVERSATIONS.
+    :return: conversations with the responses as AI messages.
+    """
+    conversations = []
+    for raw_conversation in raw:
+        turns = []
+        for turn_index, raw_turn in enumerate(raw_conversation["turns"]):
+            responses = []
+            for response_index, response in enumerate(raw_turn["responses"]):
+                tool_calls = [
+                    {
+                        "name": tool_call["name"],
+                        "args": tool_call["args"],
+                        "id": f"call_{turn_index}_{response_index}_{call_index}",
+                    }
+                    for call_index, tool_call in enumerate(
+                        response.get("tool_calls", []),
+                    )
+                ]
+                responses.append(
+                    AIMessage(
+                        content=response.get("content", ""),
+                        tool_calls=tool_calls,
+                    ),
+                )
+            turns.append(Turn(raw_turn["user"], responses))
+        conversations.append(Conversation(raw_conversation["name"], turns))
+    return conversations
+
+
+def load_conversations(path: Path) -> List[Conversation]:
+    """
+    Read recorded conversations from a JSON file.
+
+    :param path: file holding a list in the DEFAULT_CONVERSATIONS format.
+    :return: conversations.
+    """
+    return parse_conversations(json.loads(path.read_text()))
+
+
+def build_script(conversations: List[Conversation]) -> Dict[str, List[AIMessage]]:
+    """
+    Map every user message to the responses recorded for it.
+
+    :param conversations: recorded conversations.
+    :return: script for the replay chat model.
+    :raises ValueError: if a user message was recorded with different responses.
+    """
+    script: Dict[str, List[AIMessage]] = {}
+    for conversation in conversations:
+        for turn in conversation.turns:
+            known = script.setdefault(turn.user, turn.responses)
+            if known != turn.responses:
+                raise ValueError(f"Conflicting responses recorded for {turn.user!r}.")
+    return script
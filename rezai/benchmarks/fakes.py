@@ -0,0 +1,156 @@
+import json
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from rezai.db.models.restaurant_model import Restaurant
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model replaying scripted responses, streamed word by word."""
+
+    responses: List[AIMessage]
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ScriptedChatModel":
+        return self
+
+    def _generate(self, messages: List[BaseMessage], *args: Any, **kwargs: Any) -> Any:
+        return ChatResult(generations=[ChatGeneration(message=self._next(messages))])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        response = self._next(messages)
+        if response.tool_calls:
+            tool_call_chunks = [
+                {
+                    "name": tool_call["name"],
+                    "args": json.dumps(tool_call["args"]),
+                    "id": tool_call["id"],
+                    "index": index,
+                }
+                for index, tool_call in enumerate(response.tool_calls)
+            ]
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(content="", tool_call_chunks=tool_call_chunks),
+            )
+            return
+        words = str(response.content).split(" ")
+        for index, word in enumerate(words):
+            text = word if index == len(words) - 1 else f"{word} "
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    def _next(self, messages: List[BaseMessage]) -> AIMessage:
+        response = self.responses[self.calls % len(self.responses)]
+        self.calls += 1
+        return response
+
+
+class ReplayChatModel(ScriptedChatModel):
+    """
+    Chat model replaying recorded turns.
+
+    The response is picked from the last user message and the number of
+    model calls made since, so concurrent conversations replay independently.
+    """
+
+    responses: List[AIMessage] = []
+    script: Dict[str, List[AIMessage]]
+
+    def _next(self, messages: List[BaseMessage]) -> AIMessage:
+        self.calls += 1
+        iteration = 0
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                turn = self.script[str(message.content)]
+                return turn[min(iteration, len(turn) - 1)]
+            if isinstance(message, AIMessage):
+                iteration += 1
+        raise ValueError("No user message to reply to.")
+
+
+class FakeValueSerpService:
+    """In-memory ValueSerp service returning generated places."""
+
+    def __init__(self, results: int = 10) -> None:
+        self.results = results
+
+    async def search_places(self, query: str, location: str) -> List[Dict[str, Any]]:
+        return [
+            {
+                "title": f"{query.title()} place {index}",
+                "data_cid": f"{zlib.crc32(query.encode())}{index}",
+                "address": f"{index} Main St, {location}",
+                "category": query,
+                "rating": 4 + (index % 10) / 10,
+                "reviews": 100 * index,
+                "description": f"A popular {query} spot in {location}. " * 5,
+            }
+            for index in range(1, self.results + 1)
+        ]
+
+    async def get_place_details(self, data_cid: str) -> Dict[str, Any]:
+        return {
+            "data_id": f"0x{data_cid}",
+            "data_cid": data_cid,
+            "title": f"Place {data_cid}",
+            "address": "1 Main St",
+            "website": f"https://example.com/{data_cid}",
+            "rating": 4.5,
+            "reviews": 1200,
+            "type": "Restaurant",
+            "category": "Restaurant",
+            "phone": "+1 512-555-0100",
+            "hours": "Open 11AM-10PM",
+            "description": "Seasonal menu and a long wine list. " * 10,
+        }
+
+
+class FakeYouComService:
+    """In-memory You.com service returning generated snippets."""
+
+    async def get_ai_snippets_for_query(self, query: str) -> Dict[str, Any]:
+        return {
+            "hits": [
+                {
+                    "title": f"{query} guide {index}",
+                    "url": f"https://example.com/{index}",
+                    "snippets": [f"Everything about {query}. " * 10],
+                }
+                for index in range(1, 6)
+            ],
+        }
+
+
+class FakeRestaurantDAO:
+    """In-memory restaurant DAO."""
+
+    def __init__(self, restaurants: Optional[Sequence[Restaurant]] = None) -> None:
+        self.restaurants = list(restaurants or [])
+
+    async def create_restaurant(self, restaurant: Restaurant) -> None:
+        self.restaurants.append(restaurant)
+
+    async def filter(self, **kwargs: Any) -> List[Restaurant]:
+        return [
+            restaurant
+            for restaurant in self.restaurants
+            if all(
+                getattr(restaurant, name, None) == filter_value
+                for name, filter_value in kwargs.items()
+                if filter_value is not None and hasattr(Restaurant, name)
+            )
+        ]
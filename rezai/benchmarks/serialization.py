@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.responses import UJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from rezai.web.api.chat.schema import (
+    ChatEvent,
+    DoneEvent,
+    MessageEvent,
+    TokenEvent,
+    ToolEndEvent,
+    ToolStartEvent,
+)
+from rezai.web.api.valueserp.schema import SearchPlacesResponse
+from rezai.web.responses import ModelResponse, json_line, model_line
+
+Encoder = Callable[[], Awaitable[Any]]
+
+
+def restaurant_results(count: int = 20) -> SearchPlacesResponse:
+    """
+    Restaurant search response like the ones of the places search route.
+
+    :param count: number of restaurants.
+    :return: validated response.
+    """
+    return SearchPlacesResponse(
+        places_results=[
+            {
+                "title": f"Restaurant {index}",
+                "data_cid": str(1000000 + index),
+                "address": f"{index} S Lamar Blvd, Austin, TX 78704",
+                "category": "Japanese restaurant",
+                "rating": 4.5,
+            }
+            for index in range(count)
+        ],
+    )
+
+
+def chat_turn(tokens: int = 200) -> List[ChatEvent]:
+    """
+    Events of a chat turn with a tool call and a streamed answer.
+
+    :param tokens: number of streamed tokens.
+    :return: chat events.
+    """
+    places = restaurant_results(5).model_dump()["places_results"]
+    events: List[ChatEvent] = [
+        ToolStartEvent(
+            id="run_1",
+            tool="search_restaurants",
+            input={"query": "sushi", "location": "Austin"},
+        ),
+        ToolEndEvent(id="run_1", tool="search_restaurants", output=places),
+    ]
+    events.extend(TokenEvent(text="word ") for _ in range(tokens))
+    events.append(MessageEvent(content="word " * tokens))
+    events.append(DoneEvent(thread_id="1"))
+    return events
+
+
+def _serialization_cases() -> Dict[str, Dict[str, Encoder]]:  # noqa: WPS231
+    restaurants = restaurant_results()
+    restaurants_field = create_response_field(
+        name="restaurants",
+        type_=SearchPlacesResponse,
+        mode="serialization",
+    )
+    events = chat_turn()
+    # The values stream repeats every message of the state after each step.
+    values = [{"content": f"Message {index} " * 20} for index in range(10)]
+
+    async def restaurants_before() -> Any:  # noqa: WPS430
+        content = await serialize_response(
+            field=restaurants_field,
+            response_content=restaurants,
+        )
+        return UJSONResponse(content).body
+
+    async def restaurants_after() -> Any:  # noqa: WPS430
+        return ModelResponse(restaurants).body
+
+    async def events_before() -> Any:  # noqa: WPS430
+        return [event.model_dump_json().encode("utf-8") + b"\n" for event in events]
+
+    async def events_after() -> Any:  # noqa: WPS430
+        return [model_line(event) for event in events]
+
+    async def values_before() -> Any:  # noqa: WPS430
+        return [json.dumps(message).encode("utf-8") + b"\n" for message in values]
+
+    async def values_after() -> Any:  # noqa: WPS430
+        return [json_line(message) for message in values]
+
+    return {
+        "restaurant_search_response": {
+            "before": restaurants_before,
+            "after": restaurants_after,
+        },
+        "chat_event_stream": {"before": events_before, "after": events_after},
+        "chat_values_stream": {"before": values_before, "after": values_after},
+    }
+
+
+async def _time(encode: Encoder, repeat: int) -> float:
+    await encode()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await encode()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+async def run_serialization_benchmark(
+    repeat: int = 1000,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Time the JSON encoding of restaurant and chat payloads.
+
+    ``before`` is the encoding the routes used until now: FastAPI's
+    response validation with ujson, and ``json.dumps`` or
+    ``model_dump_json`` per stream chunk. ``after`` is the current one.
+
+    :param repeat: encodings per payload and path.
+    :return: microseconds per payload for both paths, and the speedup.
+    """
+    summary: Dict[str, Dict[str, float]] = {}
+    for name, paths in _serialization_cases().items():
+        before = await _time(paths["before"], repeat)
+        after = await _time(paths["after"], repeat)
+        summary[name] = {
+            "before_us": round(before, 2),
+            "after_us": round(after, 2),
+            "speedup": round(before / after, 2),
+        }
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the serialization microbenchmark.
+
+    :param argv: command line arguments.
+    :return: exit code.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m rezai.benchmarks.serialization",
+        description="Compare JSON encodings of API responses and stream chunks.",
+    )
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args(argv)
+    summary = asyncio.run(run_serialization_benchmark(args.repeat))
+    print(json.dumps(summary, indent=2))  # noqa: WPS421
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence
+
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from rezai.db.dependencies import get_db_session
+from rezai.db.models.place_details_model import StoredPlaceDetails
+
+
+class PlaceDetailsDAO:
+    """
+    Data access object for stored place details.
+
+    This class provides read and write-back access to the
+    place details fetched from ValueSerp.
+    """
+
+    def __init__(self, session: AsyncSession = Depends(get_db_session)):
+        self.session = session
+
+    async def get_place_details(self, data_cid: str) -> Optional[StoredPlaceDetails]:
+        """
+        Get stored place details by data CID.
+
+        :param data_cid: The data CID of the place.
+        :return: Stored place details or None.
+        """
+        return await self.session.get(
+            StoredPlaceDetails,
+            data_cid,
+            populate_existing=True,
+        )
+
+    async def get_many_place_details(
+        self,
+        data_cids: Sequence[str],
+    ) -> Dict[str, StoredPlaceDetails]:
+        """
+        Get stored place details for several data CIDs in one query.
+
+        :param data_cids: The data CIDs of the places.
+        :return: Stored place details keyed by data CID.
+        """
+        rows = await self.session.execute(
+            select(StoredPlaceDetails)
+            .where(StoredPlaceDetails.data_cid.in_(data_cids))
+            .execution_options(populate_existing=True),
+        )
+        return {row.data_cid: row for row in rows.scalars().fetchall()}
+
+    async def upsert_place_details(self, data_cid: str, payload: Any) -> None:
+        """
+        Insert or refresh stored place details.
+
+        :param data_cid: The data CID of the place.
+        :param payload: The place details returned by ValueSerp.
+        """
+        fetched_at = datetime.now(timezone.utc)
+        statement = insert(StoredPlaceDetails).values(
+            data_cid=data_cid,
+            payload=payload,
+            fetched_at=fetched_at,
+        )
+        await self.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[StoredPlaceDetails.data_cid],
+                set_={"payload": payload, "fetched_at": fetched_at},
+            ),
+        )
@@ -1,13 +1,28 @@
-from typing import List, Optional
+from typing import Any, List, Optional
 
 from fastapi import Depends
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from rezai.db.dependencies import get_db_session
 from rezai.db.models.restaurant_model import Restaurant
 
 
+def contains_text(column: Any, text: str) -> ColumnElement[bool]:
+    """
+    Case-insensitive match of columns containing the text.
+
+    LIKE wildcards in the text are escaped, so ``%`` and ``_``
+    passed by the agent match themselves only.
+
+    :param column: string column.
+    :param text: text the column has to contain.
+    :return: filter clause.
+    """
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+
 class RestaurantDAO:
     """
     Data access object for the restaurant model.
@@ -46,9 +61,11 @@ class RestaurantDAO:
         type: Optional[str] = None,  # noqa: WPS125
         category: Optional[str] = None,
         address: Optional[str] = None,
-        min_rating: Optional[int] = None,
+        min_rating: Optional[float] = None,
         max_reviews: Optional[int] = None,
         unclaimed: Optional[bool] = None,
+        cuisine: Optional[str] = None,
+        limit: Optional[int] = None,
     ) -> List[Restaurant]:
         """
         Filter restaurants based on the given criteria.
@@ -60,6 +77,8 @@ class RestaurantDAO:
         :param min_rating: The minimum rating of the restaurant.
         :param max_reviews: The maximum number of reviews of the restaurant.
         :param unclaimed: Whether the restaurant is unclaimed.
+        :param cuisine: Text the category has to contain, case-insensitive.
+        :param limit: The maximum number of restaurants to return, best rated first.
         :return: A list of restaurants that match the criteria.
         """
         query = select(Restaurant)
@@ -70,12 +89,16 @@ class RestaurantDAO:
         if category:
             query = query.where(Restaurant.category == category)
         if address:
-            query = query.where(Restaurant.address.ilike(f"%{address}%"))
+            query = query.where(contains_text(Restaurant.address, address))
         if min_rating:
             query = query.where(Restaurant.rating >= min_rating)
         if max_reviews:
             query = query.where(Restaurant.reviews <= max_reviews)
         if unclaimed is not None:
             query = query.where(Restaurant.unclaimed == unclaimed)
+        if cuisine:
+            query = query.where(contains_text(Restaurant.category, cuisine))
+        if limit:
+            query = query.order_by(Restaurant.rating.desc().nulls_last()).limit(limit)
         rows = await self.session.execute(query)
         return list(rows.scalars().fetchall())
@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import JSON, DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from rezai.db.base import Base
+
+
+class StoredPlaceDetails(Base):
+    """Model for storing ValueSerp place details keyed by data_cid."""
+
+    __tablename__ = "place_details"
+
+    data_cid: Mapped[str] = mapped_column(String(length=64), primary_key=True)
+    payload: Mapped[Any] = mapped_column(JSON, nullable=False)
+    fetched_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
@@ -0,0 +1,225 @@
+import threading
+from typing import Any, Dict, List, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(label)) for name, label in labels.items()))
+
+
+def _series_name(name: str, key: LabelKey) -> str:
+    if not key:
+        return name
+    rendered = ",".join(f'{label}="{label_value}"' for label, label_value in key)
+    return f"{name}{{{rendered}}}"
+
+
+class Counter:
+    """Monotonic counter split by labels."""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        """
+        Increment the counter.
+
+        :param amount: value to add.
+        :param labels: labels of the series.
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        """
+        Current value of a series.
+
+        :param labels: labels of the series.
+        :return: counter value.
+        """
+        return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        All series of the counter.
+
+        :return: mapping of series name to value.
+        """
+        with self._lock:
+            return {
+                _series_name(self.name, key): counted
+                for key, counted in self._values.items()
+            }
+
+
+class Gauge:
+    """Value that goes up and down, split by labels."""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, current: float, **labels: Any) -> None:  # noqa: WPS125
+        """
+        Set the value of a series.
+
+        :param current: new value.
+        :param labels: labels of the series.
+        """
+        with self._lock:
+            self._values[_label_key(labels)] = current
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        """
+        Add to the value of a series, negative amounts subtract.
+
+        :param amount: value to add.
+        :param labels: labels of the series.
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        """
+        Current value of a series.
+
+        :param labels: labels of the series.
+        :return: gauge value.
+        """
+        return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        All series of the gauge.
+
+        :return: mapping of series name to value.
+        """
+        with self._lock:
+            return {
+                _series_name(self.name, key): current
+                for key, current in self._values.items()
+            }
+
+
+class Histogram:
+    """Summary of observed values (count, sum and max) split by labels."""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, observed: float, **labels: Any) -> None:
+        """
+        Record an observation.
+
+        :param observed: observed value.
+        :param labels: labels of the series.
+        """
+        key = _label_key(labels)
+        with self._lock:
+            summary = self._values.setdefault(key, [0, 0, 0])
+            summary[0] += 1
+            summary[1] += observed
+            summary[2] = max(summary[2], observed)
+
+    def count(self, **labels: Any) -> float:
+        """
+        Number of observations of a series.
+
+        :param labels: labels of the series.
+        :return: observation count.
+        """
+        return self._values.get(_label_key(labels), [0, 0, 0])[0]
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        All series of the histogram.
+
+        :return: mapping of series name to value.
+        """
+        series: Dict[str, float] = {}
+        with self._lock:
+            for key, (count, total, maximum) in self._values.items():
+                series[_series_name(f"{self.name}_count", key)] = count
+                series[_series_name(f"{self.name}_sum", key)] = total
+                series[_series_name(f"{self.name}_max", key)] = maximum
+        return series
+
+
+class MetricsRegistry:
+    """In-process registry of the application metrics."""
+
+    def __init__(self) -> None:
+        self._counters: Dict[str, Counter] = {}
+        self._gauges: Dict[str, Gauge] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        """
+        Get or create a counter.
+
+        :param name: metric name.
+        :param description: human readable description.
+        :return: counter.
+        """
+        with self._lock:
+            if name not in self._counters:
+                self._counters[name] = Counter(name, description)
+            return self._counters[name]
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        """
+        Get or create a gauge.
+
+        :param name: metric name.
+        :param description: human readable description.
+        :return: gauge.
+        """
+        with self._lock:
+            if name not in self._gauges:
+                self._gauges[name] = Gauge(name, description)
+            return self._gauges[name]
+
+    def histogram(self, name: str, description: str = "") -> Histogram:
+        """
+        Get or create a histogram.
+
+        :param name: metric name.
+        :param description: human readable description.
+        :return: histogram.
+        """
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, description)
+            return self._histograms[name]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        Current values of all metrics.
+
+        :return: metrics grouped by type.
+        """
+        counters: Dict[str, float] = {}
+        for counter in list(self._counters.values()):
+            counters.update(counter.snapshot())
+        gauges: Dict[str, float] = {}
+        for gauge in list(self._gauges.values()):
+            gauges.update(gauge.snapshot())
+        histograms: Dict[str, float] = {}
+        for histogram in list(self._histograms.values()):
+            histograms.update(histogram.snapshot())
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,398 @@
+import asyncio
+import enum
+import heapq
+import itertools
+import math
+import secrets
+import time
+import uuid
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator, List, Optional, Tuple
+
+from loguru import logger
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from rezai.metrics import metrics
+from rezai.settings import settings
+
+admission_in_flight = metrics.gauge(
+    "admission_in_flight",
+    "Admitted requests running in this worker, per controller.",
+)
+admission_queue_depth = metrics.gauge(
+    "admission_queue_depth",
+    "Requests waiting for admission in this worker, per controller and priority.",
+)
+admission_wait = metrics.histogram(
+    "admission_wait_seconds",
+    "Time admitted requests spent queued, per controller and priority.",
+)
+admission_rejected = metrics.counter(
+    "admission_rejected_total",
+    "Requests turned away, per controller and reason: queue_full when the "
+    "queue had no room, shed when a higher priority request took their "
+    "place, timeout when no slot freed up in time.",
+)
+
+# Semaphore shared by all workers: a sorted set of slot ids scored by
+# their expiry time. Expired slots of crashed workers are dropped first.
+# Returns 1 if a slot was taken.
+ACQUIRE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local ttl = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + ttl, ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(ttl) + 1)
+return 1
+"""
+# Extends the expiry of a slot that is still held.
+RENEW_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local ttl = tonumber(ARGV[2])
+redis.call('ZADD', KEYS[1], 'XX', now + ttl, ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(ttl) + 1)
+return 1
+"""
+
+# How often a request admitted by its worker retries the shared limit,
+# doubled after every try up to the max.
+REDIS_POLL_INTERVAL = 0.05
+REDIS_POLL_MAX_INTERVAL = 0.5
+# Upper bound of the Retry-After sent to rejected requests (seconds).
+MAX_RETRY_AFTER = 60
+
+
+class AdmissionPriority(str, enum.Enum):  # noqa: WPS600
+    """Priority classes of queued requests, high ones are admitted first."""
+
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
+
+_RANKS = {
+    AdmissionPriority.HIGH: 0,
+    AdmissionPriority.NORMAL: 1,
+    AdmissionPriority.LOW: 2,
+}
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is not admitted.
+
+    :param reason: queue_full, shed or timeout.
+    :param retry_after: seconds after which the client may retry.
+    """
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(f"Request not admitted: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# Queued request: rank of its priority, arrival order and the future
+# resolved when a slot is handed over to it.
+_Waiter = Tuple[int, int, AdmissionPriority, "asyncio.Future[None]"]
+
+
+class AdmissionController:
+    """
+    Limits the requests running at once, with a bounded priority queue.
+
+    Up to ``max_concurrency`` requests run at once in the worker. Others
+    wait in a queue of ``queue_size`` requests, by priority then arrival,
+    for up to ``max_wait`` seconds. When the queue is full, a request
+    takes the place of the newest queued one of a lower priority, or is
+    rejected right away. With a redis pool and ``global_max_concurrency``,
+    requests admitted by the worker also take a slot shared by all workers.
+
+    :param name: controller name, for metrics and the redis key.
+    :param max_concurrency: requests running at once per worker, 0 for no limit.
+    :param queue_size: requests waiting per worker.
+    :param max_wait: longest time a request may wait (seconds).
+    :param global_max_concurrency: requests running at once in all workers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        global_max_concurrency: Optional[int] = None,
+    ) -> None:
+        self.name = name
+        self.max_concurrency = (
+            max_concurrency
+            if max_concurrency is not None
+            else settings.admission_max_concurrency
+        )
+        self.queue_size = (
+            queue_size if queue_size is not None else settings.admission_queue_size
+        )
+        self.max_wait = (
+            max_wait if max_wait is not None else settings.admission_max_wait
+        )
+        self.global_max_concurrency = (
+            global_max_concurrency
+            if global_max_concurrency is not None
+            else settings.admission_global_max_concurrency
+        )
+        self.active = 0
+        self._queue: List[_Waiter] = []
+        self._arrivals = itertools.count()
+        # Moving average of how long admitted requests run, for Retry-After.
+        self._hold_time = float(settings.admission_retry_after)
+
+    @property
+    def depth(self) -> int:
+        """
+        Requests waiting for admission.
+
+        :return: queue length.
+        """
+        return len(self._queue)
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        priority: AdmissionPriority = AdmissionPriority.NORMAL,
+        redis_pool: Optional[ConnectionPool] = None,
+    ) -> AsyncIterator[None]:
+        """
+        Run the block once the request is admitted.
+
+        :param priority: priority class of the request.
+        :param redis_pool: redis connection pool for the shared limit.
+        :raises AdmissionRejected: if the request is not admitted.
+        :yield: nothing.
+        """
+        started = time.monotonic()
+        await self._acquire(priority)
+        try:
+            slot = await self._acquire_shared(redis_pool, started + self.max_wait)
+            admitted = time.monotonic()
+            admission_wait.observe(
+                admitted - started,
+                controller=self.name,
+                priority=priority.value,
+            )
+            try:
+                yield
+            finally:
+                held = time.monotonic() - admitted
+                self._hold_time += 0.2 * (held - self._hold_time)
+                if slot is not None:
+                    await slot.release()
+        finally:
+            self._release()
+
+    def retry_after(self) -> int:
+        """
+        Seconds after which a rejected request may find a free slot.
+
+        :return: Retry-After in seconds.
+        """
+        per_slot = self._hold_time / max(self.max_concurrency, 1)
+        estimate = math.ceil(per_slot * (self.depth + 1))
+        return min(max(estimate, settings.admission_retry_after), MAX_RETRY_AFTER)
+
+    async def _acquire(self, priority: AdmissionPriority) -> None:
+        if self.max_concurrency <= 0 or (
+            self.active < self.max_concurrency and not self._queue
+        ):
+            self._set_active(self.active + 1)
+            return
+        rank = _RANKS[priority]
+        if len(self._queue) >= self.queue_size:
+            self._shed(rank)
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        waiter = (rank, next(self._arrivals), priority, future)
+        heapq.heappush(self._queue, waiter)
+        admission_queue_depth.inc(controller=self.name, priority=priority.value)
+        try:
+            done, _ = await asyncio.wait({future}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not done:
+            self._abandon(waiter)
+            raise self._reject("timeout")
+        # Raises AdmissionRejected if a higher priority request took the place.
+        future.result()
+
+    def _shed(self, rank: int) -> None:
+        if not self._queue:
+            raise self._reject("queue_full")
+        lowest = max(self._queue, key=lambda waiter: (waiter[0], waiter[1]))
+        if lowest[0] <= rank:
+            raise self._reject("queue_full")
+        self._dequeue(lowest)
+        lowest[3].set_exception(self._reject("shed"))
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        future = waiter[3]
+        if not future.done():
+            future.cancel()
+            self._dequeue(waiter)
+        elif not future.cancelled() and future.exception() is None:
+            # The slot was handed over just as the wait ended.
+            self._release()
+
+    def _release(self) -> None:
+        while self._queue:
+            waiter = heapq.heappop(self._queue)
+            admission_queue_depth.inc(
+                -1,
+                controller=self.name,
+                priority=waiter[2].value,
+            )
+            if not waiter[3].done():
+                waiter[3].set_result(None)
+                return
+        self._set_active(self.active - 1)
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        self._queue.remove(waiter)
+        heapq.heapify(self._queue)
+        admission_queue_depth.inc(-1, controller=self.name, priority=waiter[2].value)
+
+    def _set_active(self, active: int) -> None:
+        self.active = active
+        admission_in_flight.set(active, controller=self.name)
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        admission_rejected.inc(controller=self.name, reason=reason)
+        return AdmissionRejected(reason, self.retry_after())
+
+    async def _acquire_shared(
+        self,
+        redis_pool: Optional[ConnectionPool],
+        deadline: float,
+    ) -> Optional["SharedSlot"]:
+        if redis_pool is None or self.global_max_concurrency <= 0:
+            return None
+        slot = SharedSlot(redis_pool, f"admission:{self.name}")
+        interval = REDIS_POLL_INTERVAL
+        while True:
+            acquired = await slot.acquire(self.global_max_concurrency)
+            if acquired:
+                return slot
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._reject("timeout")
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, REDIS_POLL_MAX_INTERVAL)
+
+
+class SharedSlot:
+    """
+    Slot of a concurrency limit shared by all workers through redis.
+
+    A held slot is renewed every third of ``admission_slot_ttl``, so the
+    slots of a crashed worker free up after that long.
+
+    :param redis_pool: redis connection pool.
+    :param key: redis key of the limit.
+    """
+
+    def __init__(self, redis_pool: ConnectionPool, key: str) -> None:
+        self.redis_pool = redis_pool
+        self.key = key
+        self.slot_id = uuid.uuid4().hex
+        self._renewal: "Optional[asyncio.Task[None]]" = None
+
+    async def acquire(self, limit: int) -> bool:
+        """
+        Try to take a slot.
+
+        If redis is unavailable the request is let through.
+
+        :param limit: slots of the limit.
+        :return: True if taken.
+        """
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                acquired = await redis.eval(
+                    ACQUIRE_SCRIPT,
+                    1,
+                    self.key,
+                    self.slot_id,
+                    limit,
+                    settings.admission_slot_ttl,
+                )
+        except RedisError as exc:
+            logger.warning("Shared admission limit is unavailable: {}", exc)
+            return True
+        if not int(acquired):
+            return False
+        self._renewal = asyncio.ensure_future(self._renew())
+        return True
+
+    async def release(self) -> None:
+        """Give the slot back."""
+        if self._renewal is not None:
+            self._renewal.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._renewal
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                await redis.zrem(self.key, self.slot_id)
+        except RedisError as exc:
+            logger.warning("Shared admission limit is unavailable: {}", exc)
+
+    async def _renew(self) -> None:
+        ttl = settings.admission_slot_ttl
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                async with Redis(connection_pool=self.redis_pool) as redis:
+                    await redis.eval(RENEW_SCRIPT, 1, self.key, self.slot_id, ttl)
+            except RedisError as exc:
+                logger.warning("Shared admission limit is unavailable: {}", exc)
+
+
+def parse_priority(raw: Optional[str], trusted: bool = False) -> AdmissionPriority:
+    """
+    Priority class named by a client, normal if missing or unknown.
+
+    The header is sent by the client, so it is not trusted: any caller
+    may lower its priority, but only trusted callers, internal services
+    proving it with ``admission_internal_token``, may raise it to high
+    and jump the queue ahead of other users. Others are capped at normal.
+
+    :param raw: header value.
+    :param trusted: whether the caller may ask for high priority.
+    :return: priority class.
+    """
+    try:
+        priority = AdmissionPriority((raw or "").strip().lower())
+    except ValueError:
+        return AdmissionPriority.NORMAL
+    if priority == AdmissionPriority.HIGH and not trusted:
+        return AdmissionPriority.NORMAL
+    return priority
+
+
+def is_internal_caller(token: Optional[str]) -> bool:
+    """
+    Whether a request proves it comes from an internal service.
+
+    :param token: value of the X-Internal-Token header.
+    :return: true if it matches ``admission_internal_token``.
+    """
+    expected = settings.admission_internal_token
+    if not expected or token is None:
+        return False
+    return secrets.compare_digest(token.encode(), expected.encode())
+
+
+# Admission of chat turns in this worker.
+chat_admission = AdmissionController("chat")
@@ -0,0 +1 @@
+"""Shared HTTP client for outbound provider calls."""
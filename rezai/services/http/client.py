@@ -0,0 +1,51 @@
+from typing import Dict, Optional
+
+import httpx
+
+from rezai.settings import settings
+
+
+def create_http_client(
+    base_url: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> httpx.AsyncClient:
+    """
+    Creates long-lived HTTP client for a provider.
+
+    The client keeps connections alive between calls,
+    so DNS, TCP and TLS setup is paid once per connection
+    instead of once per request.
+
+    :param base_url: base URL of the provider API.
+    :param headers: headers to send with every request.
+    :return: pooled async HTTP client.
+    """
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        http2=settings.http2,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            settings.http_timeout,
+            connect=settings.http_connect_timeout,
+        ),
+    )
+
+
+def describe_error(exc: BaseException) -> str:
+    """
+    Describe a provider error without its details, safe to send to clients.
+
+    Exception messages of httpx contain the request URL, and with it
+    the API key passed as a query parameter.
+
+    :param exc: error of a provider call.
+    :return: status code for HTTP errors, otherwise the error type.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return f"HTTP {exc.response.status_code}"
+    return type(exc).__name__
@@ -0,0 +1,158 @@
+import asyncio
+from typing import Optional
+
+from loguru import logger
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from rezai.metrics import metrics
+from rezai.settings import settings
+
+ratelimit_wait = metrics.histogram(
+    "ratelimit_wait_seconds",
+    "Time callers spent queued by the shared rate limiter, per bucket.",
+)
+ratelimit_rejected = metrics.counter(
+    "ratelimit_rejected_total",
+    "Calls rejected because the queue wait would exceed the limit.",
+)
+
+# Token bucket that lets callers reserve tokens ahead of time.
+# The balance may go negative: every caller gets the next free slot
+# in arrival order and sleeps until then, which keeps the queue fair.
+# Returns the seconds to wait, or -1 if the wait would exceed max_wait.
+RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local max_wait = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens < cost then
+    wait = (cost - tokens) / rate
+end
+if max_wait >= 0 and wait > max_wait then
+    return '-1'
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - cost), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate + wait) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would have to wait longer than allowed."""
+
+
+class TokenBucket:
+    """
+    Token bucket shared by all workers through redis.
+
+    :param redis_pool: redis connection pool.
+    :param name: bucket name, usually the provider.
+    :param rate: tokens added per second.
+    :param capacity: maximum burst size.
+    :param max_wait: longest time a caller may be queued.
+    """
+
+    def __init__(
+        self,
+        redis_pool: ConnectionPool,
+        name: str,
+        rate: float,
+        capacity: Optional[float] = None,
+        max_wait: Optional[float] = None,
+    ) -> None:
+        self.redis_pool = redis_pool
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.max_wait = (
+            max_wait if max_wait is not None else settings.ratelimit_max_wait
+        )
+
+    async def acquire(self, cost: float = 1) -> None:
+        """
+        Take tokens from the bucket, waiting for a free slot if needed.
+
+        If redis is unavailable the call is let through.
+
+        :param cost: number of tokens to take.
+        :raises RateLimitExceeded: if the wait would exceed max_wait.
+        """
+        wait = await self._reserve(cost, self.max_wait)
+        if wait is None:
+            return
+        if wait < 0:
+            ratelimit_rejected.inc(bucket=self.name)
+            raise RateLimitExceeded(
+                f"{self.name} is rate limited, retry in a moment.",
+            )
+        ratelimit_wait.observe(wait, bucket=self.name)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def try_acquire(self, cost: float = 1) -> bool:
+        """
+        Take tokens only if they are free now, without waiting.
+
+        If redis is unavailable the call is let through.
+
+        :param cost: number of tokens to take.
+        :return: True if the tokens were taken.
+        """
+        wait = await self._reserve(cost, 0)
+        return wait is None or wait >= 0
+
+    async def debit(self, cost: float) -> None:
+        """
+        Take tokens without waiting.
+
+        Used to charge usage that is only known after the call,
+        later callers wait until the balance recovers.
+
+        :param cost: number of tokens to take, may be negative to refund.
+        """
+        await self._reserve(cost, -1)
+
+    async def _reserve(self, cost: float, max_wait: float) -> Optional[float]:
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                wait = await redis.eval(
+                    RESERVE_SCRIPT,
+                    1,
+                    f"ratelimit:{self.name}",
+                    self.rate,
+                    self.capacity,
+                    cost,
+                    max_wait,
+                )
+        except RedisError as exc:
+            logger.warning("Rate limiter {} is unavailable: {}", self.name, exc)
+            return None
+        return float(wait)
+
+
+def create_bucket(
+    redis_pool: Optional[ConnectionPool],
+    name: str,
+    rate: float,
+    capacity: Optional[float] = None,
+) -> Optional[TokenBucket]:
+    """
+    Create token bucket if rate limiting is enabled.
+
+    :param redis_pool: redis connection pool.
+    :param name: bucket name.
+    :param rate: tokens added per second, 0 disables the bucket.
+    :param capacity: maximum burst size.
+    :return: token bucket or None.
+    """
+    if redis_pool is None or not settings.ratelimit_enabled or rate <= 0:
+        return None
+    return TokenBucket(redis_pool, name, rate, capacity)
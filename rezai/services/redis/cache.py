@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from loguru import logger
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from rezai.metrics import metrics
+
+cache_requests = metrics.counter(
+    "cache_requests_total",
+    "Cache lookups split by cache name and result (hit, miss, stale).",
+)
+
+# Background refreshes in progress, shared by all caches of the worker.
+_refreshing: Dict[str, "asyncio.Task[Any]"] = {}
+
+
+def normalize_key_part(part: str) -> str:
+    """
+    Normalize a part of a cache key.
+
+    Lowercases the value and collapses whitespace,
+    so "Sushi  in Austin" and "sushi in austin" share an entry.
+
+    :param part: raw key part.
+    :return: normalized key part.
+    """
+    return " ".join(part.lower().split())
+
+
+class RedisCache:
+    """
+    Stale-while-revalidate JSON cache stored in redis.
+
+    Entries are fresh for ``ttl`` seconds. After that they are
+    served for another ``stale_ttl`` seconds while a single
+    background task refreshes them.
+    """
+
+    def __init__(
+        self,
+        redis_pool: ConnectionPool,
+        name: str,
+        ttl: int,
+        stale_ttl: int = 0,
+    ) -> None:
+        self.redis_pool = redis_pool
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+    def make_key(self, parts: Sequence[str]) -> str:
+        """
+        Build redis key from the normalized key parts.
+
+        :param parts: parts of the key.
+        :return: redis key.
+        """
+        raw = "\x1f".join(normalize_key_part(part) for part in parts)
+        digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        return f"cache:{self.name}:{digest}"
+
+    async def get_or_fetch(
+        self,
+        parts: Sequence[str],
+        fetch: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Return cached value or fetch and store a new one.
+
+        :param parts: parts of the key.
+        :param fetch: coroutine function producing the value.
+        :return: cached or fetched value.
+        """
+        key = self.make_key(parts)
+        entry = await self._load(key)
+        if entry is None:
+            cache_requests.inc(cache=self.name, result="miss")
+            value = await fetch()
+            await self._store(key, value)
+            return value
+        if entry["fresh_until"] < time.time():
+            cache_requests.inc(cache=self.name, result="stale")
+            self._schedule_refresh(key, fetch)
+        else:
+            cache_requests.inc(cache=self.name, result="hit")
+        return entry["value"]
+
+    async def get(self, parts: Sequence[str]) -> Optional[Any]:
+        """
+        Return cached value without fetching on a miss.
+
+        :param parts: parts of the key.
+        :return: cached value or None.
+        """
+        entry = await self._load(self.make_key(parts))
+        if entry is None or entry["fresh_until"] < time.time():
+            cache_requests.inc(cache=self.name, result="miss")
+            return None
+        cache_requests.inc(cache=self.name, result="hit")
+        return entry["value"]
+
+    async def set(self, parts: Sequence[str], value: Any) -> None:  # noqa: WPS125
+        """
+        Store a value.
+
+        :param parts: parts of the key.
+        :param value: JSON-serializable value.
+        """
+        await self._store(self.make_key(parts), value)
+
+    async def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                raw = await redis.get(key)
+        except RedisError as exc:
+            logger.warning("Cache {} is unavailable: {}", self.name, exc)
+            return None
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def _store(self, key: str, value: Any) -> None:
+        entry = {"fresh_until": time.time() + self.ttl, "value": value}
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                await redis.set(
+                    key,
+                    json.dumps(entry),
+                    ex=max(self.ttl + self.stale_ttl, 1),
+                )
+        except RedisError as exc:
+            logger.warning("Cache {} is unavailable: {}", self.name, exc)
+
+    def _schedule_refresh(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+    ) -> None:
+        if key in _refreshing:
+            return
+        task = asyncio.create_task(self._refresh(key, fetch))
+        _refreshing[key] = task
+        task.add_done_callback(lambda _: _refreshing.pop(key, None))
+
+    async def _refresh(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            value = await fetch()
+        except Exception as exc:
+            logger.warning("Failed to refresh {} entry: {}", self.name, exc)
+            return
+        await self._store(key, value)
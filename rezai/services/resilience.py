@@ -0,0 +1,250 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional, Set
+
+import httpx
+from loguru import logger
+
+from rezai.metrics import metrics
+from rezai.services.ratelimit import TokenBucket
+from rezai.settings import settings
+
+circuit_transitions = metrics.counter(
+    "circuit_breaker_transitions_total",
+    "Circuit breaker state changes per provider.",
+)
+circuit_rejected = metrics.counter(
+    "circuit_breaker_rejected_total",
+    "Calls failed fast because the provider circuit was open.",
+)
+hedge_requests = metrics.counter(
+    "hedge_requests_total",
+    "Hedged duplicate requests per provider, split by whether they won.",
+)
+hedge_skipped = metrics.counter(
+    "hedge_skipped_total",
+    "Hedged requests not sent because the provider rate limit had no free token.",
+)
+
+# Latency samples needed before the hedge delay follows the percentile.
+MIN_LATENCY_SAMPLES = 20
+
+
+class ProviderUnavailableError(Exception):
+    """Raised while a provider is considered unhealthy."""
+
+
+def is_provider_failure(exc: BaseException) -> bool:
+    """
+    Whether an error means the provider itself is unhealthy.
+
+    Client errors such as 404 do not count against the provider.
+
+    :param exc: raised error.
+    :return: True for timeouts, transport errors, 429 and 5xx responses.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == httpx.codes.TOO_MANY_REQUESTS or status >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+class CircuitBreaker:
+    """
+    Per-worker circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. Then a single trial call
+    is let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def before_call(self) -> None:
+        """
+        Check that a call may go to the provider.
+
+        :raises ProviderUnavailableError: if the circuit is open.
+        """
+        if self.state == "closed":
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == "open" and elapsed >= self.reset_timeout:
+            self._transition("half_open")
+            return
+        circuit_rejected.inc(provider=self.name)
+        raise ProviderUnavailableError(
+            f"{self.name} is temporarily unavailable. "
+            "Use lookup_restaurants to search our own restaurant database instead.",
+        )
+
+    def record_success(self) -> None:
+        """Register a successful call."""
+        self.failures = 0
+        if self.state != "closed":
+            self._transition("closed")
+
+    def record_failure(self) -> None:
+        """Register a failed call."""
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.state != "open":
+                self._transition("open")
+
+    def record_abort(self) -> None:
+        """Register a call that was cancelled before it finished."""
+        if self.state == "half_open":
+            # Let the next call run the trial instead.
+            self.state = "open"
+            self.opened_at = time.monotonic() - self.reset_timeout
+
+    def _transition(self, state: str) -> None:
+        logger.warning("Circuit of {} is now {}", self.name, state)
+        self.state = state
+        circuit_transitions.inc(provider=self.name, state=state)
+
+
+class LatencyTracker:
+    """Keeps recent latencies to derive the hedge delay."""
+
+    def __init__(self, size: int = 200) -> None:
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, latency: float) -> None:
+        """
+        Record latency of a successful call.
+
+        :param latency: call duration in seconds.
+        """
+        self.samples.append(latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        Latency percentile over the recent samples.
+
+        :param percent: percentile between 0 and 100.
+        :return: latency in seconds or None without enough samples.
+        """
+        if len(self.samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+
+async def _first_success(tasks: Set["asyncio.Task[Any]"]) -> "asyncio.Task[Any]":
+    error: Optional[BaseException] = None
+    pending = tasks
+    while pending:
+        done, pending = await asyncio.wait(
+            pending,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        for task in done:
+            if task.exception() is None:
+                return task
+            error = task.exception()
+    raise error  # type: ignore
+
+
+class ProviderGuard:
+    """
+    Tail-latency controls for one provider.
+
+    Calls go through a circuit breaker. If a call is slower than the
+    configured latency percentile, a duplicate request is sent and the
+    first successful response wins. The duplicate takes its own token of
+    the provider rate limit, and is not sent when no token is free.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=settings.circuit_failure_threshold,
+            reset_timeout=settings.circuit_reset_timeout,
+        )
+        self.latencies = LatencyTracker()
+
+    def hedge_delay(self) -> float:
+        """
+        Delay after which a duplicate request is sent.
+
+        :return: delay in seconds.
+        """
+        delay = self.latencies.percentile(settings.hedge_percentile)
+        if delay is None:
+            return settings.hedge_max_delay
+        return min(max(delay, settings.hedge_min_delay), settings.hedge_max_delay)
+
+    async def call(
+        self,
+        request: Callable[[], Awaitable[Any]],
+        rate_limiter: Optional[TokenBucket] = None,
+    ) -> Any:
+        """
+        Perform a provider request with breaker and hedging.
+
+        :param request: coroutine function sending one request.
+        :param rate_limiter: rate limit of the provider, the caller has
+            taken the token of the first request already.
+        :return: response of the first successful request.
+        """
+        self.breaker.before_call()
+        started = time.monotonic()
+        try:
+            response = await self._hedged(request, rate_limiter)
+        except asyncio.CancelledError:
+            self.breaker.record_abort()
+            raise
+        except Exception as exc:
+            if is_provider_failure(exc):
+                self.breaker.record_failure()
+            else:
+                # The provider answered, which completes a half-open trial.
+                self.breaker.record_success()
+            raise
+        self.latencies.observe(time.monotonic() - started)
+        self.breaker.record_success()
+        return response
+
+    async def _hedged(
+        self,
+        request: Callable[[], Awaitable[Any]],
+        rate_limiter: Optional[TokenBucket],
+    ) -> Any:
+        primary = asyncio.ensure_future(request())
+        if not settings.hedge_enabled:
+            return await primary
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if done:
+                return primary.result()
+            if rate_limiter is not None and not await rate_limiter.try_acquire():
+                hedge_skipped.inc(provider=self.name)
+                return await primary
+            hedge = asyncio.ensure_future(request())
+            tasks.add(hedge)
+            winner = await _first_success(tasks)
+            hedge_requests.inc(provider=self.name, won=winner is hedge)
+            return winner.result()
+        finally:
+            for task in tasks:
+                if task.done() and not task.cancelled():
+                    # Mark errors of the losing request as retrieved.
+                    task.exception()
+                task.cancel()
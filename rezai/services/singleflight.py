@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import json
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from loguru import logger
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from rezai.metrics import metrics
+from rezai.settings import settings
+
+singleflight_calls = metrics.counter(
+    "singleflight_calls_total",
+    "Upstream calls split by group and role. "
+    "Followers are duplicate calls that shared another call's result, "
+    "cancelled are calls stopped because all their callers went away.",
+)
+
+# How often workers that lost the redis lock check for the leader's result.
+REDIS_POLL_INTERVAL = 0.05
+# Takes the lock and drops the result of an earlier flight, so followers
+# only read the result of the flight they wait for. Returns 1 if taken.
+ACQUIRE_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    redis.call('DEL', KEYS[2])
+    return 1
+end
+return 0
+"""
+# Deletes the lock only if it is still held by the caller. A fetch that
+# outlived the lock timeout must not release the lock of the next leader.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one upstream request.
+
+    Within a worker, callers with the same key await the same task.
+    The task is cancelled when every caller waiting for it was cancelled,
+    so nobody pays for a call whose result nobody reads.
+    When a redis pool is given and ``singleflight_redis_enabled``
+    is set, a redis lock extends this across workers: the worker
+    holding the lock publishes the result and the others pick it up.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._in_flight: Dict[str, "asyncio.Task[Any]"] = {}
+        self._waiters: Dict[str, int] = {}
+
+    async def do(
+        self,
+        key_parts: Sequence[str],
+        fetch: Callable[[], Awaitable[Any]],
+        redis_pool: Optional[ConnectionPool] = None,
+    ) -> Any:
+        """
+        Run fetch once for all concurrent callers with the same key.
+
+        :param key_parts: arguments identifying the call.
+        :param fetch: coroutine function performing the upstream call.
+        :param redis_pool: redis pool used for cross-worker coalescing.
+        :return: result of the shared call.
+        """
+        raw = "\x1f".join(key_parts)
+        key = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        task = self._in_flight.get(key)
+        if task is None:
+            singleflight_calls.inc(group=self.name, role="leader")
+            if redis_pool is not None and settings.singleflight_redis_enabled:
+                task = asyncio.ensure_future(self._do_locked(key, fetch, redis_pool))
+            else:
+                task = asyncio.ensure_future(fetch())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            singleflight_calls.inc(group=self.name, role="follower")
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            # Shielded so a cancelled caller does not cancel the call for the others.
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not task.done():
+                singleflight_calls.inc(group=self.name, role="cancelled")
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                self._waiters.pop(key)
+
+    def _forget(self, key: str, task: "asyncio.Task[Any]") -> None:
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away.
+            task.exception()
+
+    async def _do_locked(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        redis_pool: ConnectionPool,
+    ) -> Any:
+        lock_key = f"singleflight:{self.name}:{key}:lock"
+        result_key = f"singleflight:{self.name}:{key}:result"
+        timeout_ms = int(settings.singleflight_lock_timeout * 1000)
+        owner = uuid.uuid4().hex
+        raw_result = None
+        try:
+            async with Redis(connection_pool=redis_pool) as redis:
+                acquired = await redis.eval(
+                    ACQUIRE_SCRIPT,
+                    2,
+                    lock_key,
+                    result_key,
+                    owner,
+                    timeout_ms,
+                )
+                if not acquired:
+                    raw_result = await self._wait_for_result(
+                        redis,
+                        lock_key,
+                        result_key,
+                    )
+        except RedisError as exc:
+            logger.warning("Single-flight lock {} is unavailable: {}", self.name, exc)
+            return await fetch()
+        if not acquired:
+            if raw_result is not None:
+                singleflight_calls.inc(group=self.name, role="remote_follower")
+                return json.loads(raw_result)
+            return await fetch()
+        try:
+            value = await fetch()
+            await self._publish(redis_pool, result_key, value, timeout_ms)
+            return value
+        finally:
+            await self._release(redis_pool, lock_key, owner)
+
+    async def _publish(
+        self,
+        redis_pool: ConnectionPool,
+        result_key: str,
+        value: Any,
+        timeout_ms: int,
+    ) -> None:
+        # Failing to publish only costs the followers a call of their own.
+        try:
+            async with Redis(connection_pool=redis_pool) as redis:
+                await redis.set(result_key, json.dumps(value), px=timeout_ms)
+        except RedisError as exc:
+            logger.warning("Single-flight lock {} is unavailable: {}", self.name, exc)
+
+    async def _release(
+        self,
+        redis_pool: ConnectionPool,
+        lock_key: str,
+        owner: str,
+    ) -> None:
+        try:
+            async with Redis(connection_pool=redis_pool) as redis:
+                await redis.eval(RELEASE_SCRIPT, 1, lock_key, owner)
+        except RedisError as exc:
+            logger.warning("Single-flight lock {} is unavailable: {}", self.name, exc)
+
+    async def _wait_for_result(
+        self,
+        redis: Redis,
+        lock_key: str,
+        result_key: str,
+    ) -> Optional[bytes]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.singleflight_lock_timeout
+        while loop.time() < deadline:
+            raw_result = await redis.get(result_key)
+            if raw_result is not None:
+                return raw_result
+            if not await redis.exists(lock_key):
+                # The leader failed without publishing a result.
+                return await redis.get(result_key)
+            await asyncio.sleep(REDIS_POLL_INTERVAL)
+        return None
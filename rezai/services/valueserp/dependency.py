@@ -0,0 +1,28 @@
+from fastapi import Depends
+from redis.asyncio import ConnectionPool
+from starlette.requests import Request
+
+from rezai.db.dao.place_details_dao import PlaceDetailsDAO
+from rezai.services.redis.dependency import get_redis_pool
+from rezai.services.valueserp.service import ValueSerpService
+
+
+def get_valueserp_service(
+    request: Request,
+    redis_pool: ConnectionPool = Depends(get_redis_pool),
+    place_details_dao: PlaceDetailsDAO = Depends(),
+) -> ValueSerpService:  # pragma: no cover
+    """
+    Returns ValueSerp service bound to the shared HTTP client.
+
+    :param request: current request.
+    :param redis_pool: redis connection pool for the search cache.
+    :param place_details_dao: DAO for the stored place details.
+    :return: ValueSerp service.
+    """
+    return ValueSerpService(
+        client=request.app.state.valueserp_client,
+        redis_pool=redis_pool,
+        place_details_dao=place_details_dao,
+        prefetcher=request.app.state.valueserp_prefetcher,
+    )
@@ -0,0 +1,40 @@
+from fastapi import FastAPI
+
+from rezai.services.http.client import create_http_client
+from rezai.services.valueserp.prefetch import PlaceDetailsPrefetcher
+from rezai.services.valueserp.service import VALUESERP_BASE_URL
+from rezai.settings import settings
+
+
+def init_valueserp(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Creates pooled HTTP client for ValueSerp.
+
+    When ``valueserp_prefetch_enabled`` is set, also creates
+    the place details prefetcher shared by all requests.
+
+    :param app: current fastapi application.
+    """
+    app.state.valueserp_client = create_http_client(VALUESERP_BASE_URL)
+    app.state.valueserp_prefetcher = None
+    if settings.valueserp_prefetch_enabled:
+        app.state.valueserp_prefetcher = PlaceDetailsPrefetcher(
+            client=app.state.valueserp_client,
+            redis_pool=app.state.redis_pool,
+            session_factory=app.state.db_session_factory,
+        )
+
+
+async def shutdown_valueserp(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Closes ValueSerp HTTP client.
+
+    The prefetcher is closed first. Its cancelled prefetches still
+    close their database sessions, so this runs before the database
+    and redis are shut down.
+
+    :param app: current FastAPI app.
+    """
+    if app.state.valueserp_prefetcher is not None:
+        await app.state.valueserp_prefetcher.close()
+    await app.state.valueserp_client.aclose()
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Sequence, Tuple
+
+import httpx
+from loguru import logger
+from redis.asyncio import ConnectionPool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from rezai.db.dao.place_details_dao import PlaceDetailsDAO
+from rezai.metrics import metrics
+from rezai.services.valueserp.service import ValueSerpService
+from rezai.settings import settings
+
+place_details_prefetch = metrics.counter(
+    "valueserp_prefetch_total",
+    "Speculative place details fetches. scheduled: fetches started after a "
+    "search, hit/miss: details lookups served or not by a prefetch.",
+)
+
+
+class PlaceDetailsPrefetcher:
+    """
+    Fetches place details of the top search results in the background.
+
+    After a places search the agent usually asks for the details of the
+    first results. The prefetcher starts those fetches right away, at most
+    ``valueserp_prefetch_concurrency`` at a time, and keeps them for
+    ``valueserp_prefetch_ttl`` seconds so the follow-up lookup only has
+    to await a task that is running or already done. Fetched details are
+    written back with a session of their own, warming the stored details
+    for the other workers too.
+
+    The hit ratio (hit / scheduled) tells how useful ``valueserp_prefetch_top_k``
+    is: a low ratio means too many places are fetched for nothing.
+
+    :param client: ValueSerp HTTP client.
+    :param redis_pool: redis connection pool.
+    :param session_factory: factory for the write-back database sessions.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        redis_pool: Optional[ConnectionPool] = None,
+        session_factory: Optional["async_sessionmaker[AsyncSession]"] = None,
+    ) -> None:
+        self.client = client
+        self.redis_pool = redis_pool
+        self.session_factory = session_factory
+        self.semaphore = asyncio.Semaphore(settings.valueserp_prefetch_concurrency)
+        self._entries: "OrderedDict[str, Tuple[float, asyncio.Task[Any]]]" = (
+            OrderedDict()
+        )
+
+    def schedule(self, data_cids: Sequence[str]) -> None:
+        """
+        Start fetching the details of the top places of a search.
+
+        :param data_cids: data CIDs of the results, best first.
+        """
+        self._expire()
+        top_cids = [cid for cid in data_cids if cid][
+            : settings.valueserp_prefetch_top_k
+        ]
+        for data_cid in top_cids:
+            if data_cid in self._entries:
+                continue
+            place_details_prefetch.inc(result="scheduled")
+            task = asyncio.ensure_future(self._prefetch(data_cid))
+            task.add_done_callback(_retrieve_exception)
+            self._entries[data_cid] = (time.monotonic(), task)
+        while len(self._entries) > settings.valueserp_prefetch_max_entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            evicted.cancel()
+
+    async def get(self, data_cid: str) -> Optional[Any]:  # noqa: WPS615
+        """
+        Details of a place, if they were prefetched.
+
+        :param data_cid: data CID of the place.
+        :return: prefetched details, or None when the caller has to fetch.
+        """
+        self._expire()
+        entry = self._entries.get(data_cid)
+        if entry is None:
+            place_details_prefetch.inc(result="miss")
+            return None
+        task = entry[1]
+        try:
+            # Shielded so a cancelled tool call keeps the prefetch for others.
+            place_details = await asyncio.shield(task)
+        except Exception:
+            place_details_prefetch.inc(result="miss")
+            return None
+        place_details_prefetch.inc(result="hit")
+        return place_details
+
+    async def close(self) -> None:
+        """Cancel the prefetches still running."""
+        tasks = [task for _, task in self._entries.values()]
+        self._entries.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _expire(self) -> None:
+        expired_before = time.monotonic() - settings.valueserp_prefetch_ttl
+        while self._entries:
+            created, task = next(iter(self._entries.values()))
+            if created >= expired_before:
+                break
+            self._entries.popitem(last=False)
+            task.cancel()
+
+    async def _prefetch(self, data_cid: str) -> Any:
+        async with self.semaphore:
+            if self.session_factory is None:
+                service = ValueSerpService(self.client, self.redis_pool)
+                return await service.get_place_details(data_cid)
+            async with self.session_factory() as session:
+                service = ValueSerpService(
+                    self.client,
+                    self.redis_pool,
+                    place_details_dao=PlaceDetailsDAO(session),
+                )
+                place_details = await service.get_place_details(data_cid)
+                await session.commit()
+                return place_details
+
+
+def _retrieve_exception(task: "asyncio.Task[Any]") -> None:
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.warning("Place details prefetch failed: {}", exc)
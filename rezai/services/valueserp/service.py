@@ -1,34 +1,220 @@
 # rezai/services/valueserp/service.py
-from typing import Any
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
 
 import httpx
+from loguru import logger
+from redis.asyncio import ConnectionPool
 
+from rezai.db.dao.place_details_dao import PlaceDetailsDAO
+from rezai.db.models.place_details_model import StoredPlaceDetails
+from rezai.services.ratelimit import create_bucket
+from rezai.services.redis.cache import RedisCache, cache_requests
+from rezai.services.resilience import ProviderGuard, ProviderUnavailableError
+from rezai.services.singleflight import SingleFlight
 from rezai.settings import settings
 
+if TYPE_CHECKING:
+    from rezai.services.valueserp.prefetch import PlaceDetailsPrefetcher
+
+VALUESERP_BASE_URL = "https://api.valueserp.com"
+
+search_places_flight = SingleFlight("valueserp_search_places")
+place_details_flight = SingleFlight("valueserp_place_details")
+valueserp_guard = ProviderGuard("ValueSerp")
+
+
+class PlaceDetailsResult(NamedTuple):
+    """Outcome of fetching details for one place in a batch."""
+
+    data_cid: str
+    place_details: Any = None
+    error: Optional[Exception] = None
+
 
 class ValueSerpService:
-    def __init__(self, api_key: str = settings.valueserp_api_key):
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        redis_pool: Optional[ConnectionPool] = None,
+        place_details_dao: Optional[PlaceDetailsDAO] = None,
+        api_key: str = settings.valueserp_api_key,
+        prefetcher: Optional["PlaceDetailsPrefetcher"] = None,
+    ):
+        self.client = client
+        self.prefetcher = prefetcher
         self.api_key = api_key
-        self.base_url = "https://api.valueserp.com/search"
+        self.redis_pool = redis_pool
+        self.place_details_dao = place_details_dao
+        self.rate_limiter = create_bucket(
+            redis_pool,
+            "valueserp",
+            settings.valueserp_requests_per_second,
+        )
+        self.search_cache: Optional[RedisCache] = None
+        if redis_pool is not None:
+            self.search_cache = RedisCache(
+                redis_pool,
+                name="valueserp_search_places",
+                ttl=settings.valueserp_search_cache_ttl,
+                stale_ttl=settings.valueserp_search_cache_stale_ttl,
+            )
+
+    async def search_places(
+        self,
+        query: str,
+        location: str,
+        gl: str = "us",
+        hl: str = "en",
+    ) -> list[Any]:
+        if self.search_cache is None:
+            places = await self._fetch_places(query, location, gl, hl)
+        else:
+            places = await self.search_cache.get_or_fetch(
+                (query, location, gl, hl),
+                lambda: self._fetch_places(query, location, gl, hl),
+            )
+        if self.prefetcher is not None:
+            self.prefetcher.schedule([place.get("data_cid") for place in places])
+        return places
+
+    async def get_place_details(self, data_cid: str) -> Any:
+        if self.prefetcher is not None:
+            place_details = await self.prefetcher.get(data_cid)
+            if place_details is not None:
+                return place_details
+        if self.place_details_dao is None:
+            return await self._fetch_place_details(data_cid)
+        stored = await self.place_details_dao.get_place_details(data_cid)
+        if self._is_fresh(stored):
+            return stored.payload  # type: ignore
+        try:
+            place_details = await self._fetch_place_details(data_cid)
+        except (httpx.HTTPError, ProviderUnavailableError) as exc:
+            if stored is None:
+                raise
+            logger.warning("Serving stale details for {}: {}", data_cid, exc)
+            return stored.payload
+        if place_details is not None:
+            await self.place_details_dao.upsert_place_details(data_cid, place_details)
+        return place_details
+
+    async def get_place_details_many(
+        self,
+        data_cids: Sequence[str],
+    ) -> AsyncIterator[PlaceDetailsResult]:
+        """
+        Get details for many places, yielding each result as it finishes.
+
+        Stored rows are read with one query. The remaining places are
+        fetched concurrently, at most ``valueserp_batch_concurrency`` at
+        a time. Failures are reported per item instead of failing the batch.
+
+        :param data_cids: The data CIDs of the places.
+        :yield: result for every unique data CID.
+        """
+        unique_cids = list(dict.fromkeys(data_cids))
+        stored: Dict[str, StoredPlaceDetails] = {}
+        if self.place_details_dao is not None:
+            stored = await self.place_details_dao.get_many_place_details(unique_cids)
+        pending = []
+        for data_cid in unique_cids:
+            row = stored.get(data_cid)
+            if self.place_details_dao is not None and self._is_fresh(row):
+                yield PlaceDetailsResult(data_cid, row.payload)  # type: ignore
+            else:
+                pending.append(data_cid)
 
-    async def search_places(self, query: str, location: str) -> list[Any]:
+        semaphore = asyncio.Semaphore(settings.valueserp_batch_concurrency)
+
+        async def fetch_one(data_cid: str) -> PlaceDetailsResult:  # noqa: WPS430
+            async with semaphore:
+                try:
+                    place_details = await self._fetch_place_details(data_cid)
+                except Exception as exc:
+                    return PlaceDetailsResult(data_cid, error=exc)
+            return PlaceDetailsResult(data_cid, place_details)
+
+        tasks = [asyncio.ensure_future(fetch_one(data_cid)) for data_cid in pending]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                row = stored.get(result.data_cid)
+                if result.error is not None and row is not None:
+                    yield PlaceDetailsResult(result.data_cid, row.payload)
+                    continue
+                if result.place_details is not None and self.place_details_dao:
+                    # Write-backs run here, one at a time, because the
+                    # session must not be used concurrently.
+                    await self.place_details_dao.upsert_place_details(
+                        result.data_cid,
+                        result.place_details,
+                    )
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _is_fresh(self, stored: Optional[StoredPlaceDetails]) -> bool:
+        max_age = timedelta(seconds=settings.valueserp_place_details_ttl)
+        fresh_after = datetime.now(timezone.utc) - max_age
+        is_fresh = stored is not None and stored.fetched_at > fresh_after
+        if is_fresh:
+            result = "hit"
+        else:
+            result = "miss" if stored is None else "stale"
+        cache_requests.inc(cache="valueserp_place_details", result=result)
+        return is_fresh
+
+    async def _fetch_places(
+        self,
+        query: str,
+        location: str,
+        gl: str,
+        hl: str,
+    ) -> list[Any]:
+        return await search_places_flight.do(
+            (query, location, gl, hl),
+            lambda: self._request_places(query, location, gl, hl),
+            self.redis_pool,
+        )
+
+    async def _request_places(
+        self,
+        query: str,
+        location: str,
+        gl: str,
+        hl: str,
+    ) -> list[Any]:
         params = {
             "api_key": self.api_key,
             "search_type": "places",
             "q": query,
             "location": location,
             "google_domain": "google.com",
-            "gl": "us",
-            "hl": "en",
+            "gl": gl,
+            "hl": hl,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.get(self.base_url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            print(data)
-            return data.get("places_results", [])
+        data = await self._search(params)
+        return data.get("places_results", [])
 
-    async def get_place_details(self, data_cid: str) -> Any:
+    async def _fetch_place_details(self, data_cid: str) -> Any:
+        return await place_details_flight.do(
+            (data_cid,),
+            lambda: self._request_place_details(data_cid),
+            self.redis_pool,
+        )
+
+    async def _request_place_details(self, data_cid: str) -> Any:
         params = {
             "api_key": self.api_key,
             "search_type": "place_details",
@@ -37,8 +223,18 @@ class ValueSerpService:
             "gl": "us",
             "hl": "en",
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.get(self.base_url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("place_details")
+        data = await self._search(params)
+        return data.get("place_details")
+
+    async def _search(self, params: Dict[str, str]) -> Any:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        return await valueserp_guard.call(
+            lambda: self._send_search(params),
+            self.rate_limiter,
+        )
+
+    async def _send_search(self, params: Dict[str, str]) -> Any:
+        response = await self.client.get("/search", params=params)
+        response.raise_for_status()
+        return response.json()
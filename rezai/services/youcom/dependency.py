@@ -0,0 +1,23 @@
+from fastapi import Depends
+from redis.asyncio import ConnectionPool
+from starlette.requests import Request
+
+from rezai.services.redis.dependency import get_redis_pool
+from rezai.services.youcom.service import YouComService
+
+
+def get_youcom_service(
+    request: Request,
+    redis_pool: ConnectionPool = Depends(get_redis_pool),
+) -> YouComService:  # pragma: no cover
+    """
+    Returns You.com service bound to the shared HTTP client.
+
+    :param request: current request.
+    :param redis_pool: redis connection pool for cross-worker coalescing.
+    :return: You.com service.
+    """
+    return YouComService(
+        client=request.app.state.youcom_client,
+        redis_pool=redis_pool,
+    )
@@ -0,0 +1,22 @@
+from fastapi import FastAPI
+
+from rezai.services.http.client import create_http_client
+from rezai.services.youcom.service import YOUCOM_BASE_URL
+
+
+def init_youcom(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Creates pooled HTTP client for You.com.
+
+    :param app: current fastapi application.
+    """
+    app.state.youcom_client = create_http_client(YOUCOM_BASE_URL)
+
+
+async def shutdown_youcom(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Closes You.com HTTP client.
+
+    :param app: current FastAPI app.
+    """
+    await app.state.youcom_client.aclose()
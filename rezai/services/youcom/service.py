@@ -1,40 +1,57 @@
 # rezai/services/youcom/service.py
-from typing import Any
+from typing import Any, Optional
 
 import httpx
+from redis.asyncio import ConnectionPool
 
+from rezai.services.ratelimit import create_bucket
+from rezai.services.resilience import ProviderGuard
+from rezai.services.singleflight import SingleFlight
 from rezai.settings import settings
 
+YOUCOM_BASE_URL = "https://api.ydc-index.io"
+
+ai_snippets_flight = SingleFlight("youcom_ai_snippets")
+youcom_guard = ProviderGuard("You.com")
+
 
 class YouComService:
-    def __init__(self, api_key: str = settings.youcom_api_key):
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        redis_pool: Optional[ConnectionPool] = None,
+        api_key: str = settings.youcom_api_key,
+    ):
+        self.client = client
+        self.redis_pool = redis_pool
         self.api_key = api_key
-        self.base_url = "https://api.ydc-index.io"
+        self.rate_limiter = create_bucket(
+            redis_pool,
+            "youcom",
+            settings.youcom_requests_per_second,
+        )
 
     async def query_web_llm(self, query: str) -> Any:
-        headers = {"X-API-Key": self.api_key}
-        params = {"query": query}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/rag",
-                params=params,
-                headers=headers,
-                timeout=30,
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data
+        return await self._get("/rag", query)
 
     async def get_ai_snippets_for_query(self, query: str) -> Any:
+        return await ai_snippets_flight.do(
+            (query,),
+            lambda: self._get("/search", query),
+            self.redis_pool,
+        )
+
+    async def _get(self, path: str, query: str) -> Any:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        return await youcom_guard.call(
+            lambda: self._send(path, query),
+            self.rate_limiter,
+        )
+
+    async def _send(self, path: str, query: str) -> Any:
         headers = {"X-API-Key": self.api_key}
         params = {"query": query}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/search",
-                params=params,
-                headers=headers,
-                timeout=30,
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data
+        response = await self.client.get(path, params=params, headers=headers)
+        response.raise_for_status()
+        return response.json()
@@ -1,7 +1,7 @@
 import enum
 from pathlib import Path
 from tempfile import gettempdir
-from typing import Optional
+from typing import Dict, List, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from yarl import URL
@@ -20,6 +20,13 @@ class LogLevel(str, enum.Enum):  # noqa: WPS600
     FATAL = "FATAL"
 
 
+class BusyThreadPolicy(str, enum.Enum):  # noqa: WPS600
+    """What a chat request does when another turn of its thread is running."""
+
+    REJECT = "reject"
+    ATTACH = "attach"
+
+
 class Settings(BaseSettings):
     """
     Application settings.
@@ -63,6 +70,145 @@ class Settings(BaseSettings):
     valueserp_api_key: str = ""
     youcom_api_key: str = ""
 
+    # Variables for outbound provider HTTP clients
+    http2: bool = True
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http_timeout: float = 15.0
+    http_connect_timeout: float = 5.0
+
+    # Variables for the ValueSerp places search cache (seconds)
+    valueserp_search_cache_ttl: int = 3600
+    valueserp_search_cache_stale_ttl: int = 86400
+    # How long stored place details are served without refetching (seconds)
+    valueserp_place_details_ttl: int = 604800
+    # Batch place details: max items per request and concurrent upstream calls
+    valueserp_batch_max_size: int = 50
+    valueserp_batch_concurrency: int = 5
+    # Fetch details of the top places of a search in the background
+    valueserp_prefetch_enabled: bool = False
+    valueserp_prefetch_top_k: int = 3
+    valueserp_prefetch_concurrency: int = 3
+    # How long prefetched details are kept for the follow-up lookup (seconds)
+    valueserp_prefetch_ttl: int = 300
+    valueserp_prefetch_max_entries: int = 1024
+
+    # Share identical in-flight provider calls across workers through redis
+    singleflight_redis_enabled: bool = False
+    singleflight_lock_timeout: float = 30.0
+
+    # Rate limits shared by all workers, 0 disables a limit
+    ratelimit_enabled: bool = True
+    # Longest time a call may be queued before it fails (seconds)
+    ratelimit_max_wait: float = 10.0
+    valueserp_requests_per_second: float = 5.0
+    youcom_requests_per_second: float = 5.0
+    anthropic_requests_per_second: float = 0.8
+    anthropic_tokens_per_minute: int = 50000
+    # Retries of rate limited or overloaded model calls, queued on the limits
+    anthropic_max_retries: int = 3
+    # Delay of the first retry when the response gives no Retry-After (seconds)
+    anthropic_retry_backoff: float = 1.0
+    # Mark the agent's tools, system prompt and conversation as cacheable
+    anthropic_prompt_caching: bool = True
+
+    # Tail latency controls for the search providers.
+    # A duplicate request is sent once a call is slower than this
+    # percentile of recent latencies, clamped to the min/max delay.
+    hedge_enabled: bool = True
+    hedge_percentile: float = 95.0
+    hedge_min_delay: float = 0.5
+    hedge_max_delay: float = 5.0
+    # Consecutive failures that open a provider circuit,
+    # and seconds before a trial call is let through.
+    circuit_failure_threshold: int = 5
+    circuit_reset_timeout: float = 30.0
+
+    # Fields and result caps of provider payloads passed to the agent
+    agent_search_fields: List[str] = [
+        "title",
+        "data_cid",
+        "address",
+        "category",
+        "rating",
+        "reviews",
+        "snippet",
+    ]
+    agent_search_max_results: int = 5
+    agent_details_fields: List[str] = [
+        "title",
+        "data_cid",
+        "address",
+        "category",
+        "rating",
+        "reviews",
+        "website",
+        "phone",
+        "hours",
+        "snippet",
+    ]
+    agent_web_max_results: int = 3
+    agent_snippet_max_chars: int = 300
+    # Turns sent verbatim to the model, older ones are summarized
+    agent_history_turns: int = 4
+    agent_context_max_tokens: int = 8000
+    agent_summary_line_chars: int = 200
+    # Restaurant list lookups answered from the database without the agent
+    agent_fast_path_enabled: bool = True
+    agent_fast_path_max_results: int = 10
+    # Answers to first messages of new threads, served from redis
+    agent_answer_cache_enabled: bool = False
+    agent_answer_cache_ttl: int = 3600
+    # Log one structured line with timings and token counts per chat turn
+    agent_turn_log: bool = True
+
+    # Chat events buffered in redis streams, so SSE clients can resume
+    chat_stream_ttl: int = 300
+    chat_stream_max_events: int = 10000
+    # How long a reader waits for new events before sending a keepalive
+    chat_stream_keepalive_ms: int = 15000
+    # WebSocket chat sessions: events queued per session before the turn
+    # waits, how long it waits before closing, and the ping interval (seconds)
+    chat_ws_send_queue: int = 64
+    chat_ws_send_timeout: float = 30.0
+    chat_ws_ping_interval: float = 20.0
+    # One turn at a time per thread. A request for a busy thread is rejected
+    # with 409, or with "attach" follows the events of the running turn.
+    # Leases expire this long after their last renewal (seconds).
+    chat_busy_thread_policy: BusyThreadPolicy = BusyThreadPolicy.REJECT
+    agent_thread_lease_ttl: float = 30.0
+    agent_thread_lease_redis_enabled: bool = True
+    # Admission control of chat turns: turns running at once per worker,
+    # and across workers through redis (0 disables a limit), then turns
+    # queued per worker and how long they may wait (seconds). Rejected
+    # requests are told to retry after at least admission_retry_after
+    # seconds. Slots in redis expire this long after their last renewal.
+    # High priority is only honored for internal callers sending
+    # admission_internal_token in X-Internal-Token, unset honors nobody.
+    admission_enabled: bool = True
+    admission_max_concurrency: int = 32
+    admission_global_max_concurrency: int = 0
+    admission_queue_size: int = 64
+    admission_max_wait: float = 10.0
+    admission_retry_after: int = 1
+    admission_slot_ttl: float = 60.0
+    admission_internal_token: Optional[str] = None
+    # Deadline of each agent tool call (seconds)
+    agent_tool_default_timeout: float = 20.0
+    agent_tool_timeouts: Dict[str, float] = {
+        "web_search": 15.0,
+        "lookup_restaurants": 10.0,
+        "save_restaurant": 10.0,
+    }
+
+    # Conversation checkpoints stored in redis
+    checkpoint_ttl: int = 604800
+    checkpoint_max_per_thread: int = 10
+    checkpoint_max_threads: int = 100000
+    checkpoint_local_cache_size: int = 256
+    checkpoint_compression: int = 6
+
     @property
     def db_url(self) -> URL:
         """
@@ -0,0 +1,148 @@
+import asyncio
+from typing import List
+
+import pytest
+from redis.asyncio import ConnectionPool
+
+from rezai.services.admission import (
+    AdmissionController,
+    AdmissionPriority,
+    AdmissionRejected,
+    admission_queue_depth,
+    admission_rejected,
+    is_internal_caller,
+    parse_priority,
+)
+from rezai.settings import settings
+
+
+@pytest.mark.anyio
+async def test_queued_requests_are_admitted_by_priority() -> None:
+    """Tests that freed slots go to the highest priority, then the oldest."""
+    controller = AdmissionController(
+        "test_priority",
+        max_concurrency=1,
+        queue_size=3,
+        max_wait=5,
+    )
+    release = asyncio.Event()
+    order: List[str] = []
+
+    async def run(name: str, priority: AdmissionPriority) -> None:
+        async with controller.admit(priority):
+            order.append(name)
+            await release.wait()
+
+    tasks = [asyncio.create_task(run("first", AdmissionPriority.NORMAL))]
+    await asyncio.sleep(0)
+    for name, priority in (
+        ("low", AdmissionPriority.LOW),
+        ("normal", AdmissionPriority.NORMAL),
+        ("high", AdmissionPriority.HIGH),
+    ):
+        tasks.append(asyncio.create_task(run(name, priority)))
+        await asyncio.sleep(0)
+
+    assert controller.depth == 3
+    assert admission_queue_depth.value(controller="test_priority", priority="low") == 1
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert order == ["first", "high", "normal", "low"]
+    assert controller.active == 0
+    assert controller.depth == 0
+
+
+@pytest.mark.anyio
+async def test_full_queue_rejects_or_sheds() -> None:
+    """Tests that a full queue rejects at once unless a lower priority can go."""
+    controller = AdmissionController(
+        "test_full",
+        max_concurrency=1,
+        queue_size=1,
+        max_wait=5,
+    )
+    release = asyncio.Event()
+
+    async def run(priority: AdmissionPriority) -> None:
+        async with controller.admit(priority):
+            await release.wait()
+
+    running = asyncio.create_task(run(AdmissionPriority.NORMAL))
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(run(AdmissionPriority.LOW))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        await run(AdmissionPriority.LOW)
+    assert rejected.value.reason == "queue_full"
+    assert rejected.value.retry_after >= 1
+
+    high = asyncio.create_task(run(AdmissionPriority.HIGH))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected) as shed:
+        await queued
+    release.set()
+    await asyncio.gather(running, high)
+
+    assert shed.value.reason == "shed"
+    assert admission_rejected.value(controller="test_full", reason="shed") == 1
+    assert controller.active == 0
+
+
+@pytest.mark.anyio
+async def test_waits_time_out_without_leaking_slots() -> None:
+    """Tests that a request waiting past max_wait is rejected and forgotten."""
+    controller = AdmissionController(
+        "test_timeout",
+        max_concurrency=1,
+        queue_size=1,
+        max_wait=0.05,
+    )
+
+    async with controller.admit():
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass  # noqa: WPS420
+        assert controller.depth == 0
+
+    assert rejected.value.reason == "timeout"
+    assert controller.active == 0
+    assert parse_priority("HIGH", trusted=True) == AdmissionPriority.HIGH
+    assert parse_priority("urgent") == AdmissionPriority.NORMAL
+
+
+def test_clients_cannot_raise_their_priority(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that high priority is only honored for internal callers."""
+    monkeypatch.setattr(settings, "admission_internal_token", "secret")
+
+    assert parse_priority("high") == AdmissionPriority.NORMAL
+    assert parse_priority("low") == AdmissionPriority.LOW
+    assert is_internal_caller("secret")
+    assert not is_internal_caller("guess")
+    assert not is_internal_caller(None)
+
+    monkeypatch.setattr(settings, "admission_internal_token", None)
+    assert not is_internal_caller("")
+
+
+@pytest.mark.anyio
+async def test_shared_limit_spans_workers(fake_redis_pool: ConnectionPool) -> None:
+    """Tests that the redis slots limit requests admitted by other workers."""
+    workers = [
+        AdmissionController(
+            "test_shared",
+            max_concurrency=5,
+            max_wait=0.1,
+            global_max_concurrency=1,
+        )
+        for _ in range(2)
+    ]
+
+    async with workers[0].admit(redis_pool=fake_redis_pool):
+        with pytest.raises(AdmissionRejected):
+            async with workers[1].admit(redis_pool=fake_redis_pool):
+                pass  # noqa: WPS420
+
+    async with workers[1].admit(redis_pool=fake_redis_pool):
+        assert workers[1].active == 1
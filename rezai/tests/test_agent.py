@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from rezai.agents.deadline import tool_duration
+from rezai.agents.restaurant_search_agent import (
+    RestaurantAgentContainer,
+    create_restaurant_agent,
+)
+from rezai.settings import settings
+
+
+class FakeValueSerpService:
+    """Returns fixed place details."""
+
+    def __init__(self, title: str) -> None:
+        self.title = title
+
+    async def get_place_details(self, data_cid: str) -> Dict[str, Any]:
+        return {"title": self.title, "data_cid": data_cid}
+
+
+@pytest.mark.anyio
+async def test_shared_graph_uses_request_services() -> None:
+    """Tests that one compiled graph serves requests with their own services."""
+    graph = create_restaurant_agent()
+    tool_node = graph.nodes["tools"].bound
+    tool_call = AIMessage(
+        content="",
+        tool_calls=[
+            {
+                "name": "get_restaurant_details",
+                "args": {"data_cid": "1"},
+                "id": "call_1",
+            },
+        ],
+    )
+
+    outputs = []
+    for title in ("First", "Second"):
+        container = RestaurantAgentContainer(
+            graph,
+            valueserp_service=FakeValueSerpService(title),  # type: ignore
+            youcom_service=None,  # type: ignore
+            restaurant_dao=None,  # type: ignore
+        )
+        config = container.with_services({"configurable": {"thread_id": "1"}})
+        result = await tool_node.ainvoke({"messages": [tool_call]}, config)
+        outputs.append(result["messages"][0].content)
+
+    assert outputs == [
+        '{"title": "First", "data_cid": "1"}',
+        '{"title": "Second", "data_cid": "1"}',
+    ]
+
+
+class SlowService:
+    """Answers search and web lookups after a delay, logging their calls."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.calls: List[str] = []
+
+    async def search_places(self, query: str, location: str) -> List[Any]:
+        self.calls.append("search started")
+        await asyncio.sleep(self.delay)
+        self.calls.append("search ended")
+        return [{"title": query}]
+
+    async def get_ai_snippets_for_query(self, query: str) -> Dict[str, Any]:
+        self.calls.append("web started")
+        await asyncio.sleep(self.delay)
+        self.calls.append("web ended")
+        return {"hits": [{"title": query}]}
+
+
+async def run_tools(delay: float) -> Tuple[List[str], List[str]]:
+    """
+    Run a search and a web lookup emitted in one model step.
+
+    :param delay: latency of each service call.
+    :return: contents of the tool results and the log of service calls.
+    """
+    graph = create_restaurant_agent()
+    service = SlowService(delay)
+    container = RestaurantAgentContainer(
+        graph,
+        valueserp_service=service,  # type: ignore
+        youcom_service=service,  # type: ignore
+        restaurant_dao=None,  # type: ignore
+    )
+    tool_call = AIMessage(
+        content="",
+        tool_calls=[
+            {
+                "name": "search_restaurants",
+                "args": {"query": "tacos", "location": "austin"},
+                "id": "call_1",
+            },
+            {"name": "web_search", "args": {"query": "tacos"}, "id": "call_2"},
+        ],
+    )
+    result = await graph.nodes["tools"].bound.ainvoke(
+        {"messages": [tool_call]},
+        container.with_services({"configurable": {"thread_id": "1"}}),
+    )
+    return [message.content for message in result["messages"]], service.calls
+
+
+@pytest.mark.anyio
+async def test_tool_calls_of_one_step_run_concurrently() -> None:
+    """Tests that a search and a web lookup overlap instead of running in turn."""
+    outputs, calls = await run_tools(0.05)
+
+    assert sorted(calls[:2]) == ["search started", "web started"]
+    assert outputs == ['[{"title": "tacos"}]', '[{"title": "tacos"}]']
+    assert tool_duration.count(tool="web_search", outcome="ok") >= 1
+
+
+@pytest.mark.anyio
+async def test_slow_tool_hits_its_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that a tool over its deadline is cancelled and reported."""
+    monkeypatch.setattr(settings, "agent_tool_timeouts", {"web_search": 0.01})
+
+    outputs, _ = await run_tools(0.05)
+
+    assert outputs[0] == '[{"title": "tacos"}]'
+    assert outputs[1] == "web_search timed out after 0.01 seconds, try again later."
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from rezai.benchmarks.agent import compare_to_baseline, run_benchmark
+from rezai.benchmarks.conversations import DEFAULT_CONVERSATIONS, parse_conversations
+from rezai.benchmarks.serialization import (
+    chat_turn,
+    restaurant_results,
+    run_serialization_benchmark,
+)
+from rezai.web.responses import ModelResponse, model_line
+
+
+@pytest.mark.anyio
+async def test_benchmark_replays_conversations() -> None:
+    """Tests that recorded conversations replay concurrently and offline."""
+    conversations = parse_conversations(DEFAULT_CONVERSATIONS)
+
+    report = await run_benchmark(conversations, concurrency=2, repeat=2)
+    summary = report.summary()
+
+    assert report.conversations == 4
+    assert report.turns == 10
+    assert report.model_calls == 18
+    assert min(report.checkpoint_bytes) > 0
+    assert summary["streamed_bytes_per_turn"] > 0
+    assert summary["memory_peak_bytes"] is None
+
+
+def test_compare_to_baseline() -> None:
+    """Tests that only figures above the tolerance are reported."""
+    baseline = {"cpu_ms_per_turn": 10.0, "checkpoint_bytes_max": 1000}
+    summary = {"cpu_ms_per_turn": 11.0, "checkpoint_bytes_max": 1500}
+
+    assert compare_to_baseline(summary, baseline, tolerance=0.2) == [
+        "checkpoint_bytes_max: 1500.0 > 1000.0",
+    ]
+
+
+@pytest.mark.anyio
+async def test_serialization_benchmark_compares_equal_payloads() -> None:
+    """Tests that both encodings produce the same JSON and are timed."""
+    restaurants = restaurant_results(3)
+    events = chat_turn(tokens=3)
+
+    summary = await run_serialization_benchmark(repeat=2)
+
+    assert json.loads(ModelResponse(restaurants).body) == restaurants.model_dump()
+    assert [json.loads(model_line(event)) for event in events] == [
+        event.model_dump() for event in events
+    ]
+    assert set(summary) == {
+        "restaurant_search_response",
+        "chat_event_stream",
+        "chat_values_stream",
+    }
+    assert all(timing["after_us"] > 0 for timing in summary.values())
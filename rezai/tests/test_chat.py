@@ -0,0 +1,650 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+from redis.asyncio import ConnectionPool
+
+from rezai.agents.cancellation import CANCELLED_ANSWER, CANCELLED_TOOL_RESULT
+from rezai.agents.instrumentation import (
+    TurnRecorder,
+    cancelled_calls,
+    cancelled_turns,
+    llm_tokens,
+    turn_iterations,
+)
+from rezai.agents.lease import ThreadLease
+from rezai.agents.restaurant_search_agent import (
+    RestaurantAgentContainer,
+    create_restaurant_agent,
+)
+from rezai.benchmarks.fakes import FakeRestaurantDAO, ScriptedChatModel
+from rezai.db.models import load_all_models
+from rezai.db.models.restaurant_model import Restaurant
+from rezai.services.redis.cache import cache_requests
+from rezai.settings import BusyThreadPolicy, settings
+from rezai.web.api.chat import router as chat_router
+from rezai.web.api.chat import turns as turns_module
+from rezai.web.api.chat.resumable import (
+    KEEPALIVE,
+    ChatStreamBuffer,
+    StreamPosition,
+    parse_event_id,
+)
+from rezai.web.api.chat.schema import (
+    ChatEvent,
+    DoneEvent,
+    ErrorEvent,
+    MessageEvent,
+    TokenEvent,
+)
+from rezai.web.api.chat.streaming import chat_events, ndjson
+from rezai.web.api.chat.turns import (
+    BusyThreadError,
+    ChatTurn,
+    ChatTurns,
+    chat_submissions,
+)
+
+
+class FakeValueSerpService:
+    """Returns one place for every search."""
+
+    async def search_places(self, query: str, location: str) -> List[Dict[str, Any]]:
+        return [{"title": "Uchi", "data_cid": "1", "rating": 4.8}]
+
+
+@pytest.mark.anyio
+async def test_turn_streams_only_new_content() -> None:
+    """Tests that a turn streams tokens, tool calls and the final message."""
+    llm = ScriptedChatModel(
+        responses=[
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": "search_restaurants",
+                        "args": {"query": "sushi", "location": "Austin"},
+                        "id": "call_1",
+                    },
+                ],
+            ),
+            AIMessage(content="Try Uchi."),
+        ],
+    )
+    container = RestaurantAgentContainer(
+        create_restaurant_agent(llm=llm),
+        valueserp_service=FakeValueSerpService(),  # type: ignore
+        youcom_service=None,  # type: ignore
+        restaurant_dao=None,  # type: ignore
+    )
+
+    events = container.stream_events(
+        {"messages": [{"role": "user", "content": "Sushi in Austin?"}]},
+        {"configurable": {"thread_id": "1"}},
+    )
+    lines = [json.loads(line) async for line in ndjson(chat_events(events, "1"))]
+
+    assert [line["type"] for line in lines] == [
+        "tool_start",
+        "tool_end",
+        "token",
+        "token",
+        "message",
+        "done",
+    ]
+    assert lines[0]["tool"] == "search_restaurants"
+    assert lines[0]["input"] == {"query": "sushi", "location": "Austin"}
+    assert lines[1]["id"] == lines[0]["id"]
+    assert lines[1]["output"] == [{"title": "Uchi", "data_cid": "1", "rating": 4.8}]
+    assert "".join(line["text"] for line in lines[2:4]) == "Try Uchi."
+    assert lines[4]["content"] == "Try Uchi."
+    assert lines[5] == {"type": "done", "thread_id": "1"}
+
+
+@pytest.mark.anyio
+async def test_saved_restaurants_are_streamed_as_json(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that restaurants read from the database reach the stream as JSON."""
+    monkeypatch.setattr(settings, "agent_fast_path_enabled", False)
+    load_all_models()
+    llm = ScriptedChatModel(
+        responses=[
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": "lookup_restaurants",
+                        "args": {"category": "Sushi"},
+                        "id": "call_1",
+                    },
+                ],
+            ),
+            AIMessage(content="You saved Uchi."),
+        ],
+    )
+    container = RestaurantAgentContainer(
+        create_restaurant_agent(llm=llm),
+        valueserp_service=None,  # type: ignore
+        youcom_service=None,  # type: ignore
+        restaurant_dao=FakeRestaurantDAO(  # type: ignore
+            [Restaurant(id=1, title="Uchi", type="Restaurant", category="Sushi")],
+        ),
+    )
+
+    events = container.stream_events(
+        {"messages": [{"role": "user", "content": "Which sushi places did I save?"}]},
+        {"configurable": {"thread_id": "1"}},
+    )
+    lines = [json.loads(line) async for line in ndjson(chat_events(events, "1"))]
+
+    assert [line["type"] for line in lines][:2] == ["tool_start", "tool_end"]
+    assert lines[1]["output"] == [
+        {"title": "Uchi", "type": "Restaurant", "category": "Sushi"},
+    ]
+    assert lines[-2:] == [
+        {"type": "message", "content": "You saved Uchi."},
+        {"type": "done", "thread_id": "1"},
+    ]
+
+
+@pytest.mark.anyio
+async def test_first_message_is_answered_from_cache(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a repeated first message skips the agent run."""
+    monkeypatch.setattr(settings, "agent_answer_cache_enabled", True)
+    llm = ScriptedChatModel(responses=[AIMessage(content="Try Uchi.")])
+    graph = create_restaurant_agent(llm=llm)
+
+    async def ask(thread_id: str, message: str) -> List[Dict[str, Any]]:
+        container = RestaurantAgentContainer(
+            graph,
+            valueserp_service=None,  # type: ignore
+            youcom_service=None,  # type: ignore
+            restaurant_dao=None,  # type: ignore
+            redis_pool=fake_redis_pool,
+        )
+        events = container.stream_events(
+            {"messages": [{"role": "user", "content": message}]},
+            {"configurable": {"thread_id": thread_id}},
+        )
+        return [json.loads(line) async for line in ndjson(chat_events(events, "1"))]
+
+    await ask("1", "Sushi in Austin?")
+    cached = await ask("2", "sushi  in austin?")
+
+    assert llm.calls == 1
+    assert [line["type"] for line in cached] == ["token", "message", "done"]
+    assert cached[1]["content"] == "Try Uchi."
+    assert cache_requests.value(cache="agent_answers", result="hit") == 1
+
+    await ask("2", "sushi  in austin?")
+
+    assert llm.calls == 2
+    state = await graph.aget_state({"configurable": {"thread_id": "2"}})
+    assert len(state.values["messages"]) == 4
+
+
+@pytest.mark.anyio
+async def test_fast_path_only_answers_new_threads(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a list lookup later in a thread is left to the agent."""
+    monkeypatch.setattr(settings, "agent_fast_path_enabled", True)
+    llm = ScriptedChatModel(responses=[AIMessage(content="Here you go.")])
+    container = RestaurantAgentContainer(
+        create_restaurant_agent(llm=llm),
+        valueserp_service=None,  # type: ignore
+        youcom_service=None,  # type: ignore
+        restaurant_dao=FakeRestaurantDAO(),  # type: ignore
+    )
+    config = {"configurable": {"thread_id": "1"}}
+    message = {"messages": [{"role": "user", "content": "Show me our list"}]}
+
+    for _ in range(2):
+        async for _ in container.stream_events(message, config):  # noqa: WPS440
+            pass  # noqa: WPS420
+
+    assert llm.calls == 1
+
+
+@pytest.mark.anyio
+async def test_turns_using_the_database_are_not_cached(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that answers of turns calling database tools are not cached."""
+    monkeypatch.setattr(settings, "agent_answer_cache_enabled", True)
+    monkeypatch.setattr(settings, "agent_fast_path_enabled", False)
+    llm = ScriptedChatModel(
+        responses=[
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": "lookup_restaurants", "args": {}, "id": "call_1"},
+                ],
+            ),
+            AIMessage(content="You saved no restaurants."),
+        ],
+    )
+    graph = create_restaurant_agent(llm=llm)
+    container = RestaurantAgentContainer(
+        graph,
+        valueserp_service=None,  # type: ignore
+        youcom_service=None,  # type: ignore
+        restaurant_dao=FakeRestaurantDAO(),  # type: ignore
+        redis_pool=fake_redis_pool,
+    )
+    message = {"messages": [{"role": "user", "content": "My saved restaurants?"}]}
+
+    events = container.stream_events(message, {"configurable": {"thread_id": "1"}})
+    async for _ in events:
+        pass  # noqa: WPS420
+    values = container.run_graph(
+        message,
+        {"configurable": {"thread_id": "2"}},
+        stream_mode="values",
+    )
+    async for _ in values:  # noqa: WPS440
+        pass  # noqa: WPS420
+
+    assert llm.calls == 4
+    assert not await container.answer_cache.get(  # type: ignore
+        ("my saved restaurants?",),
+    )
+
+
+@pytest.mark.anyio
+async def test_turn_recorder_collects_llm_and_tool_calls() -> None:
+    """Tests that a turn records every model call and tool call."""
+    llm = ScriptedChatModel(
+        responses=[
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": "search_restaurants",
+                        "args": {"query": "sushi", "location": "Austin"},
+                        "id": "call_1",
+                    },
+                ],
+                usage_metadata={
+                    "input_tokens": 120,
+                    "output_tokens": 20,
+                    "total_tokens": 140,
+                },
+            ),
+            AIMessage(content="Try Uchi."),
+        ],
+    )
+    graph = create_restaurant_agent(llm=llm)
+    recorder = TurnRecorder("1")
+    tokens_before = llm_tokens.value(kind="input")
+
+    await graph.ainvoke(
+        {"messages": [{"role": "user", "content": "Sushi in Austin?"}]},
+        {
+            "configurable": {
+                "thread_id": "1",
+                "valueserp_service": FakeValueSerpService(),
+            },
+            "callbacks": [recorder],
+        },
+    )
+    summary = recorder.finish("agent")
+
+    assert summary["thread_id"] == "1"
+    assert summary["iterations"] == 2
+    assert summary["llm_calls"][0]["input"] == 120
+    assert [tool_call["tool"] for tool_call in summary["tool_calls"]] == [
+        "search_restaurants",
+    ]
+    assert summary["tool_calls"][0]["bytes"] > 0
+    assert llm_tokens.value(kind="input") == tokens_before + 120
+    assert turn_iterations.count() >= 1
+
+
+async def scripted_events() -> AsyncIterator[ChatEvent]:
+    """
+    Chat events of a short turn.
+
+    :yield: chat events.
+    """
+    for text in ("Try ", "Uchi."):
+        yield TokenEvent(text=text)
+    yield MessageEvent(content="Try Uchi.")
+    yield DoneEvent(thread_id="1")
+
+
+@pytest.mark.anyio
+async def test_sse_stream_resumes_after_last_event_id(
+    fake_redis_pool: ConnectionPool,
+) -> None:
+    """Tests that a reconnect gets the buffered events after Last-Event-ID."""
+    buffer = ChatStreamBuffer(fake_redis_pool)
+    turn_id, producer = buffer.start("1", scripted_events())
+
+    frames = [
+        frame
+        async for frame in buffer.read("1", StreamPosition(turn_id), producer)
+        if frame != KEEPALIVE
+    ]
+    event_ids = [frame.decode().split("\n")[0][len("id: ") :] for frame in frames]
+    resumed = [
+        frame
+        async for frame in buffer.read("1", parse_event_id(event_ids[1]))  # type: ignore
+    ]
+
+    assert len(frames) == 4
+    assert frames[0].decode().startswith(f"id: {turn_id}:")
+    assert "event: token\ndata: " in frames[0].decode()
+    assert resumed == frames[2:]
+    assert await buffer.exists("1", turn_id)
+    assert not await buffer.exists("2", turn_id)
+    assert parse_event_id("garbage") is None
+
+
+@pytest.mark.anyio
+async def test_failed_producer_ends_the_buffered_stream(
+    fake_redis_pool: ConnectionPool,
+) -> None:
+    """Tests that readers get error and done events when the producer fails."""
+    buffer = ChatStreamBuffer(fake_redis_pool)
+    closed: List[bool] = []
+
+    async def failing_events() -> AsyncIterator[ChatEvent]:
+        try:
+            yield TokenEvent(text="Try ")
+            # Can't be encoded, writing it to the stream fails.
+            yield ToolEndEvent(id="run_1", tool="lookup_restaurants", output=object())
+            yield DoneEvent(thread_id="1")
+        finally:
+            closed.append(True)
+
+    turn_id, producer = buffer.start("1", failing_events())
+    lines = [
+        json.loads(line)
+        async for line in buffer.read_ndjson("1", StreamPosition(turn_id), producer)
+        if line != b"\n"
+    ]
+
+    assert [line["type"] for line in lines] == ["token", "error", "done"]
+    assert closed == [True]
+
+
+class FakeSession:
+    """Database session that is never queried."""
+
+    committed = False
+
+    async def __aenter__(self) -> "FakeSession":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        """Nothing to close."""
+
+    async def commit(self) -> None:
+        self.committed = True
+
+
+def test_websocket_session_runs_turns() -> None:
+    """Tests that one socket carries several turns, pings and errors."""
+    app = FastAPI()
+    app.include_router(chat_router, prefix="/api/chat")
+    app.state.restaurant_agent = create_restaurant_agent(
+        llm=ScriptedChatModel(responses=[AIMessage(content="Try Uchi.")]),
+    )
+    app.state.db_session_factory = FakeSession
+    app.state.redis_pool = None
+    app.state.youcom_client = None
+    app.state.valueserp_client = None
+    app.state.valueserp_prefetcher = None
+
+    def receive_turn(websocket: Any) -> List[Dict[str, Any]]:
+        events = [websocket.receive_json()]
+        while events[-1]["type"] != "done":
+            events.append(websocket.receive_json())
+        return events
+
+    with TestClient(app).websocket_connect("/api/chat/ws/1") as websocket:
+        websocket.send_json({"type": "message", "message": "Sushi in Austin?"})
+        first = receive_turn(websocket)
+        websocket.send_json({"type": "ping"})
+        pong = websocket.receive_json()
+        websocket.send_json({"type": "unknown"})
+        error = websocket.receive_json()
+        websocket.send_json({"type": "message", "message": "Anything else?"})
+        second = receive_turn(websocket)
+
+    assert [event["type"] for event in first] == ["token", "token", "message", "done"]
+    assert pong == {"type": "pong"}
+    assert error["type"] == "error"
+    assert second[-2] == {"type": "message", "content": "Try Uchi."}
+    assert second[-1] == {"type": "done", "thread_id": "1"}
+
+
+class HangingValueSerpService:
+    """Search that only ends when cancelled."""
+
+    cancelled = False
+
+    async def search_places(self, query: str, location: str) -> List[Dict[str, Any]]:
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return []
+
+
+@pytest.mark.anyio
+async def test_closed_stream_cancels_turn_and_settles_thread() -> None:
+    """Tests that a client leaving mid-tool stops the run and repairs the thread."""
+    llm = ScriptedChatModel(
+        responses=[
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": "search_restaurants",
+                        "args": {"query": "sushi", "location": "Austin"},
+                        "id": "call_1",
+                    },
+                ],
+            ),
+            AIMessage(content="Try Uchi."),
+        ],
+    )
+    graph = create_restaurant_agent(llm=llm)
+    valueserp_service = HangingValueSerpService()
+    container = RestaurantAgentContainer(
+        graph,
+        valueserp_service=valueserp_service,  # type: ignore
+        youcom_service=None,  # type: ignore
+        restaurant_dao=None,  # type: ignore
+    )
+    config = {"configurable": {"thread_id": "1"}}
+    turns_before = cancelled_turns.value()
+
+    stream = ndjson(
+        chat_events(
+            container.stream_events(
+                {"messages": [{"role": "user", "content": "Sushi in Austin?"}]},
+                config,  # type: ignore
+            ),
+            "1",
+        ),
+    )
+    async for line in stream:
+        if json.loads(line)["type"] == "tool_start":
+            break
+    await stream.aclose()  # type: ignore
+
+    state = await graph.aget_state(config)  # type: ignore
+    messages = state.values["messages"]
+    assert valueserp_service.cancelled
+    assert cancelled_turns.value() == turns_before + 1
+    assert cancelled_calls.value(kind="tool", tool="search_restaurants") >= 1
+    assert [message.type for message in messages] == ["human", "ai", "tool", "ai"]
+    assert messages[2].content == CANCELLED_TOOL_RESULT
+    assert messages[3].content == CANCELLED_ANSWER
+    assert not state.next
+
+
+@pytest.mark.anyio
+async def test_thread_lease_lets_one_turn_run(
+    fake_redis_pool: ConnectionPool,
+) -> None:
+    """Tests that a thread lease is exclusive until it is released."""
+    lease = ThreadLease(fake_redis_pool)
+
+    assert await lease.acquire("lease", "turn_1") is None
+    assert await lease.acquire("lease", "turn_2") == "turn_1"
+    await lease.release("lease", "turn_2")
+    assert await lease.acquire("lease", "turn_2") == "turn_1"
+    await lease.release("lease", "turn_1")
+    assert await lease.acquire("lease", "turn_2") is None
+    await lease.release("lease", "turn_2")
+
+
+@pytest.mark.anyio
+async def test_chat_turns_replay_and_reject_busy_threads(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests idempotent resubmits and submissions for a busy thread."""
+    llm = ScriptedChatModel(responses=[AIMessage(content="Try Uchi.")])
+    turns = ChatTurns(
+        RestaurantAgentContainer(
+            create_restaurant_agent(llm=llm),
+            valueserp_service=None,  # type: ignore
+            youcom_service=None,  # type: ignore
+            restaurant_dao=None,  # type: ignore
+        ),
+        fake_redis_pool,
+    )
+    input_data = {"messages": [{"role": "user", "content": "Sushi in Austin?"}]}
+    config = {"configurable": {"thread_id": "turns"}}
+
+    async def read(turn: ChatTurn) -> List[Dict[str, Any]]:
+        lines = turns.buffer.read_ndjson(
+            "turns",
+            turn.position,  # type: ignore
+            turn.producer,
+        )
+        return [json.loads(line) async for line in lines if line != b"\n"]
+
+    first = await turns.start(input_data, config, idempotency_key="key")
+    with pytest.raises(BusyThreadError):
+        await turns.start(input_data, config)
+    monkeypatch.setattr(settings, "chat_busy_thread_policy", BusyThreadPolicy.ATTACH)
+    attached = await turns.start(input_data, config)
+    first_events = await read(first)
+    replayed = await turns.start(input_data, config, idempotency_key="key")
+
+    assert attached.position == first.position
+    assert replayed.position == first.position
+    assert replayed.producer is None
+    assert await read(replayed) == first_events
+    assert await read(attached) == first_events
+    assert first_events[-1] == {"type": "done", "thread_id": "turns"}
+    assert llm.calls == 1
+    assert chat_submissions.value(result="replayed") >= 1
+
+
+@pytest.mark.anyio
+async def test_unstarted_turns_release_the_lease(
+    fake_redis_pool: ConnectionPool,
+) -> None:
+    """Tests that closing the events of a turn that never ran frees the thread."""
+    llm = ScriptedChatModel(responses=[AIMessage(content="Try Uchi.")])
+    turns = ChatTurns(
+        RestaurantAgentContainer(
+            create_restaurant_agent(llm=llm),
+            valueserp_service=None,  # type: ignore
+            youcom_service=None,  # type: ignore
+            restaurant_dao=None,  # type: ignore
+        ),
+        fake_redis_pool,
+    )
+    input_data = {"messages": [{"role": "user", "content": "Sushi in Austin?"}]}
+    config = {"configurable": {"thread_id": "unstarted"}}
+
+    turn = await turns.start(input_data, config)
+    with pytest.raises(BusyThreadError):
+        await turns.acquire("unstarted")
+    # The response body never started, as when the client left early.
+    await ndjson(turn.events).aclose()  # type: ignore
+    await turn.events.aclose()  # type: ignore
+    turn_id = await turns.acquire("unstarted")
+    await turns.lease.release("unstarted", turn_id)
+
+    assert llm.calls == 0
+
+
+@pytest.mark.anyio
+async def test_failed_producers_release_the_lease(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that the thread is free again once its buffered turn failed."""
+    llm = ScriptedChatModel(responses=[AIMessage(content="Try Uchi.")])
+    turns = ChatTurns(
+        RestaurantAgentContainer(
+            create_restaurant_agent(llm=llm),
+            valueserp_service=None,  # type: ignore
+            youcom_service=None,  # type: ignore
+            restaurant_dao=None,  # type: ignore
+        ),
+        fake_redis_pool,
+    )
+    input_data = {"messages": [{"role": "user", "content": "Sushi in Austin?"}]}
+    config = {"configurable": {"thread_id": "failed"}}
+
+    async def failing_append(*args: Any) -> None:
+        raise RuntimeError("append failed")
+
+    monkeypatch.setattr(turns.buffer, "_append", failing_append)
+    turn = await turns.start(input_data, config, buffered=True)
+    await turn.producer  # type: ignore
+    turn = await turns.start(input_data, config, buffered=True)
+    turn.producer.cancel()  # type: ignore
+    with pytest.raises(asyncio.CancelledError):
+        await turn.producer  # type: ignore
+    await asyncio.gather(*turns_module._closing)  # noqa: WPS437
+
+    turn_id = await turns.acquire("failed")
+    await turns.lease.release("failed", turn_id)
+
+
+@pytest.mark.anyio
+async def test_errors_are_streamed_without_details() -> None:
+    """Tests that exception messages, which may hold API keys, stay on the server."""
+    request = httpx.Request("GET", "https://api.valueserp.com/search?api_key=SECRET")
+    error = httpx.HTTPStatusError(
+        f"Client error for url '{request.url}'",
+        request=request,
+        response=httpx.Response(404, request=request),
+    )
+
+    async def failing_events() -> AsyncIterator[Any]:
+        yield {
+            "event": "on_tool_error",
+            "run_id": "run_1",
+            "name": "search_restaurants",
+            "data": {"error": error},
+        }
+        raise RuntimeError("https://api.you.com/search?api_key=SECRET")
+
+    events = [event async for event in chat_events(failing_events(), "1")]
+
+    assert events[0].output == "Error: HTTP 404"  # type: ignore
+    assert events[1] == ErrorEvent(detail="The turn failed: RuntimeError")
+    assert all("SECRET" not in event.model_dump_json() for event in events)
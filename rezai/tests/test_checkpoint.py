@@ -0,0 +1,96 @@
+from typing import Annotated, Any, List, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import StateGraph
+from langgraph.graph.graph import CompiledGraph
+from langgraph.graph.message import add_messages
+from redis.asyncio import ConnectionPool
+
+from rezai.agents.checkpoint import RedisCheckpointSaver
+from rezai.settings import settings
+
+
+class ChatState(TypedDict):
+    messages: Annotated[List[Any], add_messages]
+
+
+def build_graph(checkpointer: RedisCheckpointSaver) -> CompiledGraph:
+    """
+    Graph that answers with the number of messages seen.
+
+    :param checkpointer: checkpointer under test.
+    :return: compiled graph.
+    """
+    builder = StateGraph(ChatState)
+    builder.add_node(
+        "reply",
+        lambda state: {"messages": [AIMessage(content=str(len(state["messages"])))]},
+    )
+    builder.set_entry_point("reply")
+    builder.set_finish_point("reply")
+    return builder.compile(checkpointer=checkpointer)
+
+
+def thread(thread_id: str) -> Any:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+@pytest.mark.anyio
+async def test_history_is_shared_between_workers(
+    fake_redis_pool: ConnectionPool,
+) -> None:
+    """Tests that a thread continues on a worker that did not start it."""
+    first_worker = build_graph(RedisCheckpointSaver(fake_redis_pool))
+    second_worker = build_graph(RedisCheckpointSaver(fake_redis_pool))
+
+    await first_worker.ainvoke({"messages": [HumanMessage("hi")]}, thread("1"))
+    state = await second_worker.ainvoke(
+        {"messages": [HumanMessage("again")]},
+        thread("1"),
+    )
+
+    assert [message.content for message in state["messages"]] == [
+        "hi",
+        "1",
+        "again",
+        "3",
+    ]
+
+
+@pytest.mark.anyio
+async def test_checkpoints_are_trimmed(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that only the latest checkpoints of a thread are kept."""
+    monkeypatch.setattr(settings, "checkpoint_max_per_thread", 2)
+    saver = RedisCheckpointSaver(fake_redis_pool)
+    graph = build_graph(saver)
+
+    for _ in range(3):
+        await graph.ainvoke({"messages": [HumanMessage("hi")]}, thread("1"))
+
+    history = [checkpoint async for checkpoint in saver.alist(thread("1"))]
+    assert len(history) == 2
+    state = await graph.aget_state(thread("1"))
+    assert len(state.values["messages"]) == 6
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_threads_are_evicted(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that threads over the limit are evicted oldest first."""
+    monkeypatch.setattr(settings, "checkpoint_max_threads", 2)
+    saver = RedisCheckpointSaver(fake_redis_pool)
+    graph = build_graph(saver)
+
+    for thread_id in ("1", "2"):
+        await graph.ainvoke({"messages": [HumanMessage("hi")]}, thread(thread_id))
+    await saver.aget_tuple(thread("1"))
+    await graph.ainvoke({"messages": [HumanMessage("hi")]}, thread("3"))
+
+    assert await saver.aget_tuple(thread("1")) is not None
+    assert await saver.aget_tuple(thread("2")) is None
@@ -0,0 +1,86 @@
+from typing import Any, List
+
+import pytest
+
+from rezai.agents.fast_path import (
+    DatabaseQuery,
+    answer_from_database,
+    fast_path_routes,
+    parse_database_query,
+)
+from rezai.db.dao.restaurant_dao import contains_text
+from rezai.db.models import load_all_models
+from rezai.db.models.restaurant_model import Restaurant
+
+
+@pytest.mark.parametrize(
+    "message,query",
+    [
+        (
+            "Show me Italian restaurants rated 4+ in our list",
+            DatabaseQuery(cuisine="italian", min_rating=4.0),
+        ),
+        (
+            "top 3 sushi places in our database with 4.5 stars or more",
+            DatabaseQuery(cuisine="sushi", min_rating=4.5, limit=3),
+        ),
+        ("What restaurants do we have in our list?", DatabaseQuery()),
+        ("Show me Italian restaurants rated 4+", None),
+        ("Which Italian restaurants in our list are open late?", None),
+        ("Find sushi near downtown Austin", None),
+        ("Show me the restaurants near the river", None),
+        ("Show me the restaurants", None),
+    ],
+)
+def test_parse_database_query(message: str, query: Any) -> None:
+    """Tests that only clear list lookups skip the agent."""
+    assert parse_database_query(message) == query
+
+
+class FakeRestaurantDAO:
+    """Records filters and returns fixed restaurants."""
+
+    def __init__(self, restaurants: List[Restaurant]) -> None:
+        self.restaurants = restaurants
+        self.filters: List[Any] = []
+
+    async def filter(self, **kwargs: Any) -> List[Restaurant]:
+        self.filters.append(kwargs)
+        return self.restaurants
+
+
+@pytest.mark.anyio
+async def test_lookup_is_answered_from_database() -> None:
+    """Tests that a list lookup is formatted from the DAO results."""
+    load_all_models()
+    restaurant_dao = FakeRestaurantDAO(
+        [
+            Restaurant(title="Uchi", address="801 S Lamar", rating=5, reviews=3200),
+            Restaurant(title="Olive & June", rating=4),
+        ],
+    )
+
+    answer = await answer_from_database(
+        "best italian restaurants rated 4+ in our list",
+        restaurant_dao,  # type: ignore
+    )
+
+    assert restaurant_dao.filters == [
+        {"cuisine": "italian", "min_rating": 4.0, "limit": 10},
+    ]
+    assert answer == (
+        "Here are 2 Italian restaurants rated 4+ from our list:\n"
+        "1. Uchi, 801 S Lamar (rating 5, 3200 reviews)\n"
+        "2. Olive & June (rating 4)"
+    )
+    assert fast_path_routes.value(route="fast_path") >= 1
+
+
+def test_cuisine_wildcards_are_escaped() -> None:
+    """Tests that LIKE wildcards in a filter value match only themselves."""
+    load_all_models()
+
+    clause = contains_text(Restaurant.category, "50%_off\\").compile()
+
+    assert clause.params == {"category_1": "%50\\%\\_off\\\\%"}
+    assert "ESCAPE" in str(clause)
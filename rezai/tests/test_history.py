@@ -0,0 +1,71 @@
+from typing import List
+
+import pytest
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from rezai.agents.history import STALE_TOOL_RESULT, bound_history
+from rezai.settings import settings
+
+
+def make_turn(index: int, tool_output: str = "result") -> List[BaseMessage]:
+    """
+    Turn where the agent calls one tool before answering.
+
+    :param index: turn number.
+    :param tool_output: content of the tool result.
+    :return: messages of the turn.
+    """
+    call_id = f"call_{index}"
+    return [
+        HumanMessage(content=f"question {index}"),
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "web_search", "args": {}, "id": call_id}],
+        ),
+        ToolMessage(content=tool_output, tool_call_id=call_id),
+        AIMessage(content=f"answer {index}"),
+    ]
+
+
+def test_old_turns_are_summarized(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that only recent turns are sent and older ones are summarized."""
+    monkeypatch.setattr(settings, "agent_history_turns", 2)
+    messages = [message for index in range(5) for message in make_turn(index)]
+
+    prompt = bound_history("System.", messages)
+
+    assert "User: question 2\nTools used: web_search\nAssistant: answer 2" in (
+        prompt[0].content
+    )
+    assert "question 3" not in prompt[0].content
+    assert [message.content for message in prompt[1:]] == [
+        "question 3",
+        "",
+        STALE_TOOL_RESULT,
+        "answer 3",
+        "question 4",
+        "",
+        "result",
+        "answer 4",
+    ]
+
+
+def test_token_budget_keeps_current_turn(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that turns over the token budget are folded into the summary."""
+    monkeypatch.setattr(settings, "agent_context_max_tokens", 100)
+    messages = [
+        *make_turn(0),
+        *make_turn(1),
+        HumanMessage(content="question 2"),
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "web_search", "args": {}, "id": "call_2"}],
+        ),
+        ToolMessage(content="x" * 1000, tool_call_id="call_2"),
+    ]
+
+    prompt = bound_history("System.", messages)
+
+    assert "answer 1" in prompt[0].content
+    assert prompt[1].content == "question 2"
+    assert prompt[-1].content == "x" * 1000
@@ -0,0 +1,202 @@
+import hashlib
+import inspect
+import json
+import textwrap
+from typing import Any, Dict, List
+
+import anthropic
+import httpx
+import pytest
+from langchain_anthropic import ChatAnthropic, chat_models
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.tools import tool
+
+from rezai.agents.llm import PROMPT_CACHING_BETA, RateLimitedChatAnthropic
+
+USAGE = {
+    "input_tokens": 12,
+    "output_tokens": 3,
+    "cache_creation_input_tokens": 0,
+    "cache_read_input_tokens": 1500,
+}
+MESSAGE = {
+    "id": "msg_1",
+    "type": "message",
+    "role": "assistant",
+    "model": "claude-3-haiku-20240307",
+    "content": [{"type": "text", "text": "Where are you?"}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": USAGE,
+}
+STREAM_EVENTS = [
+    {"type": "message_start", "message": {**MESSAGE, "content": []}},
+    {
+        "type": "content_block_start",
+        "index": 0,
+        "content_block": {"type": "text", "text": ""},
+    },
+    {
+        "type": "content_block_delta",
+        "index": 0,
+        "delta": {"type": "text_delta", "text": "Where are you?"},
+    },
+    {"type": "content_block_stop", "index": 0},
+    {
+        "type": "message_delta",
+        "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+        "usage": {"output_tokens": 3},
+    },
+    {"type": "message_stop"},
+]
+# Digest of ChatAnthropic._astream and the private helpers it uses, in the
+# pinned langchain-anthropic. RateLimitedChatAnthropic._astream_events
+# follows them to keep the cache usage of streamed calls.
+UPSTREAM_STREAM_SHA256 = (
+    "7452188ae11d71fe9c1966f5b53402f8783511ea2213d751db4a4d3646da1646"
+)
+
+
+@tool
+async def web_search(query: str) -> str:
+    """
+    Search the web.
+
+    :param query: search query.
+    """
+    return query
+
+
+def create_llm(
+    requests: List[httpx.Request],
+    rate_limited: int = 0,
+) -> RateLimitedChatAnthropic:
+    """
+    Chat model talking to a local stand-in of the messages API.
+
+    :param requests: list the sent requests are recorded in.
+    :param rate_limited: number of first requests answered with a 429.
+    :return: chat model.
+    """
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) <= rate_limited:
+            return httpx.Response(
+                429,
+                json={"type": "error", "error": {"type": "rate_limit_error"}},
+                headers={"retry-after": "0"},
+            )
+        if not json.loads(request.content).get("stream"):
+            return httpx.Response(200, json=MESSAGE)
+        body = "".join(
+            f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            for event in STREAM_EVENTS
+        )
+        return httpx.Response(
+            200,
+            content=body.encode(),
+            headers={"content-type": "text/event-stream"},
+        )
+
+    llm = RateLimitedChatAnthropic(
+        model_name="claude-3-haiku-20240307",
+        api_key="test",  # type: ignore
+        prompt_caching=True,
+        system_prefix="Static prompt.",
+        max_retries=0,
+        rate_limit_retries=1,
+    )
+    client = anthropic.AsyncClient(
+        api_key="test",
+        max_retries=0,
+        default_headers={"anthropic-beta": PROMPT_CACHING_BETA},
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    object.__setattr__(llm, "_async_client", client)  # noqa: WPS609
+    return llm
+
+
+PROMPT = [
+    SystemMessage(content="Static prompt.\n\nSummary: asked for tacos."),
+    HumanMessage(content="Find me sushi"),
+]
+
+
+@pytest.mark.anyio
+async def test_static_prefix_is_marked_cacheable() -> None:
+    """Tests that tools, static system prompt and conversation are cached."""
+    requests: List[httpx.Request] = []
+    llm = create_llm(requests)
+
+    message = await llm.bind_tools([web_search]).ainvoke(PROMPT)
+
+    payload: Dict[str, Any] = json.loads(requests[0].content)
+    cache_control = {"type": "ephemeral"}
+    assert requests[0].headers["anthropic-beta"] == PROMPT_CACHING_BETA
+    assert payload["tools"][-1]["cache_control"] == cache_control
+    assert payload["system"] == [
+        {"type": "text", "text": "Static prompt.", "cache_control": cache_control},
+        {"type": "text", "text": "\n\nSummary: asked for tacos."},
+    ]
+    assert payload["messages"][-1]["content"] == [
+        {"type": "text", "text": "Find me sushi", "cache_control": cache_control},
+    ]
+    assert message.response_metadata["cache_usage"] == {
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 1500,
+    }
+
+
+@pytest.mark.anyio
+async def test_streamed_calls_report_cache_usage() -> None:
+    """Tests that cache usage of streamed calls reaches the message."""
+    requests: List[httpx.Request] = []
+    llm = create_llm(requests)
+
+    chunks = [chunk async for chunk in llm.astream(PROMPT)]
+
+    message = chunks[0]
+    for chunk in chunks[1:]:
+        message += chunk
+    assert message.content == "Where are you?"
+    assert message.response_metadata["cache_usage"]["cache_read_input_tokens"] == 1500
+    assert "cache_control" in json.loads(requests[0].content)["system"][0]
+
+
+@pytest.mark.anyio
+async def test_rate_limited_calls_are_retried_by_the_model() -> None:
+    """Tests that 429s are retried up to rate_limit_retries, streamed or not."""
+    requests: List[httpx.Request] = []
+    llm = create_llm(requests, rate_limited=1)
+
+    message = await llm.ainvoke(PROMPT)
+    assert message.content == "Where are you?"
+    assert len(requests) == 2
+
+    requests.clear()
+    chunks = [chunk async for chunk in llm.astream(PROMPT)]
+    assert "".join(str(chunk.content) for chunk in chunks) == "Where are you?"
+    assert len(requests) == 2
+
+    requests.clear()
+    with pytest.raises(anthropic.RateLimitError):
+        await create_llm(requests, rate_limited=2).ainvoke(PROMPT)
+    assert len(requests) == 2
+
+
+def test_streaming_follows_pinned_langchain_anthropic() -> None:
+    """Tests that the upstream streaming _astream_events follows is unchanged."""
+    source = "".join(
+        textwrap.dedent(inspect.getsource(function))
+        for function in (
+            ChatAnthropic._astream,  # noqa: WPS437
+            chat_models._make_message_chunk_from_anthropic_event,  # noqa: WPS437
+            chat_models._tools_in_params,  # noqa: WPS437
+        )
+    )
+
+    assert hashlib.sha256(source.encode()).hexdigest() == UPSTREAM_STREAM_SHA256, (
+        "ChatAnthropic streaming changed, update "
+        "RateLimitedChatAnthropic._astream_events and the digest."
+    )
@@ -0,0 +1,56 @@
+import pytest
+
+from rezai.agents.projection import (
+    PlaceRecord,
+    project_place_details,
+    project_places,
+    project_web_results,
+)
+from rezai.settings import settings
+
+
+def test_places_are_projected_and_capped(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that only configured fields of the first results are kept."""
+    monkeypatch.setattr(settings, "agent_search_max_results", 2)
+    monkeypatch.setattr(settings, "agent_search_fields", ["title", "rating"])
+    places = [
+        {"title": f"Place {index}", "rating": 4.5, "gps_coordinates": {}}
+        for index in range(5)
+    ]
+
+    assert project_places(places) == [
+        {"title": "Place 0", "rating": 4.5},
+        {"title": "Place 1", "rating": 4.5},
+    ]
+    assert not hasattr(PlaceRecord.from_payload(places[0]), "__dict__")
+
+
+def test_long_snippets_are_truncated(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that descriptions are cut to the configured length."""
+    monkeypatch.setattr(settings, "agent_snippet_max_chars", 10)
+
+    place_details = project_place_details(
+        {"title": "Cafe", "description": "A" * 50, "reviews_results": [{}]},
+    )
+
+    assert place_details["snippet"] == "A" * 10 + "…"
+    assert "reviews_results" not in place_details
+
+
+def test_web_results_keep_first_snippet() -> None:
+    """Tests that You.com hits are reduced to title, url and one snippet."""
+    search_results = {
+        "hits": [
+            {
+                "title": "Best tacos",
+                "url": "https://example.com",
+                "description": "Description",
+                "snippets": ["First", "Second"],
+            },
+        ],
+        "latency": 0.5,
+    }
+
+    assert project_web_results(search_results) == [
+        {"title": "Best tacos", "url": "https://example.com", "snippet": "First"},
+    ]
@@ -0,0 +1,48 @@
+import pytest
+from redis.asyncio import ConnectionPool
+
+from rezai.services.ratelimit import RateLimitExceeded, TokenBucket, ratelimit_wait
+
+
+@pytest.mark.anyio
+async def test_callers_queue_for_free_slots(fake_redis_pool: ConnectionPool) -> None:
+    """Tests that callers beyond the burst wait instead of failing."""
+    bucket = TokenBucket(fake_redis_pool, "test_queue", rate=100, capacity=1)
+
+    for _ in range(3):
+        await bucket.acquire()
+
+    assert ratelimit_wait.count(bucket="test_queue") == 3
+
+
+@pytest.mark.anyio
+async def test_long_waits_are_rejected(fake_redis_pool: ConnectionPool) -> None:
+    """Tests that a call is rejected when its wait exceeds max_wait."""
+    bucket = TokenBucket(
+        fake_redis_pool,
+        "test_reject",
+        rate=1,
+        capacity=1,
+        max_wait=0.1,
+    )
+    await bucket.acquire()
+
+    with pytest.raises(RateLimitExceeded):
+        await bucket.acquire()
+
+
+@pytest.mark.anyio
+async def test_debit_charges_future_callers(fake_redis_pool: ConnectionPool) -> None:
+    """Tests that usage charged after a call delays the next callers."""
+    bucket = TokenBucket(
+        fake_redis_pool,
+        "test_debit",
+        rate=1,
+        capacity=100,
+        max_wait=1,
+    )
+    await bucket.acquire(10)
+    await bucket.debit(200)
+
+    with pytest.raises(RateLimitExceeded):
+        await bucket.acquire(1)
@@ -0,0 +1,122 @@
+import asyncio
+from typing import Any, List
+
+import httpx
+import pytest
+from redis.asyncio import ConnectionPool
+
+from rezai.services.ratelimit import TokenBucket
+from rezai.services.resilience import (
+    ProviderGuard,
+    ProviderUnavailableError,
+    hedge_requests,
+    hedge_skipped,
+)
+from rezai.settings import settings
+
+
+@pytest.mark.anyio
+async def test_slow_request_is_hedged(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that a duplicate request wins when the first one stalls."""
+    monkeypatch.setattr(settings, "hedge_max_delay", 0.01)
+    guard = ProviderGuard("test_hedge")
+    delays = [1, 0]
+
+    async def request() -> Any:
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    assert await guard.call(request) == 0
+    assert hedge_requests.value(provider="test_hedge", won=True) == 1
+
+
+@pytest.mark.anyio
+async def test_hedges_take_a_rate_limit_token(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a hedge is only sent when the rate limit has a free token."""
+    monkeypatch.setattr(settings, "hedge_max_delay", 0.01)
+    guard = ProviderGuard("test_hedge_limit")
+    bucket = TokenBucket(fake_redis_pool, "test_hedge_limit", rate=0.1, capacity=3)
+    sent: List[int] = []
+
+    async def request() -> Any:
+        sent.append(1)
+        await asyncio.sleep(0.05)
+        return len(sent)
+
+    for _ in range(2):
+        await bucket.acquire()
+        await guard.call(request, bucket)
+
+    assert len(sent) == 3
+    assert hedge_skipped.value(provider="test_hedge_limit") == 1
+    assert not await bucket.try_acquire()
+
+
+@pytest.mark.anyio
+async def test_circuit_opens_after_failures(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that an unhealthy provider fails fast."""
+    monkeypatch.setattr(settings, "circuit_failure_threshold", 2)
+    guard = ProviderGuard("test_breaker")
+    calls: List[int] = []
+
+    async def request() -> Any:
+        calls.append(1)
+        raise httpx.ConnectTimeout("timed out")
+
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectTimeout):
+            await guard.call(request)
+    with pytest.raises(ProviderUnavailableError):
+        await guard.call(request)
+    assert len(calls) == 2
+
+
+@pytest.mark.anyio
+async def test_client_errors_keep_circuit_closed(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that 4xx responses are not counted against the provider."""
+    monkeypatch.setattr(settings, "circuit_failure_threshold", 1)
+    guard = ProviderGuard("test_client_error")
+    response = httpx.Response(404, request=httpx.Request("GET", "http://test"))
+
+    async def request() -> Any:
+        response.raise_for_status()
+
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            await guard.call(request)
+    assert guard.breaker.state == "closed"
+
+
+@pytest.mark.anyio
+async def test_client_error_completes_half_open_trial(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a 4xx answer to the trial call closes the circuit."""
+    monkeypatch.setattr(settings, "circuit_failure_threshold", 1)
+    monkeypatch.setattr(settings, "circuit_reset_timeout", 0)
+    guard = ProviderGuard("test_half_open")
+    http_request = httpx.Request("GET", "http://test")
+
+    async def unavailable() -> Any:
+        raise httpx.ConnectTimeout("timed out")
+
+    async def not_found() -> Any:
+        httpx.Response(404, request=http_request).raise_for_status()
+
+    async def found() -> Any:
+        return "ok"
+
+    with pytest.raises(httpx.ConnectTimeout):
+        await guard.call(unavailable)
+    assert guard.breaker.state == "open"
+    with pytest.raises(httpx.HTTPStatusError):
+        await guard.call(not_found)
+
+    assert guard.breaker.state == "closed"
+    assert await guard.call(found) == "ok"
@@ -0,0 +1,172 @@
+import asyncio
+from typing import Any, List
+
+import pytest
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from rezai.services.singleflight import SingleFlight, singleflight_calls
+from rezai.settings import settings
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_fetch() -> None:
+    """Tests that identical concurrent calls run the fetch once."""
+    flight = SingleFlight("test_shared")
+    calls: List[int] = []
+
+    async def fetch() -> Any:
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    results = await asyncio.gather(
+        *(flight.do(("sushi", "austin"), fetch) for _ in range(5)),
+    )
+
+    assert results == [{"answer": 42}] * 5
+    assert len(calls) == 1
+    assert singleflight_calls.value(group="test_shared", role="follower") == 4
+
+
+@pytest.mark.anyio
+async def test_errors_reach_every_caller() -> None:
+    """Tests that a failed call is reported to all coalesced callers."""
+    flight = SingleFlight("test_errors")
+
+    async def fetch() -> Any:
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    results = await asyncio.gather(
+        *(flight.do(("key",), fetch) for _ in range(3)),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.anyio
+async def test_fetch_is_cancelled_with_its_last_caller() -> None:
+    """Tests that the shared fetch stops only once every caller is gone."""
+    flight = SingleFlight("test_cancel")
+    fetch_cancelled = asyncio.Event()
+
+    async def fetch() -> Any:
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            fetch_cancelled.set()
+            raise
+
+    callers = [asyncio.ensure_future(flight.do(("key",), fetch)) for _ in range(2)]
+    await asyncio.sleep(0)
+    callers[0].cancel()
+    await asyncio.sleep(0.01)
+
+    assert not fetch_cancelled.is_set()
+
+    callers[1].cancel()
+    await asyncio.wait_for(fetch_cancelled.wait(), timeout=1)
+
+    assert singleflight_calls.value(group="test_cancel", role="cancelled") == 1
+
+
+@pytest.mark.anyio
+async def test_redis_lock_shares_result_between_workers(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a second worker reuses the result published by the first."""
+    monkeypatch.setattr(settings, "singleflight_redis_enabled", True)
+    first_worker = SingleFlight("test_redis")
+    second_worker = SingleFlight("test_redis")
+    calls: List[int] = []
+
+    async def fetch() -> Any:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ["result"]
+
+    results = await asyncio.gather(
+        first_worker.do(("key",), fetch, fake_redis_pool),
+        second_worker.do(("key",), fetch, fake_redis_pool),
+    )
+
+    assert results == [["result"], ["result"]]
+    assert len(calls) == 1
+
+
+@pytest.mark.anyio
+async def test_expired_leader_keeps_the_next_lock(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a leader only releases the redis lock it still holds."""
+    monkeypatch.setattr(settings, "singleflight_redis_enabled", True)
+    flight = SingleFlight("test_release")
+    lock_keys: List[bytes] = []
+
+    async def fetch() -> Any:
+        async with Redis(connection_pool=fake_redis_pool) as redis:
+            lock_keys.extend(await redis.keys("singleflight:test_release:*:lock"))
+            # The lock expired and another worker took it.
+            await redis.set(lock_keys[0], "next_leader")
+        return ["result"]
+
+    await flight.do(("key",), fetch, fake_redis_pool)
+
+    async with Redis(connection_pool=fake_redis_pool) as redis:
+        assert await redis.get(lock_keys[0]) == b"next_leader"
+
+
+@pytest.mark.anyio
+async def test_results_of_earlier_flights_are_not_shared(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a new flight drops the result an earlier one left behind."""
+    monkeypatch.setattr(settings, "singleflight_redis_enabled", True)
+    monkeypatch.setattr(settings, "singleflight_lock_timeout", 0.5)
+    first_worker = SingleFlight("test_leftover")
+    second_worker = SingleFlight("test_leftover")
+    results = iter([["first"], ["second"]])
+
+    async def fetch() -> Any:
+        await asyncio.sleep(0.05)
+        return next(results)
+
+    await first_worker.do(("key",), fetch, fake_redis_pool)
+    second_flight = await asyncio.gather(
+        first_worker.do(("key",), fetch, fake_redis_pool),
+        second_worker.do(("key",), fetch, fake_redis_pool),
+    )
+
+    assert second_flight == [["second"], ["second"]]
+
+
+@pytest.mark.anyio
+async def test_failed_publish_keeps_the_fetched_value(
+    fake_redis_pool: ConnectionPool,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a redis error after the fetch does not fetch again."""
+    monkeypatch.setattr(settings, "singleflight_redis_enabled", True)
+    flight = SingleFlight("test_publish")
+    calls: List[int] = []
+
+    async def fetch() -> Any:
+        calls.append(1)
+        return ["result"]
+
+    redis_set = Redis.set
+
+    async def failing_set(redis: Redis, name: str, *args: Any, **kwargs: Any) -> Any:
+        if name.endswith(":result"):
+            raise RedisError("connection lost")
+        return await redis_set(redis, name, *args, **kwargs)
+
+    monkeypatch.setattr(Redis, "set", failing_set)
+
+    assert await flight.do(("key",), fetch, fake_redis_pool) == ["result"]
+    assert len(calls) == 1
@@ -0,0 +1,218 @@
+import asyncio
+from typing import Any, AsyncGenerator, List
+
+import httpx
+import pytest
+from redis.asyncio import ConnectionPool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from rezai.db.dao.place_details_dao import PlaceDetailsDAO
+from rezai.services.http.client import describe_error
+from rezai.services.redis.cache import RedisCache, cache_requests
+from rezai.services.valueserp.prefetch import (
+    PlaceDetailsPrefetcher,
+    place_details_prefetch,
+)
+from rezai.services.valueserp.service import VALUESERP_BASE_URL, ValueSerpService
+from rezai.web.application import get_app
+
+
+@pytest.fixture
+async def sent_requests() -> List[httpx.Request]:
+    """
+    Requests received by the fake ValueSerp API.
+
+    :return: list of requests.
+    """
+    return []
+
+
+@pytest.fixture
+async def valueserp_client(
+    sent_requests: List[httpx.Request],
+) -> AsyncGenerator[httpx.AsyncClient, None]:
+    """
+    HTTP client answering ValueSerp calls locally.
+
+    :param sent_requests: list where the received requests are stored.
+    :yield: http client.
+    """
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent_requests.append(request)
+        title = f"Result {len(sent_requests)}"
+        if request.url.params["search_type"] == "place_details":
+            data_cid = request.url.params["data_cid"]
+            if data_cid == "missing":
+                return httpx.Response(404)
+            return httpx.Response(
+                200,
+                json={"place_details": {"data_cid": data_cid, "title": title}},
+            )
+        return httpx.Response(200, json={"places_results": [{"title": title}]})
+
+    async with httpx.AsyncClient(
+        base_url=VALUESERP_BASE_URL,
+        transport=httpx.MockTransport(handler),
+    ) as client:
+        yield client
+
+
+@pytest.mark.anyio
+async def test_search_places_uses_shared_client(
+    valueserp_client: httpx.AsyncClient,
+    sent_requests: List[httpx.Request],
+) -> None:
+    """Tests that the service sends every call through the injected client."""
+    service = ValueSerpService(client=valueserp_client, api_key="key")
+    await service.search_places("sushi", "Austin")
+    await service.search_places("sushi", "Austin")
+
+    assert len(sent_requests) == 2
+    assert sent_requests[0].url.path == "/search"
+    assert sent_requests[0].url.params["q"] == "sushi"
+
+
+@pytest.mark.anyio
+async def test_search_places_cache_hit(
+    valueserp_client: httpx.AsyncClient,
+    sent_requests: List[httpx.Request],
+    fake_redis_pool: ConnectionPool,
+) -> None:
+    """Tests that normalized repeat searches are served from redis."""
+    service = ValueSerpService(client=valueserp_client, redis_pool=fake_redis_pool)
+    hits = cache_requests.value(cache="valueserp_search_places", result="hit")
+
+    first = await service.search_places("Sushi  in Austin", "Austin, TX")
+    second = await service.search_places("sushi in austin", " austin, tx")
+
+    assert first == second == [{"title": "Result 1"}]
+    assert len(sent_requests) == 1
+    assert (
+        cache_requests.value(cache="valueserp_search_places", result="hit") == hits + 1
+    )
+
+
+@pytest.mark.anyio
+async def test_stale_entry_is_refreshed_in_background(
+    fake_redis_pool: ConnectionPool,
+) -> None:
+    """Tests that stale entries are served while a refresh runs."""
+    cache = RedisCache(fake_redis_pool, name="test", ttl=0, stale_ttl=60)
+    calls: List[int] = []
+
+    async def fetch() -> Any:
+        calls.append(1)
+        return "old" if len(calls) == 1 else "new"
+
+    assert await cache.get_or_fetch(("key",), fetch) == "old"
+    assert await cache.get_or_fetch(("key",), fetch) == "old"
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if await cache.get_or_fetch(("key",), fetch) == "new":
+            break
+    assert await cache.get_or_fetch(("key",), fetch) == "new"
+
+
+@pytest.mark.anyio
+async def test_place_details_batch_reports_errors_per_item(
+    valueserp_client: httpx.AsyncClient,
+    sent_requests: List[httpx.Request],
+) -> None:
+    """Tests that a failed place does not fail the rest of the batch."""
+    service = ValueSerpService(client=valueserp_client)
+
+    results = {
+        result.data_cid: result
+        async for result in service.get_place_details_many(
+            ["1", "missing", "2", "1"],
+        )
+    }
+
+    assert set(results) == {"1", "2", "missing"}
+    assert len(sent_requests) == 3
+    assert results["1"].place_details["data_cid"] == "1"
+    assert results["1"].error is None
+    assert isinstance(results["missing"].error, httpx.HTTPStatusError)
+
+
+@pytest.mark.anyio
+async def test_place_details_read_through(
+    valueserp_client: httpx.AsyncClient,
+    sent_requests: List[httpx.Request],
+    dbsession: AsyncSession,
+) -> None:
+    """Tests that place details are fetched once and then served from the DB."""
+    dao = PlaceDetailsDAO(dbsession)
+    service = ValueSerpService(client=valueserp_client, place_details_dao=dao)
+
+    first = await service.get_place_details("123")
+    second = await service.get_place_details("123")
+
+    assert first == second == {"data_cid": "123", "title": "Result 1"}
+    assert len(sent_requests) == 1
+    stored = await dao.get_place_details("123")
+    assert stored is not None
+    assert stored.payload == first
+
+
+@pytest.mark.anyio
+async def test_place_details_are_prefetched_after_search(
+    sent_requests: List[httpx.Request],
+) -> None:
+    """Tests that details of the top results are fetched once, in the background."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent_requests.append(request)
+        if request.url.params["search_type"] == "place_details":
+            data_cid = request.url.params["data_cid"]
+            return httpx.Response(200, json={"place_details": {"data_cid": data_cid}})
+        places = [{"title": f"Place {cid}", "data_cid": cid} for cid in "1234"]
+        return httpx.Response(200, json={"places_results": places})
+
+    async with httpx.AsyncClient(
+        base_url=VALUESERP_BASE_URL,
+        transport=httpx.MockTransport(handler),
+    ) as client:
+        prefetcher = PlaceDetailsPrefetcher(client)
+        service = ValueSerpService(client=client, prefetcher=prefetcher)
+        hits = place_details_prefetch.value(result="hit")
+
+        await service.search_places("sushi", "Austin")
+        first = await service.get_place_details("1")
+        fourth = await service.get_place_details("4")
+        await prefetcher.close()
+
+    details_calls = [
+        request.url.params["data_cid"]
+        for request in sent_requests
+        if request.url.params["search_type"] == "place_details"
+    ]
+    assert first == {"data_cid": "1"}
+    assert fourth == {"data_cid": "4"}
+    assert sorted(details_calls) == ["1", "2", "3", "4"]
+    assert place_details_prefetch.value(result="hit") == hits + 1
+
+
+def test_described_errors_leave_out_the_request_url() -> None:
+    """Tests that errors sent to clients do not carry the API key."""
+    request = httpx.Request("GET", "https://api.valueserp.com/search?api_key=SECRET")
+    error = httpx.HTTPStatusError(
+        "Client error for url 'https://api.valueserp.com/search?api_key=SECRET'",
+        request=request,
+        response=httpx.Response(404, request=request),
+    )
+
+    assert describe_error(error) == "HTTP 404"
+    assert describe_error(httpx.ConnectTimeout("SECRET")) == "ConnectTimeout"
+
+
+def test_place_details_batch_documents_ndjson() -> None:
+    """Tests that the batch route documents its lines instead of a JSON body."""
+    operation = get_app().openapi()["paths"]["/api/valueserp/place_details/batch"]
+    content = operation["post"]["responses"]["200"]["content"]
+
+    assert list(content) == ["application/x-ndjson"]
+    assert content["application/x-ndjson"]["schema"]["title"] == (
+        "PlaceDetailsBatchItem"
+    )
@@ -0,0 +1,51 @@
+from typing import AsyncGenerator, Optional
+
+from fastapi import Depends, Header, HTTPException
+from redis.asyncio import ConnectionPool
+
+from rezai.services.admission import (
+    AdmissionRejected,
+    chat_admission,
+    is_internal_caller,
+    parse_priority,
+)
+from rezai.services.redis.dependency import get_redis_pool
+from rezai.settings import settings
+
+
+async def admit_chat_request(
+    x_priority: Optional[str] = Header(None),
+    x_internal_token: Optional[str] = Header(None),
+    redis_pool: ConnectionPool = Depends(get_redis_pool),
+) -> AsyncGenerator[None, None]:
+    """
+    Hold an admission slot of the worker for the whole chat response.
+
+    Declared on the route, so it runs before the database session and
+    the services of the request are created. Requests that find the queue
+    full get a 429, requests that waited ``admission_max_wait`` without
+    a slot get a 503, both with Retry-After.
+
+    High priority is only honored for internal callers, see
+    ``parse_priority``, client requests asking for it are queued as normal.
+
+    :param x_priority: priority class: high, normal or low.
+    :param x_internal_token: token of internal callers.
+    :param redis_pool: redis connection pool for the shared limit.
+    :raises HTTPException: if the request is not admitted.
+    :yield: nothing.
+    """
+    if not settings.admission_enabled:
+        yield
+        return
+    try:
+        priority = parse_priority(x_priority, is_internal_caller(x_internal_token))
+        async with chat_admission.admit(priority, redis_pool):
+            yield
+    except AdmissionRejected as exc:
+        overloaded = exc.reason == "timeout"
+        raise HTTPException(
+            status_code=503 if overloaded else 429,
+            detail="The chat is busy, retry later.",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
@@ -0,0 +1,248 @@
+import asyncio
+import uuid
+from typing import Any, AsyncIterator, NamedTuple, Optional, Tuple
+
+import anyio
+import orjson
+from loguru import logger
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from rezai.settings import settings
+from rezai.web.api.chat.schema import ChatEvent, DoneEvent, ErrorEvent
+from rezai.web.responses import model_json
+
+# Sent while waiting for new events, so proxies keep the connection open.
+KEEPALIVE = b": keepalive\n\n"
+
+
+class StreamPosition(NamedTuple):
+    """Position in a buffered chat stream, as sent in the SSE event id."""
+
+    turn_id: str
+    entry_id: str = "0-0"
+
+
+def parse_event_id(event_id: str) -> Optional[StreamPosition]:
+    """
+    Parse the ``Last-Event-ID`` sent by a reconnecting client.
+
+    :param event_id: SSE event id, ``{turn_id}:{entry_id}``.
+    :return: position after which to resume, or None if malformed.
+    """
+    turn_id, _, entry_id = event_id.partition(":")
+    if not turn_id or not entry_id:
+        return None
+    return StreamPosition(turn_id, entry_id)
+
+
+class ChatStreamBuffer:
+    """
+    Buffers the chat events of a turn in a redis stream.
+
+    The agent turn writes its events to the stream in a background task,
+    and clients read them from there. A client that lost the connection
+    resumes after the last event it got instead of running the turn again.
+    Streams expire ``chat_stream_ttl`` seconds after their last event.
+
+    :param redis_pool: redis connection pool.
+    """
+
+    def __init__(self, redis_pool: ConnectionPool) -> None:
+        self.redis_pool = redis_pool
+
+    def start(
+        self,
+        thread_id: str,
+        events: AsyncIterator[ChatEvent],
+        turn_id: Optional[str] = None,
+    ) -> Tuple[str, "asyncio.Task[None]"]:
+        """
+        Start buffering the events of a new turn.
+
+        :param thread_id: thread of the turn.
+        :param events: chat events of the turn, ending with a done event.
+        :param turn_id: id of the turn, a new one by default.
+        :return: turn id and the task writing the events.
+        """
+        turn_id = turn_id or uuid.uuid4().hex
+        task = asyncio.create_task(self._produce(thread_id, turn_id, events))
+        return turn_id, task
+
+    async def reserve(self, thread_id: str, turn_id: str) -> None:
+        """
+        Create the empty stream of a turn before its first event.
+
+        Until then the turn could not be told apart from an expired one
+        by ``exists``. An entry is added and deleted, redis keeps the
+        empty stream.
+
+        :param thread_id: thread of the turn.
+        :param turn_id: id of the turn.
+        """
+        key = self._key(thread_id, turn_id)
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.xadd(key, {"data": ""}, id="0-1")
+                    pipe.xdel(key, "0-1")
+                    pipe.expire(key, settings.chat_stream_ttl)
+                    await pipe.execute()
+        except RedisError as exc:
+            logger.warning("Chat stream {} is unavailable: {}", key, exc)
+
+    async def exists(self, thread_id: str, turn_id: str) -> bool:
+        """
+        Whether the events of a turn are still buffered.
+
+        :param thread_id: thread of the turn.
+        :param turn_id: turn id from the event id.
+        :return: True if the stream can be resumed.
+        """
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            return bool(await redis.exists(self._key(thread_id, turn_id)))
+
+    async def read(
+        self,
+        thread_id: str,
+        position: StreamPosition,
+        producer: "Optional[asyncio.Task[None]]" = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream the buffered events of a turn as SSE, following new ones.
+
+        :param thread_id: thread of the turn.
+        :param position: turn and entry after which to start.
+        :param producer: task writing the turn, see ``entries``.
+        :yield: SSE frames, keepalive comments while the turn is running.
+        """
+        async for entry in self.entries(thread_id, position, producer):
+            if entry is None:
+                yield KEEPALIVE
+                continue
+            event_id, event_type, data = entry
+            header = f"id: {event_id}\nevent: {event_type}\ndata: "
+            yield header.encode("utf-8") + data + b"\n\n"
+
+    async def read_ndjson(
+        self,
+        thread_id: str,
+        position: StreamPosition,
+        producer: "Optional[asyncio.Task[None]]" = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream the buffered events of a turn as NDJSON, following new ones.
+
+        :param thread_id: thread of the turn.
+        :param position: turn and entry after which to start.
+        :param producer: task writing the turn, see ``entries``.
+        :yield: one JSON line per event.
+        """
+        async for entry in self.entries(thread_id, position, producer):
+            if entry is not None:
+                yield entry[2] + b"\n"
+
+    async def entries(
+        self,
+        thread_id: str,
+        position: StreamPosition,
+        producer: "Optional[asyncio.Task[None]]" = None,
+    ) -> AsyncIterator[Optional[Tuple[str, str, bytes]]]:
+        """
+        Read the buffered events of a turn, following new ones until done.
+
+        :param thread_id: thread of the turn.
+        :param position: turn and entry after which to start.
+        :param producer: task writing the turn, when this request started it.
+            It is awaited before returning, so the services of the request
+            stay open until the turn is complete, even if the client left.
+        :yield: event id, type and encoded JSON of every event, None when no event
+            came for ``chat_stream_keepalive_ms``.
+        """
+        key = self._key(thread_id, position.turn_id)
+        last_id = position.entry_id
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                while True:
+                    response = await redis.xread(
+                        {key: last_id},
+                        block=settings.chat_stream_keepalive_ms,
+                    )
+                    if not response:
+                        if producer is not None and producer.done():
+                            return
+                        if not await redis.exists(key):
+                            return
+                        yield None
+                        continue
+                    for entry_id, fields in response[0][1]:
+                        last_id = _decode(entry_id)
+                        data = fields[b"data"]
+                        event_type = fields.get(b"type")
+                        if event_type is None:
+                            # Written before the type had its own field.
+                            event_type = orjson.loads(data)["type"]
+                        event_type = _decode(event_type)
+                        yield f"{position.turn_id}:{last_id}", event_type, data
+                        if event_type == "done":
+                            return
+        finally:
+            if producer is not None:
+                with anyio.CancelScope(shield=True):
+                    await producer
+
+    async def _produce(
+        self,
+        thread_id: str,
+        turn_id: str,
+        events: AsyncIterator[ChatEvent],
+    ) -> None:
+        key = self._key(thread_id, turn_id)
+        finished = False
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                async for event in events:
+                    await self._append(redis, key, event)
+                    finished = event.type == "done"
+        except RedisError as exc:
+            logger.warning("Chat stream {} is unavailable: {}", key, exc)
+        except Exception:
+            logger.exception("Chat stream {} failed", key)
+        finally:
+            aclose = getattr(events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            if not finished:
+                # Readers wait for a done event, end the stream for them.
+                await self._end(key, thread_id)
+
+    async def _append(self, redis: Redis, key: str, event: ChatEvent) -> None:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(
+                key,
+                {"type": event.type, "data": model_json(event)},
+                maxlen=settings.chat_stream_max_events,
+                approximate=True,
+            )
+            pipe.expire(key, settings.chat_stream_ttl)
+            await pipe.execute()
+
+    async def _end(self, key: str, thread_id: str) -> None:
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                await self._append(
+                    redis,
+                    key,
+                    ErrorEvent(detail="The turn failed."),
+                )
+                await self._append(redis, key, DoneEvent(thread_id=thread_id))
+        except Exception as exc:
+            logger.warning("Chat stream {} could not be ended: {}", key, exc)
+
+    @staticmethod
+    def _key(thread_id: str, turn_id: str) -> str:
+        return f"chat_stream:{thread_id}:{turn_id}"
+
+
+def _decode(raw: Any) -> str:
+    return raw.decode("utf-8") if isinstance(raw, bytes) else raw
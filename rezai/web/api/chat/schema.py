@@ -1,4 +1,4 @@
-from typing import Any, Dict, Iterable, List, Optional, Union
+from typing import Any, Dict, Iterable, List, Literal, Optional, Union
 
 from anthropic.types import MessageParam
 from pydantic import BaseModel
@@ -29,3 +29,80 @@ class GenerateResponse(BaseModel):
     stop_reason: str
     stop_sequence: Optional[str]
     usage: Dict[str, int]
+
+
+class TokenEvent(BaseModel):
+    """Text generated by the model, sent as it arrives."""
+
+    type: Literal["token"] = "token"
+    text: str
+
+
+class ToolStartEvent(BaseModel):
+    """The agent started a tool call. ``id`` matches the tool_end event."""
+
+    type: Literal["tool_start"] = "tool_start"
+    id: str
+    tool: str
+    input: Dict[str, Any]
+
+
+class ToolEndEvent(BaseModel):
+    """A tool call finished, ``output`` is what the model will see."""
+
+    type: Literal["tool_end"] = "tool_end"
+    id: str
+    tool: str
+    output: Any = None
+
+
+class MessageEvent(BaseModel):
+    """Final assistant message of the turn."""
+
+    type: Literal["message"] = "message"
+    content: str
+
+
+class ErrorEvent(BaseModel):
+    """The turn failed, no more events follow except done."""
+
+    type: Literal["error"] = "error"
+    detail: str
+
+
+class DoneEvent(BaseModel):
+    """Last event of every stream."""
+
+    type: Literal["done"] = "done"
+    thread_id: str
+
+
+class PingEvent(BaseModel):
+    """Keepalive sent on idle WebSocket sessions, answered with a pong."""
+
+    type: Literal["ping"] = "ping"
+
+
+class PongEvent(BaseModel):
+    """Answer to a ping."""
+
+    type: Literal["pong"] = "pong"
+
+
+class ClientMessage(BaseModel):
+    """User message sent on a WebSocket session."""
+
+    type: Literal["message"] = "message"
+    message: str
+    # Where the user is looking for restaurants, if not said in the message
+    location: Optional[str] = None
+
+
+ChatEvent = Union[
+    TokenEvent,
+    ToolStartEvent,
+    ToolEndEvent,
+    MessageEvent,
+    ErrorEvent,
+    DoneEvent,
+]
@@ -0,0 +1,167 @@
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+
+import anyio
+from fastapi.responses import StreamingResponse
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables.schema import StreamEvent
+from loguru import logger
+from pydantic_core import to_jsonable_python
+from starlette.types import Receive, Scope, Send
+
+from rezai.agents.cancellation import aclosing
+from rezai.agents.llm import content_text
+from rezai.services.http.client import describe_error
+from rezai.web.api.chat.schema import (
+    ChatEvent,
+    DoneEvent,
+    ErrorEvent,
+    MessageEvent,
+    TokenEvent,
+    ToolEndEvent,
+    ToolStartEvent,
+)
+from rezai.web.responses import model_line
+
+
+def turn_input(
+    thread_id: str,
+    message: str,
+    location: Optional[str] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Graph input and config of a chat turn.
+
+    :param thread_id: thread of the turn.
+    :param message: user message.
+    :param location: where the user is looking for restaurants.
+    :return: graph input and run config.
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    content = message
+    if location:
+        content = f"{content}\n\nLocation: {location}"
+    input_data = {
+        "messages": [
+            {"role": "user", "content": content},
+        ],
+    }
+    return input_data, config
+
+
+def tool_output(output: Any) -> Any:
+    """
+    Tool output as sent to the model.
+
+    Objects JSON has no type for are sent as their string form.
+
+    :param output: tool output or ToolMessage.
+    :return: JSON-serializable output.
+    """
+    if isinstance(output, BaseMessage):
+        output = output.content
+    return to_jsonable_python(output, fallback=str)
+
+
+async def chat_events(
+    events: AsyncIterator[StreamEvent],
+    thread_id: str,
+) -> AsyncIterator[ChatEvent]:
+    """
+    Convert graph events into chat events.
+
+    Only new content is sent: model tokens, tool calls and the final
+    message. The stream always ends with a done event. Errors are sent
+    as their type or status code only, their messages may hold provider
+    URLs with API keys.
+
+    :param events: astream_events (v2) of an agent run.
+    :param thread_id: thread of the run.
+    :yield: chat events.
+    """
+    try:
+        async with aclosing(events):
+            async for event in events:
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    text = content_text(event["data"]["chunk"].content)
+                    if text:
+                        yield TokenEvent(text=text)
+                elif kind == "on_chat_model_end":
+                    message = event["data"]["output"]
+                    if not getattr(message, "tool_calls", None):
+                        yield MessageEvent(content=content_text(message.content))
+                elif kind == "on_tool_start":
+                    yield ToolStartEvent(
+                        id=event["run_id"],
+                        tool=event["name"],
+                        input=event["data"].get("input") or {},
+                    )
+                elif kind == "on_tool_end":
+                    yield ToolEndEvent(
+                        id=event["run_id"],
+                        tool=event["name"],
+                        output=tool_output(event["data"].get("output")),
+                    )
+                elif kind == "on_tool_error":
+                    error = event["data"].get("error")
+                    logger.opt(exception=error).warning(
+                        "Tool {} of thread {} failed",
+                        event["name"],
+                        thread_id,
+                    )
+                    yield ToolEndEvent(
+                        id=event["run_id"],
+                        tool=event["name"],
+                        output=f"Error: {describe_error(error)}",
+                    )
+    except Exception as exc:
+        logger.exception("Chat turn of thread {} failed", thread_id)
+        yield ErrorEvent(detail=f"The turn failed: {describe_error(exc)}")
+    yield DoneEvent(thread_id=thread_id)
+
+
+async def ndjson(events: AsyncIterator[ChatEvent]) -> AsyncIterator[bytes]:
+    """
+    Frame chat events as newline-delimited JSON.
+
+    :param events: chat events.
+    :yield: one JSON line per event.
+    """
+    async with aclosing(events):
+        async for event in events:
+            yield model_line(event)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    Streaming response that closes its body when the client goes away.
+
+    On a disconnect Starlette stops sending, but leaves the body generator
+    suspended, and with it the agent run it drives. Closing it cancels the
+    run, its tool calls and their HTTP requests.
+
+    A body generator that never started does not close the streams it
+    wraps. Streams holding resources, such as a thread lease, are passed
+    as ``streams`` and closed after the body.
+
+    :param streams: streams wrapped by the body, closed with it.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        streams: Sequence[Any] = (),
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.streams = streams
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                for stream in (self.body_iterator, *self.streams):
+                    aclose = getattr(stream, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
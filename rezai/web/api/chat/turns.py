@@ -0,0 +1,238 @@
+import asyncio
+import uuid
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Dict,
+    NamedTuple,
+    Optional,
+    Set,
+)
+
+from loguru import logger
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from rezai.agents.lease import ThreadLease
+from rezai.agents.restaurant_search_agent import RestaurantAgentContainer
+from rezai.metrics import metrics
+from rezai.settings import BusyThreadPolicy, settings
+from rezai.web.api.chat.resumable import ChatStreamBuffer, StreamPosition
+from rezai.web.api.chat.schema import ChatEvent
+from rezai.web.api.chat.streaming import chat_events
+
+chat_submissions = metrics.counter(
+    "chat_submissions_total",
+    "Chat submissions that did not start a turn, per result: replayed for a "
+    "known idempotency key, attached to the running turn, or rejected.",
+)
+
+
+# Lease releases of finished producers, referenced until they are done.
+_closing: Set["asyncio.Task[None]"] = set()
+
+BUSY_THREAD_DETAIL = "Another turn of this thread is running, retry when it is done."
+
+
+class BusyThreadError(Exception):
+    """Another turn of the thread is running."""
+
+
+class LeasedStream:
+    """
+    Stream of a turn that holds the lease of its thread.
+
+    The lease is held from the start, and released once the stream is
+    exhausted, fails or is closed, also when it is closed before it was
+    ever iterated.
+
+    :param hold: entered ``ThreadLease.held`` of the turn.
+    :param stream: stream of the turn.
+    """
+
+    def __init__(
+        self,
+        hold: AsyncContextManager[None],
+        stream: AsyncIterator[Any],
+    ) -> None:
+        self._hold = hold
+        self._stream = stream
+        self._closed = False
+
+    def __aiter__(self) -> "LeasedStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._closed:
+            raise StopAsyncIteration
+        try:
+            return await self._stream.__anext__()
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self) -> None:
+        """Close the stream and release the lease."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            aclose = getattr(self._stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            await self._hold.__aexit__(None, None, None)
+
+
+class ChatTurn(NamedTuple):
+    """
+    Events of a chat turn, for the response.
+
+    Buffered turns are read from ``position``, with ``producer`` set when
+    this request runs the turn. Other turns stream ``events`` directly.
+    """
+
+    position: Optional[StreamPosition] = None
+    producer: "Optional[asyncio.Task[None]]" = None
+    events: Optional[AsyncIterator[ChatEvent]] = None
+
+
+class ChatTurns:
+    """
+    Starts chat turns, one at a time per thread.
+
+    A submission with a known idempotency key gets the events of the turn
+    it started before, instead of running it again. A submission for a
+    thread with a running turn is rejected, or attached to the running turn
+    when ``chat_busy_thread_policy`` is ``attach`` and the turn is buffered.
+
+    :param container: agent container of the request.
+    :param redis_pool: redis connection pool.
+    """
+
+    def __init__(
+        self,
+        container: RestaurantAgentContainer,
+        redis_pool: ConnectionPool,
+    ) -> None:
+        self.container = container
+        self.redis_pool = redis_pool
+        self.lease = ThreadLease(redis_pool)
+        self.buffer = ChatStreamBuffer(redis_pool)
+
+    async def start(
+        self,
+        input_data: Dict[str, Any],
+        config: Dict[str, Any],
+        idempotency_key: Optional[str] = None,
+        buffered: bool = False,
+    ) -> ChatTurn:
+        """
+        Start a turn, or find the turn to follow instead.
+
+        Turns are buffered in redis when asked, when they have an idempotency
+        key, or when busy threads are attached to, so they can be replayed.
+
+        :param input_data: graph input.
+        :param config: run config holding the thread_id.
+        :param idempotency_key: client key of the submission.
+        :param buffered: always buffer the turn.
+        :raises BusyThreadError: if the thread is busy and cannot be attached to.
+        :return: turn to respond with.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        idempotency_redis_key = None
+        if idempotency_key:
+            idempotency_redis_key = f"chat_idempotency:{thread_id}:{idempotency_key}"
+            known_turn = await self._known_turn(thread_id, idempotency_redis_key)
+            if known_turn is not None:
+                chat_submissions.inc(result="replayed")
+                return ChatTurn(position=StreamPosition(known_turn))
+        attach = settings.chat_busy_thread_policy == BusyThreadPolicy.ATTACH
+        turn_id = uuid.uuid4().hex
+        holder = await self.lease.acquire(thread_id, turn_id)
+        if holder is not None:
+            if attach and holder and await self.buffer.exists(thread_id, holder):
+                chat_submissions.inc(result="attached")
+                return ChatTurn(position=StreamPosition(holder))
+            chat_submissions.inc(result="rejected")
+            raise BusyThreadError()
+        events = await self.leased(
+            thread_id,
+            turn_id,
+            chat_events(self.container.stream_events(input_data, config), thread_id),
+        )
+        if not (buffered or attach or idempotency_redis_key):
+            return ChatTurn(events=events)
+        try:
+            await self.buffer.reserve(thread_id, turn_id)
+            if idempotency_redis_key is not None:
+                await self._remember_turn(idempotency_redis_key, turn_id)
+        except BaseException:
+            await events.aclose()
+            raise
+        _, producer = self.buffer.start(thread_id, events, turn_id)
+        # The producer closes the events when it ends. A producer cancelled
+        # before it ran never does, the lease must not outlive it either way.
+        producer.add_done_callback(lambda _: _close_in_background(events))
+        return ChatTurn(position=StreamPosition(turn_id), producer=producer)
+
+    async def acquire(self, thread_id: str) -> str:
+        """
+        Take the lease of a thread for a turn that is not buffered.
+
+        :param thread_id: thread of the turn.
+        :raises BusyThreadError: if another turn of the thread is running.
+        :return: id of the new turn, to pass to ``leased``.
+        """
+        turn_id = uuid.uuid4().hex
+        if await self.lease.acquire(thread_id, turn_id) is not None:
+            chat_submissions.inc(result="rejected")
+            raise BusyThreadError()
+        return turn_id
+
+    async def leased(
+        self,
+        thread_id: str,
+        turn_id: str,
+        stream: AsyncIterator[Any],
+    ) -> LeasedStream:
+        """
+        Hold the lease of a thread until a stream is consumed or closed.
+
+        :param thread_id: thread of the turn.
+        :param turn_id: turn holding the lease.
+        :param stream: stream of the turn.
+        :return: stream releasing the lease when closed.
+        """
+        hold = self.lease.held(thread_id, turn_id)
+        await hold.__aenter__()
+        return LeasedStream(hold, stream)
+
+    async def _known_turn(self, thread_id: str, redis_key: str) -> Optional[str]:
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                turn_id = await redis.get(redis_key)
+        except RedisError as exc:
+            logger.warning("Idempotency keys are unavailable: {}", exc)
+            return None
+        if turn_id is None:
+            return None
+        turn_id = turn_id.decode("utf-8")
+        if not await self.buffer.exists(thread_id, turn_id):
+            return None
+        return turn_id
+
+    async def _remember_turn(self, redis_key: str, turn_id: str) -> None:
+        try:
+            async with Redis(connection_pool=self.redis_pool) as redis:
+                await redis.set(redis_key, turn_id, ex=settings.chat_stream_ttl)
+        except RedisError as exc:
+            logger.warning("Idempotency keys are unavailable: {}", exc)
+
+
+def _close_in_background(events: LeasedStream) -> None:
+    task = asyncio.ensure_future(events.aclose())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
@@ -1,13 +1,22 @@
-import json
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, WebSocket
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from redis.asyncio import ConnectionPool
 
+from rezai.agents.cancellation import aclosing
 from rezai.agents.restaurant_search_agent import (
     RestaurantAgentContainer,
     get_restaurant_agent_container,
 )
+from rezai.services.redis.dependency import get_redis_pool
+from rezai.web.api.chat.admission import admit_chat_request
+from rezai.web.api.chat.resumable import parse_event_id
+from rezai.web.api.chat.streaming import ClosingStreamingResponse, ndjson, turn_input
+from rezai.web.api.chat.turns import BUSY_THREAD_DETAIL, BusyThreadError, ChatTurns
+from rezai.web.api.chat.websocket import ChatSession
+from rezai.web.responses import json_line
 
 router = APIRouter()
 
@@ -15,51 +24,217 @@ router = APIRouter()
 class ChatRequest(BaseModel):
     message: str
     thread_id: str
+    # Where the user is looking for restaurants, if not said in the message
+    location: Optional[str] = None
+    # "events" streams only new content, "values" the full state after each step
+    stream_mode: Literal["events", "values"] = "events"
 
 
 class ChatResponse(BaseModel):
     response: str
 
 
-@router.post("/chat", response_model=ChatResponse)
+def _busy_thread() -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail=BUSY_THREAD_DETAIL,
+        headers={"Retry-After": "1"},
+    )
+
+
+@router.post(
+    "/chat",
+    response_model=ChatResponse,
+    dependencies=[Depends(admit_chat_request)],
+)
 async def chat_with_restaurant_agent(
     request: ChatRequest,
+    idempotency_key: Optional[str] = Header(None),
     agent_container: RestaurantAgentContainer = Depends(get_restaurant_agent_container),
+    redis_pool: ConnectionPool = Depends(get_redis_pool),
 ) -> StreamingResponse:
     """
     Endpoint for chatting with the restaurant agent.
 
     This endpoint receives a chat request containing a user's message and processes it using
-    the restaurant agent. It returns the assistant's response as a ChatResponse.
+    the restaurant agent. The response is a stream of NDJSON events, one per line, each with a
+    ``type`` field:
+
+    - ``token``: ``text`` generated by the model, sent as it arrives.
+    - ``tool_start``: the agent called ``tool`` with ``input``, ``id`` identifies the call.
+    - ``tool_end``: the call ``id`` of ``tool`` finished with ``output``.
+    - ``message``: final assistant message ``content`` of the turn.
+    - ``error``: the turn failed with ``detail``.
+    - ``done``: last event of the stream, with the ``thread_id``.
+
+    First messages of new threads may be answered from the answer cache, in that case only
+    ``token``, ``message`` and ``done`` events are sent.
+
+    When the client disconnects the turn is cancelled, and the thread gets placeholder
+    messages for the unfinished tool calls and answer.
+
+    One turn runs at a time per thread. A request for a thread with a running turn gets
+    a 409, or with ``chat_busy_thread_policy`` set to ``attach`` the events of the running
+    turn. A request repeating the ``Idempotency-Key`` header of an earlier one gets the
+    events of that turn again instead of a new run, for ``chat_stream_ttl`` seconds.
+
+    Turns are admitted by the worker's admission control, see ``admit_chat_request``,
+    and queued by the ``X-Priority`` header (high, normal or low) when it is busy. High is
+    only honored for internal callers sending ``X-Internal-Token``, others get normal.
+
+    With ``stream_mode`` set to ``values`` the previous format is kept:
+    the content of every message in the state after each graph step.
 
     :param request: The ChatRequest containing the user's message.
+    :param idempotency_key: client key of the submission.
     :param agent_container: The container for the restaurant agent.
-    :return: The ChatResponse containing the assistant's response.
+    :param redis_pool: redis connection pool.
+    :raises HTTPException: if another turn of the thread is running.
+    :return: The streamed chat events.
     """
-    config = {"configurable": {"thread_id": request.thread_id}}
-    input_data = {
-        "messages": [
-            {"role": "user", "content": request.message},
-        ],
-    }
-
-    result_stream = agent_container.run_graph(
-        input_data,
-        config=config,  # type: ignore
-        stream_mode="values",
+    turns = ChatTurns(agent_container, redis_pool)
+    input_data, config = turn_input(
+        request.thread_id,
+        request.message,
+        request.location,
+    )
+
+    if request.stream_mode == "events":
+        try:
+            turn = await turns.start(input_data, config, idempotency_key)
+        except BusyThreadError:
+            raise _busy_thread()
+        if turn.events is not None:
+            return ClosingStreamingResponse(
+                ndjson(turn.events),
+                media_type="application/x-ndjson",
+                streams=[turn.events],
+            )
+        return StreamingResponse(
+            turns.buffer.read_ndjson(
+                request.thread_id,
+                turn.position,  # type: ignore
+                turn.producer,
+            ),
+            media_type="application/x-ndjson",
+        )
+
+    try:
+        turn_id = await turns.acquire(request.thread_id)
+    except BusyThreadError:
+        raise _busy_thread()
+    result_stream = await turns.leased(
+        request.thread_id,
+        turn_id,
+        agent_container.run_graph(
+            input_data,
+            config=config,  # type: ignore
+            stream_mode="values",
+        ),
     )
 
     async def stream_results():
-        async for result in result_stream:
-            if isinstance(result, dict) and "messages" in result:
-                for message in result["messages"]:
-                    if hasattr(message, "content"):
-                        yield json.dumps({"content": message.content}).encode(
-                            "utf-8",
-                        ) + b"\n"
-            elif isinstance(result, str):
-                yield json.dumps({"content": result}).encode("utf-8") + b"\n"
-            else:
-                yield json.dumps({"content": str(result)}).encode("utf-8") + b"\n"
-
-    return StreamingResponse(stream_results(), media_type="application/json")
+        async with aclosing(result_stream):
+            async for result in result_stream:
+                if isinstance(result, dict) and "messages" in result:
+                    for message in result["messages"]:
+                        if hasattr(message, "content"):
+                            yield json_line({"content": message.content})
+                elif isinstance(result, str):
+                    yield json_line({"content": result})
+                else:
+                    yield json_line({"content": str(result)})
+
+    return ClosingStreamingResponse(
+        stream_results(),
+        media_type="application/json",
+        streams=[result_stream],
+    )
+
+
+@router.post("/chat/sse", dependencies=[Depends(admit_chat_request)])
+async def chat_with_restaurant_agent_sse(
+    request: ChatRequest,
+    last_event_id: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+    agent_container: RestaurantAgentContainer = Depends(get_restaurant_agent_container),
+    redis_pool: ConnectionPool = Depends(get_redis_pool),
+) -> StreamingResponse:
+    """
+    Endpoint for chatting with the restaurant agent over Server-Sent Events.
+
+    The events are the ones of ``/chat``, sent as SSE with the event ``type``
+    as the SSE event name. Every event has an id, and the events of a turn are
+    buffered in redis for ``chat_stream_ttl`` seconds. A client that lost the
+    connection sends the same request again with the ``Last-Event-ID`` header,
+    and gets the events after that id, without running the turn again.
+    Busy threads and ``Idempotency-Key`` are handled as in ``/chat``.
+
+    :param request: The ChatRequest containing the user's message.
+    :param last_event_id: id of the last event received before a disconnect.
+    :param idempotency_key: client key of the submission.
+    :param agent_container: The container for the restaurant agent.
+    :param redis_pool: redis connection pool for the event buffer.
+    :raises HTTPException: if the stream to resume is no longer buffered,
+        or another turn of the thread is running.
+    :return: The streamed chat events.
+    """
+    turns = ChatTurns(agent_container, redis_pool)
+    buffer = turns.buffer
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if last_event_id:
+        position = parse_event_id(last_event_id)
+        if position is None or not await buffer.exists(
+            request.thread_id,
+            position.turn_id,
+        ):
+            raise HTTPException(
+                status_code=410,
+                detail="The stream expired, send the message again without Last-Event-ID.",
+            )
+        return StreamingResponse(
+            buffer.read(request.thread_id, position),
+            media_type="text/event-stream",
+            headers=headers,
+        )
+
+    input_data, config = turn_input(
+        request.thread_id,
+        request.message,
+        request.location,
+    )
+    try:
+        turn = await turns.start(
+            input_data,
+            config,
+            idempotency_key,
+            buffered=True,
+        )
+    except BusyThreadError:
+        raise _busy_thread()
+    return StreamingResponse(
+        buffer.read(request.thread_id, turn.position, turn.producer),  # type: ignore
+        media_type="text/event-stream",
+        headers=headers,
+    )
+
+
+@router.websocket("/ws/{thread_id}")
+async def chat_with_restaurant_agent_websocket(
+    websocket: WebSocket,
+    thread_id: str,
+) -> None:
+    """
+    WebSocket for chatting with the restaurant agent, bound to one thread.
+
+    The client sends ``{"type": "message", "message": ..., "location": ...}``
+    frames, one turn at a time, and gets the events of ``/chat`` as JSON
+    text frames, each turn ending with ``done``. The server sends
+    ``{"type": "ping"}`` on idle sessions and expects ``{"type": "pong"}``;
+    clients may send pings too.
+
+    :param websocket: client websocket.
+    :param thread_id: thread of the conversation.
+    """
+    await websocket.accept()
+    await ChatSession(websocket, thread_id).serve()
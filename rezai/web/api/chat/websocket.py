@@ -0,0 +1,222 @@
+import asyncio
+import json
+import time
+import uuid
+from contextlib import nullcontext, suppress
+from typing import Any, AsyncContextManager, Optional, Union
+
+import anyio
+from fastapi import WebSocket, WebSocketDisconnect
+from loguru import logger
+from pydantic import BaseModel, ValidationError
+
+from rezai.agents.lease import ThreadLease
+from rezai.agents.restaurant_search_agent import RestaurantAgentContainer
+from rezai.db.dao.place_details_dao import PlaceDetailsDAO
+from rezai.db.dao.restaurant_dao import RestaurantDAO
+from rezai.services.admission import AdmissionRejected, chat_admission
+from rezai.services.valueserp.service import ValueSerpService
+from rezai.services.youcom.service import YouComService
+from rezai.settings import settings
+from rezai.web.api.chat.schema import (
+    ChatEvent,
+    ClientMessage,
+    ErrorEvent,
+    PingEvent,
+    PongEvent,
+)
+from rezai.web.api.chat.streaming import chat_events, turn_input
+from rezai.web.api.chat.turns import BUSY_THREAD_DETAIL
+
+OutgoingEvent = Union[ChatEvent, PingEvent, PongEvent]
+
+# Close code sent to clients that stop answering pings or reading events.
+CLOSE_GOING_AWAY = 1001
+
+
+class SlowConsumerError(Exception):
+    """The client did not read the events of the session in time."""
+
+
+class ChatSession:
+    """
+    Multi-turn chat over one WebSocket, bound to one thread.
+
+    Events go through a queue of ``chat_ws_send_queue`` events. When the
+    client reads slower than the agent produces, the turn waits for room
+    in the queue, and the session is closed after ``chat_ws_send_timeout``
+    seconds without room. Idle sessions get a ping every
+    ``chat_ws_ping_interval`` seconds and are closed when the client sends
+    nothing for two intervals.
+
+    :param websocket: accepted websocket.
+    :param thread_id: thread the session is bound to.
+    """
+
+    def __init__(self, websocket: WebSocket, thread_id: str) -> None:
+        self.websocket = websocket
+        self.thread_id = thread_id
+        self.outgoing: "asyncio.Queue[OutgoingEvent]" = asyncio.Queue(
+            maxsize=settings.chat_ws_send_queue,
+        )
+        self.last_seen = time.monotonic()
+        self.turn: "Optional[asyncio.Task[None]]" = None
+        self.cancel_scope: Optional[anyio.CancelScope] = None
+        self.closed = False
+        app = websocket.app
+        self.youcom_service = YouComService(
+            client=app.state.youcom_client,
+            redis_pool=app.state.redis_pool,
+        )
+
+    async def serve(self) -> None:
+        """Run the session until the client leaves or stops responding."""
+        try:
+            async with anyio.create_task_group() as task_group:
+                self.cancel_scope = task_group.cancel_scope
+                task_group.start_soon(self._send_loop)
+                task_group.start_soon(self._keepalive_loop)
+                await self._receive_loop()
+                task_group.cancel_scope.cancel()
+        finally:
+            if self.turn is not None:
+                self.turn.cancel()
+
+    async def send(self, event: OutgoingEvent) -> None:
+        """
+        Queue an event for the client.
+
+        :param event: event to send.
+        :raises SlowConsumerError: if the queue stays full too long,
+            the session is closed then.
+        """
+        try:
+            await asyncio.wait_for(
+                self.outgoing.put(event),
+                timeout=settings.chat_ws_send_timeout,
+            )
+        except asyncio.TimeoutError:
+            await self.close("the client is not reading")
+            raise SlowConsumerError()
+
+    async def close(self, reason: str) -> None:
+        """
+        Close the session.
+
+        :param reason: why, for the log.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        logger.info("Closing chat session of thread {}: {}", self.thread_id, reason)
+        with suppress(RuntimeError):
+            await self.websocket.close(CLOSE_GOING_AWAY)
+        if self.cancel_scope is not None:
+            self.cancel_scope.cancel()
+
+    async def _receive_loop(self) -> None:
+        while True:
+            try:
+                raw = await self.websocket.receive_text()
+            except WebSocketDisconnect:
+                return
+            self.last_seen = time.monotonic()
+            try:
+                await self._handle(raw)
+            except SlowConsumerError:
+                return
+
+    async def _handle(self, raw: str) -> None:
+        try:
+            frame: Any = json.loads(raw)
+        except ValueError:
+            frame = None
+        frame_type = frame.get("type") if isinstance(frame, dict) else None
+        if frame_type == "pong":
+            return
+        if frame_type == "ping":
+            await self.send(PongEvent())
+            return
+        try:
+            message = ClientMessage.model_validate(frame)
+        except ValidationError:
+            await self.send(ErrorEvent(detail="Expected a message, ping or pong."))
+            return
+        if self.turn is not None and not self.turn.done():
+            await self.send(ErrorEvent(detail="Wait for the current turn to finish."))
+            return
+        self.turn = asyncio.create_task(self._run_turn(message))
+
+    async def _run_turn(self, message: ClientMessage) -> None:
+        input_data, config = turn_input(
+            self.thread_id,
+            message.message,
+            message.location,
+        )
+        app = self.websocket.app
+        # Turns of this thread from other sessions or HTTP requests
+        # are not run concurrently with this one.
+        lease = ThreadLease(app.state.redis_pool)
+        turn_id = uuid.uuid4().hex
+        if await lease.acquire(self.thread_id, turn_id) is not None:
+            with suppress(SlowConsumerError):
+                await self.send(ErrorEvent(detail=BUSY_THREAD_DETAIL))
+            return
+        try:
+            async with lease.held(self.thread_id, turn_id):
+                async with self._admission():
+                    await self._run_leased_turn(input_data, config)
+        except AdmissionRejected as exc:
+            with suppress(SlowConsumerError):
+                await self.send(
+                    ErrorEvent(
+                        detail=f"The chat is busy, retry in {exc.retry_after}s.",
+                    ),
+                )
+
+    def _admission(self) -> AsyncContextManager[None]:
+        if not settings.admission_enabled:
+            return nullcontext()
+        return chat_admission.admit(redis_pool=self.websocket.app.state.redis_pool)
+
+    async def _run_leased_turn(self, input_data: Any, config: Any) -> None:
+        app = self.websocket.app
+        # One database session per turn, so no transaction stays open
+        # while the socket is idle.
+        async with app.state.db_session_factory() as session:
+            container = RestaurantAgentContainer(
+                graph=app.state.restaurant_agent,
+                valueserp_service=ValueSerpService(
+                    client=app.state.valueserp_client,
+                    redis_pool=app.state.redis_pool,
+                    place_details_dao=PlaceDetailsDAO(session),
+                    prefetcher=app.state.valueserp_prefetcher,
+                ),
+                youcom_service=self.youcom_service,
+                restaurant_dao=RestaurantDAO(session),
+                redis_pool=app.state.redis_pool,
+            )
+            events = container.stream_events(input_data, config)  # type: ignore
+            try:
+                async for event in chat_events(events, self.thread_id):
+                    await self.send(event)
+            except SlowConsumerError:
+                return
+            await session.commit()
+
+    async def _send_loop(self) -> None:
+        while True:
+            event: BaseModel = await self.outgoing.get()
+            await self.websocket.send_text(event.model_dump_json())
+
+    async def _keepalive_loop(self) -> None:
+        interval = settings.chat_ws_ping_interval
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self.last_seen > 2 * interval:
+                await self.close("no answer to pings")
+                return
+            try:
+                await self.send(PingEvent())
+            except SlowConsumerError:
+                return
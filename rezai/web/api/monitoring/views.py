@@ -1,5 +1,9 @@
+from typing import Any, Dict
+
 from fastapi import APIRouter
 
+from rezai.metrics import metrics
+
 router = APIRouter()
 
 
@@ -10,3 +14,13 @@ def health_check() -> None:
 
     It returns 200 if the project is healthy.
     """
+
+
+@router.get("/metrics")
+def get_metrics() -> Dict[str, Any]:
+    """
+    Returns metrics collected by the current worker.
+
+    :return: metrics grouped by type.
+    """
+    return metrics.snapshot()
@@ -1,7 +1,9 @@
 # rezai/web/api/valueserp/schema.py
-from typing import List
+from typing import Any, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from rezai.settings import settings
 
 
 class SearchPlacesRequest(BaseModel):
@@ -40,3 +42,16 @@ class PlaceDetails(BaseModel):
 
 class PlaceDetailsResponse(BaseModel):
     place_details: PlaceDetails
+
+
+class PlaceDetailsBatchRequest(BaseModel):
+    data_cids: List[str] = Field(
+        min_length=1,
+        max_length=settings.valueserp_batch_max_size,
+    )
+
+
+class PlaceDetailsBatchItem(BaseModel):
+    data_cid: str
+    place_details: Optional[Any] = None
+    error: Optional[str] = None
@@ -1,13 +1,22 @@
 # rezai/web/api/valueserp/views.py
+from typing import AsyncIterator
+
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from loguru import logger
 
+from rezai.services.http.client import describe_error
+from rezai.services.valueserp.dependency import get_valueserp_service
 from rezai.services.valueserp.service import ValueSerpService
 from rezai.web.api.valueserp.schema import (
+    PlaceDetailsBatchItem,
+    PlaceDetailsBatchRequest,
     PlaceDetailsRequest,
     PlaceDetailsResponse,
     SearchPlacesRequest,
     SearchPlacesResponse,
 )
+from rezai.web.responses import ModelResponse, model_line
 
 router = APIRouter()
 
@@ -15,39 +24,92 @@ router = APIRouter()
 @router.post("/search_places", response_model=SearchPlacesResponse)
 async def search_places(
     request: SearchPlacesRequest,
-    valueserp_service: ValueSerpService = Depends(),
-) -> SearchPlacesResponse:
+    valueserp_service: ValueSerpService = Depends(get_valueserp_service),
+) -> ModelResponse:
     """
     Search for places using the Valueserp API.
 
     This endpoint will return a list of places based on the query and location provided.
 
     :param request: SearchPlacesRequest
-    :param valueserp_service: ValueSerpService = Depends()
+    :param valueserp_service: ValueSerpService = Depends(get_valueserp_service)
 
-    :return: SearchPlacesResponse
+    :return: SearchPlacesResponse, encoded once without revalidation
     """
     search_results = await valueserp_service.search_places(
         request.query,
         request.location,
     )
-    return SearchPlacesResponse(places_results=search_results)
+    return ModelResponse(SearchPlacesResponse(places_results=search_results))
 
 
 @router.post("/place_details", response_model=PlaceDetailsResponse)
 async def get_place_details(
     request: PlaceDetailsRequest,
-    valueserp_service: ValueSerpService = Depends(),
-) -> PlaceDetailsResponse:
+    valueserp_service: ValueSerpService = Depends(get_valueserp_service),
+) -> ModelResponse:
     """
     Get place details using the Valueserp API.
 
     This endpoint will return the details of a place based on the data_cid provided.
 
     :param request: PlaceDetailsRequest
-    :param valueserp_service: ValueSerpService = Depends()
+    :param valueserp_service: ValueSerpService = Depends(get_valueserp_service)
 
-    :return: PlaceDetailsResponse
+    :return: PlaceDetailsResponse, encoded once without revalidation
     """
     place_details = await valueserp_service.get_place_details(request.data_cid)
-    return PlaceDetailsResponse(place_details=place_details)
+    return ModelResponse(PlaceDetailsResponse(place_details=place_details))
+
+
+@router.post(
+    "/place_details/batch",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "One PlaceDetailsBatchItem per line.",
+            "content": {
+                "application/x-ndjson": {
+                    "schema": PlaceDetailsBatchItem.model_json_schema(),
+                },
+            },
+        },
+    },
+)
+async def get_place_details_batch(
+    request: PlaceDetailsBatchRequest,
+    valueserp_service: ValueSerpService = Depends(get_valueserp_service),
+) -> StreamingResponse:
+    """
+    Get details for many places at once using the Valueserp API.
+
+    Places are fetched concurrently and streamed back as newline-delimited
+    JSON, one PlaceDetailsBatchItem per line, in the order they finish.
+    A failed place is reported in its item's error field, as the status
+    code or error type, and does not fail the rest of the batch.
+
+    :param request: PlaceDetailsBatchRequest
+    :param valueserp_service: ValueSerpService = Depends(get_valueserp_service)
+
+    :return: stream of PlaceDetailsBatchItem lines.
+    """
+
+    async def stream_items() -> AsyncIterator[bytes]:  # noqa: WPS430
+        async for result in valueserp_service.get_place_details_many(
+            request.data_cids,
+        ):
+            error = None
+            if result.error is not None:
+                logger.opt(exception=result.error).warning(
+                    "Place details of {} failed",
+                    result.data_cid,
+                )
+                error = describe_error(result.error)
+            item = PlaceDetailsBatchItem(
+                data_cid=result.data_cid,
+                place_details=result.place_details,
+                error=error,
+            )
+            yield model_line(item)
+
+    return StreamingResponse(stream_items(), media_type="application/x-ndjson")
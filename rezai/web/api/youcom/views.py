@@ -1,6 +1,7 @@
 # rezai/web/api/youcom/views.py
 from fastapi import APIRouter, Depends
 
+from rezai.services.youcom.dependency import get_youcom_service
 from rezai.services.youcom.service import YouComService
 from rezai.web.api.youcom.schema import (
     GetAISnippetsRequest,
@@ -15,7 +16,7 @@ router = APIRouter()
 @router.post("/query_web_llm", response_model=QueryWebLLMResponse)
 async def query_web_llm(
     request: QueryWebLLMRequest,
-    youcom_service: YouComService = Depends(),
+    youcom_service: YouComService = Depends(get_youcom_service),
 ) -> QueryWebLLMResponse:
     """
     Query the web using the You.com API.
@@ -23,7 +24,7 @@ async def query_web_llm(
     This endpoint will return the results of querying the web using the provided query.
 
     :param request: QueryWebLLMRequest
-    :param youcom_service: YouComService = Depends()
+    :param youcom_service: YouComService = Depends(get_youcom_service)
 
     :return: QueryWebLLMResponse
     """
@@ -34,7 +35,7 @@ async def query_web_llm(
 @router.post("/get_ai_snippets", response_model=GetAISnippetsResponse)
 async def get_ai_snippets(
     request: GetAISnippetsRequest,
-    youcom_service: YouComService = Depends(),
+    youcom_service: YouComService = Depends(get_youcom_service),
 ) -> GetAISnippetsResponse:
     """
     Get AI-generated snippets using the You.com API.
@@ -42,7 +43,7 @@ async def get_ai_snippets(
     This endpoint will return AI-generated snippets based on the provided query.
 
     :param request: GetAISnippetsRequest
-    :param youcom_service: YouComService = Depends()
+    :param youcom_service: YouComService = Depends(get_youcom_service)
 
     :return: GetAISnippetsResponse
     """
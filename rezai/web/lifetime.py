@@ -3,7 +3,10 @@ from typing import Awaitable, Callable
 from fastapi import FastAPI
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
+from rezai.agents.lifetime import init_restaurant_agent
 from rezai.services.redis.lifetime import init_redis, shutdown_redis
+from rezai.services.valueserp.lifetime import init_valueserp, shutdown_valueserp
+from rezai.services.youcom.lifetime import init_youcom, shutdown_youcom
 from rezai.settings import settings
 
 
@@ -44,6 +47,9 @@ def register_startup_event(
         app.middleware_stack = None
         _setup_db(app)
         init_redis(app)
+        init_valueserp(app)
+        init_youcom(app)
+        init_restaurant_agent(app)
         app.middleware_stack = app.build_middleware_stack()
         pass  # noqa: WPS420
 
@@ -62,6 +68,10 @@ def register_shutdown_event(
 
     @app.on_event("shutdown")
     async def _shutdown() -> None:  # noqa: WPS430
+        # Prefetches of ValueSerp hold database sessions and redis
+        # connections, they are cancelled before those are torn down.
+        await shutdown_valueserp(app)
+        await shutdown_youcom(app)
         await app.state.db_engine.dispose()
 
         await shutdown_redis(app)
@@ -0,0 +1,61 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+
+class ModelResponse(Response):
+    """
+    JSON response of models the route built and validated itself.
+
+    FastAPI dumps a returned model to a dict, validates it again against
+    the route's response_model and then serializes it. Returning this
+    response encodes the models once instead, the response_model still
+    documents the route.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        """
+        Encode models, or lists and dicts of them.
+
+        :param content: response content.
+        :return: JSON body.
+        """
+        return to_json(content)
+
+
+def model_json(model: BaseModel) -> bytes:
+    """
+    Encode a model as JSON.
+
+    The model's serializer writes bytes directly,
+    without the str round trip of ``model_dump_json``.
+
+    :param model: model to encode.
+    :return: JSON document.
+    """
+    return model.__pydantic_serializer__.to_json(model)
+
+
+def model_line(model: BaseModel) -> bytes:
+    """
+    Encode a model as one NDJSON line.
+
+    :param model: model to encode.
+    :return: JSON line.
+    """
+    return model_json(model) + b"\n"
+
+
+def json_line(payload: Any) -> bytes:
+    """
+    Encode plain JSON data as one NDJSON line.
+
+    :param payload: dicts, lists and scalars.
+    :return: JSON line.
+    """
+    return orjson.dumps(payload, option=orjson.OPT_APPEND_NEWLINE)